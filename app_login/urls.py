@@ -1,5 +1,9 @@
 from django.urls import path
-from .views import login_view, logout_view
+
+from logic.lazy import lazy_view
+
+login_view = lazy_view('app_login.views.login_view')
+logout_view = lazy_view('app_login.views.logout_view')
 
 app_name = 'login'
 
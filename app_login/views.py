@@ -13,8 +13,8 @@ def login_view(request):
         user = authenticate(username=data["username"], password=data["password"])
         if user:
             login(request, user)
-            add_user_to_cart(request, user.username)
-            add_user_to_wishlist(request, user.username)
+            add_user_to_cart(user.username)
+            add_user_to_wishlist(user.username)
             return redirect("/")
         return render(request, "login/login.html", context={"error": "Неверные данные"})
 
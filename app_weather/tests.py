@@ -1,3 +1,32 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from logic import cache, ratelimit
+from logic.ratelimit import MemoryStore
+
+WEATHER = {'location': {'name': 'Saint Petersburg'},
+           'current': {'last_updated': '2024-01-01 12:00', 'temp_c': -5, 'feelslike_c': -9, 'pressure_mb': 1013,
+                       'humidity': 80, 'wind_kph': 18, 'gust_kph': 36, 'wind_dir': 'N'}}
+
+
+@override_settings(RATELIMIT_ENABLED=True, METRICS_ENABLED=False,
+                   RATELIMIT_RULES={'weather_upstream': {'scope': 'global', 'rate': 0.001, 'burst': 1}})
+class WeatherUpstreamLimitTests(SimpleTestCase):
+    """Квота сервиса погоды расходуется только запросами, которые до него доходят (промахами кеша)."""
+
+    def setUp(self):
+        cache.invalidate('weather')
+        patcher = mock.patch.object(ratelimit, '_store', MemoryStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cache_hits_are_not_charged(self):
+        with mock.patch('requests.get', return_value=mock.Mock(status_code=200, json=lambda: WEATHER)) as get:
+            for _ in range(3):  # Один промах кеша и два попадания
+                response = self.client.get('/weather/', {'lat': 59.93, 'lon': 30.31})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['city'], 'Saint Petersburg')
+            # Другая точка - промах кеша сверх квоты
+            self.assertEqual(self.client.get('/weather/', {'lat': 55.75, 'lon': 37.62}).status_code, 429)
+        self.assertEqual(get.call_count, 1)
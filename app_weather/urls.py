@@ -1,5 +1,8 @@
 from django.urls import path
-from .views import my_view
+
+from logic.lazy import lazy_view
+
+my_view = lazy_view('app_weather.views.my_view')  # Модуль тянет за собой requests
 
 
 urlpatterns = [
@@ -1,12 +1,26 @@
 from django.shortcuts import render
 from django.http import HttpResponse
 from datetime import datetime
-import requests
-from django.http import JsonResponse
+from logic.http import JsonResponse
+from logic import cache, metrics, ratelimit
 from .models import DIRECTION_TRANSFORM
 
 
 def current_weather(lat, lon):
+    """
+    Текущая погода в точке. Ответы кешируются на settings.CACHE_TIMEOUTS['weather'] секунд с точностью
+    координат до 0.01 градуса (около 1 км); внешний сервис для одной точки запрашивает только один запрос,
+    остальные ждут его результата.
+
+    :param lat: Широта.
+    :param lon: Долгота.
+    :return: Словарь с данными о погоде.
+    """
+    lat, lon = round(float(lat), 2), round(float(lon), 2)
+    return cache.get_or_set('weather', (lat, lon), lambda: fetch_weather(lat, lon), lock=True)
+
+
+def fetch_weather(lat, lon):
     """
     Описание функции, входных и выходных переменных
     """
@@ -14,7 +28,15 @@ def current_weather(lat, lon):
     url = f"https://api.weatherapi.com/v1/current.json?key={token}&q={lat},{lon}"  # Запрос на https://api.weatherapi.com
     # headers = {"X-Yandex-API-Key": f"{token}"}
     # response = requests.get(url, headers=headers)
-    response = requests.get(url)
+    import requests  # Импорт при первом запросе погоды: requests заметно замедляет запуск процесса
+    started = metrics.clock()
+    try:
+        with ratelimit.limit('weather_upstream'):  # Квота сервиса - только на реальные обращения к нему
+            response = requests.get(url)
+    except requests.RequestException:
+        metrics.upstream('weatherapi', 'error', started)
+        raise
+    metrics.upstream('weatherapi', response.status_code, started)
     data = response.json()
 
     result = {
@@ -40,5 +62,8 @@ def my_view(request):
         if lat is None or lon is None:
             lat, lon = 59.93, 30.31
 
-        data = current_weather(lat, lon)
-        return JsonResponse(data, json_dumps_params={'ensure_ascii': False, 'indent': 4})
+        try:
+            data = current_weather(lat, lon)
+        except ratelimit.RateLimited as exc:  # Квота сервиса погоды исчерпана
+            return exc.response
+        return JsonResponse(data)
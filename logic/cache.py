@@ -0,0 +1,181 @@
+"""
+Кеш приложения поверх django.core.cache: пространства имён, версионированные ключи и защита от
+одновременного пересчёта одного ключа многими запросами (cache stampede).
+
+Пространства имён (NAMESPACES) и срок хранения записей по умолчанию (settings.CACHE_TIMEOUTS):
+    - catalog - данные, производные от каталога (ключ включает версию каталога);
+    - weather - ответы сервиса погоды;
+    - fragments - отрисованные фрагменты шаблонов (тег {% fragment_cache %} из store_cache);
+    - pricing - расчёты цен и доставки (таблицы правил и стоимость корзины сейчас дешевле держать в памяти
+      процесса, см. store.pricing_rules и logic.services._price_cart).
+
+Полный ключ записи: "<пространство>:<формат>.<поколение>:<ключ>". Формат - номер в NAMESPACES, его нужно
+увеличить при изменении структуры хранимых значений. Поколение хранится в самом кеше и увеличивается
+invalidate(): все процессы, работающие с общим кешем, одновременно перестают видеть старые записи,
+а сами записи удаляются по истечении срока.
+
+get_or_set защищает дорогие ключи двумя способами:
+    - раннее обновление (XFetch): незадолго до истечения срока запись с вероятностью, растущей по мере
+      приближения срока и пропорциональной времени вычисления, пересчитывается одним запросом,
+      остальные продолжают получать текущее значение;
+    - блокировка (lock=True): если значения нет, вычисляет только получивший блокировку (атомарный cache.add),
+      остальные ждут результата до settings.CACHE_LOCK_TIMEOUT секунд, а затем вычисляют сами.
+Блокировка работает между процессами на бэкендах с атомарным add: SQLite (logic.sqlite_cache) и Redis;
+на locmem - между потоками одного процесса.
+"""
+import hashlib
+import math
+import random
+import time
+from typing import Any, Callable
+
+from django.conf import settings
+from django.core.cache import caches
+
+from logic import metrics
+
+NAMESPACES = {'catalog': 1, 'weather': 1, 'fragments': 1, 'pricing': 1}
+MAX_KEY_LENGTH = 200  # Более длинные ключи и ключи не из ASCII заменяются хешем
+LOCK_POLL_INTERVAL = 0.05  # Период проверки результата при ожидании блокировки, с
+
+
+def _cache():
+    return caches[settings.APP_CACHE_ALIAS]
+
+
+def _count(namespace: str, result: str) -> None:
+    if settings.METRICS_ENABLED:
+        metrics.inc('cache_requests_total', (('namespace', namespace), ('result', result)))
+
+
+def _generation(namespace: str) -> int:
+    """Текущее поколение пространства имён."""
+    cache = _cache()
+    key = f'{namespace}:generation'
+    if (generation := cache.get(key)) is None:
+        cache.add(key, 1, None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def make_key(namespace: str, key: Any) -> str:
+    """
+    Полный ключ записи в кеше.
+
+    :param namespace: Пространство имён из NAMESPACES.
+    :param key: Ключ внутри пространства (строка или кортеж значений).
+    :return: Строка вида "weather:1.3:59.93,30.31".
+    """
+    if namespace not in NAMESPACES:
+        raise ValueError(f"Неизвестное пространство имён кеша: {namespace}")
+    key = ':'.join(map(str, key)) if isinstance(key, tuple) else str(key)
+    if len(key) > MAX_KEY_LENGTH or not key.isascii() or any(char.isspace() for char in key):
+        key = hashlib.sha1(key.encode()).hexdigest()  # Django предупреждает о ключах, недопустимых в memcached
+    return f'{namespace}:{NAMESPACES[namespace]}.{_generation(namespace)}:{key}'
+
+
+def get(namespace: str, key: Any, default: Any = None) -> Any:
+    """
+    Значение из кеша.
+
+    :param namespace: Пространство имён.
+    :param key: Ключ внутри пространства.
+    :param default: Значение, если записи нет.
+    :return: Сохранённое значение или default.
+    """
+    entry = _cache().get(make_key(namespace, key))
+    _count(namespace, 'miss' if entry is None else 'hit')
+    return default if entry is None else entry[0]
+
+
+def set_value(namespace: str, key: Any, value: Any, timeout: float | None = None) -> None:
+    """
+    Сохраняет значение в кеш.
+
+    :param namespace: Пространство имён.
+    :param key: Ключ внутри пространства.
+    :param value: Значение (должно сериализоваться pickle).
+    :param timeout: Срок хранения в секундах, по умолчанию settings.CACHE_TIMEOUTS[namespace].
+    """
+    _store(make_key(namespace, key), value, _timeout(namespace, timeout), 0.0)
+
+
+def delete(namespace: str, key: Any) -> None:
+    """Удаляет запись из кеша."""
+    _cache().delete(make_key(namespace, key))
+
+
+def invalidate(namespace: str) -> None:
+    """Делает недействительными все записи пространства имён во всех процессах, использующих кеш."""
+    cache = _cache()
+    key = f'{namespace}:generation'
+    try:
+        cache.incr(key)
+    except ValueError:  # Поколение ещё не заводилось или вытеснено
+        cache.add(key, 1, None)  # add, а не set: одновременное увеличение из другого процесса не затирается
+        cache.incr(key)
+
+
+def _timeout(namespace: str, timeout: float | None) -> float:
+    return settings.CACHE_TIMEOUTS[namespace] if timeout is None else timeout
+
+
+def _store(full_key: str, value: Any, timeout: float, delta: float) -> None:
+    # Вместе со значением хранятся момент истечения и время вычисления - для раннего обновления
+    _cache().set(full_key, (value, time.time() + timeout, delta), timeout)
+
+
+def get_or_set(namespace: str, key: Any, compute: Callable[[], Any], timeout: float | None = None,
+               lock: bool = False, beta: float = 1.0) -> Any:
+    """
+    Значение из кеша, а при его отсутствии - результат compute(), который сохраняется в кеш.
+
+    :param namespace: Пространство имён.
+    :param key: Ключ внутри пространства.
+    :param compute: Функция без аргументов, вычисляющая значение.
+    :param timeout: Срок хранения в секундах, по умолчанию settings.CACHE_TIMEOUTS[namespace].
+    :param lock: Вычислять отсутствующее значение только в одном запросе (для дорогих ключей).
+    :param beta: Множитель раннего обновления: больше - раньше, 0 - без раннего обновления.
+    :return: Значение.
+    """
+    cache = _cache()
+    timeout = _timeout(namespace, timeout)
+    full_key = make_key(namespace, key)
+    lock_key = f'{full_key}:lock'
+
+    entry = cache.get(full_key)
+    if entry is not None:
+        value, expires, delta = entry
+        # XFetch: -log(U) при U из (0, 1] - экспоненциально распределённый запас времени
+        if time.time() - delta * beta * math.log(1.0 - random.random()) < expires:
+            _count(namespace, 'hit')
+            return value
+        if lock and not cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT):
+            _count(namespace, 'hit')  # Значение уже обновляет другой запрос
+            return value
+        _count(namespace, 'early')
+        return _compute(full_key, lock_key if lock else None, compute, timeout)
+
+    _count(namespace, 'miss')
+    if not lock:
+        return _compute(full_key, None, compute, timeout)
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while not cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:  # Получивший блокировку не успел: вычисляем сами
+            return _compute(full_key, None, compute, timeout)
+        time.sleep(LOCK_POLL_INTERVAL)
+        if (entry := cache.get(full_key)) is not None:
+            return entry[0]
+    return _compute(full_key, lock_key, compute, timeout)
+
+
+def _compute(full_key: str, lock_key: str | None, compute: Callable[[], Any], timeout: float) -> Any:
+    """Вычисляет и сохраняет значение, снимая блокировку lock_key, если она была получена."""
+    try:
+        started = time.perf_counter()
+        value = compute()
+        _store(full_key, value, timeout, time.perf_counter() - started)
+        return value
+    finally:
+        if lock_key is not None:
+            _cache().delete(lock_key)
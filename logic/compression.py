@@ -0,0 +1,85 @@
+"""
+Сжатие ответов HTML и JSON.
+
+CompressionMiddleware расширяет django.middleware.gzip.GZipMiddleware:
+    - сжимаются только ответы типов settings.COMPRESSION_TYPES (картинки и архивы уже сжаты)
+      размером от settings.COMPRESSION_MIN_SIZE байт - для коротких ответов заголовки дороже выигрыша;
+    - если установлен пакет brotli и клиент его принимает (Accept-Encoding: br), ответ сжимается brotli
+      с качеством settings.COMPRESSION_BROTLI_QUALITY (на тексте обычно заметно меньше gzip при той же скорости).
+Страницы, в которые выведен токен CSRF, и потоковые ответы сжимаются только gzip: GZipMiddleware добавляет
+в заголовок gzip случайное число байт, что затрудняет атаку BREACH на токен; у brotli такой защиты нет.
+Промежуточный слой стоит снаружи CsrfViewMiddleware, который к этому моменту уже сбросил флаг
+CSRF_COOKIE_NEEDS_UPDATE, поэтому выведенный токен распознаётся по ответу (см. has_csrf_token).
+
+Промежуточный слой подключается, если settings.COMPRESSION_ENABLED; его стоит выключить, если ответы
+сжимает обратный прокси.
+"""
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import has_vary_header, patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # Необязательная зависимость: без неё ответы сжимаются gzip
+    brotli = None
+
+re_accepts_br = _lazy_re_compile(r'\bbr\b')
+
+
+def compressible(response) -> bool:
+    """
+    Проверяет, стоит ли сжимать ответ: тип из settings.COMPRESSION_TYPES, достаточный размер, ещё не сжат.
+
+    :param response: Объект ответа.
+    :return: True, если ответ нужно сжать.
+    """
+    content_type = response.get('Content-Type', '').split(';', 1)[0].strip()
+    if content_type not in settings.COMPRESSION_TYPES or response.has_header('Content-Encoding'):
+        return False
+    return response.streaming or len(response.content) >= settings.COMPRESSION_MIN_SIZE
+
+
+def has_csrf_token(request, response) -> bool:
+    """
+    Проверяет, мог ли в ответ попасть токен CSRF: при вызове get_token CsrfViewMiddleware ставит cookie
+    токена (при settings.CSRF_USE_SESSIONS - сохраняет его в сессии, тогда ответ получает Vary: Cookie).
+
+    :param request: Объект запроса.
+    :param response: Объект ответа.
+    :return: True, если ответ нельзя сжимать brotli.
+    """
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):  # Слой подключён внутри CsrfViewMiddleware
+        return True
+    if settings.CSRF_USE_SESSIONS:
+        return has_vary_header(response, 'Cookie')
+    return settings.CSRF_COOKIE_NAME in response.cookies
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Промежуточный слой сжатия ответов brotli или gzip (см. описание модуля)."""
+
+    def __init__(self, get_response):
+        if not settings.COMPRESSION_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_response(self, request, response):
+        if not compressible(response):
+            return response
+        if (brotli is None or response.streaming or has_csrf_token(request, response)
+                or not re_accepts_br.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed = brotli.compress(response.content, mode=brotli.MODE_TEXT,
+                                     quality=settings.COMPRESSION_BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        if (etag := response.get('ETag')) and etag.startswith('"'):  # Как в GZipMiddleware: сжатый ответ - другие байты
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
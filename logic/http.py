@@ -0,0 +1,54 @@
+"""
+Ответы JSON проекта.
+
+JsonResponse - замена django.http.JsonResponse с компактным выводом: без отступов и пробелов после
+разделителей, кириллица без \\u-экранирования (ответ в UTF-8). Кодировщик выбирается settings.JSON_ENCODER:
+'orjson' - пакет orjson, если он установлен (в несколько раз быстрее стандартного), иначе стандартный json;
+'json' - всегда стандартный json. Типы, которые orjson не сериализует сам (Decimal, ленивые строки и т.п.),
+передаются в DjangoJSONEncoder, поэтому ответы обоих кодировщиков совпадают по содержанию.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.http import JsonResponse as DjangoJsonResponse
+
+try:
+    import orjson
+except ImportError:  # Необязательная зависимость
+    orjson = None
+
+# Ключи не строками - как у json; даты передаются DjangoJSONEncoder - тот же формат, что у стандартного json
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+
+def dumps(data, encoder: type[json.JSONEncoder] = DjangoJSONEncoder, json_dumps_params: dict | None = None) -> bytes:
+    """
+    Сериализует данные в компактный JSON.
+
+    :param data: Данные.
+    :param encoder: Класс кодировщика для типов, не поддерживаемых JSON напрямую.
+    :param json_dumps_params: Параметры json.dumps (например, indent). С ними всегда используется стандартный json.
+    :return: JSON в UTF-8.
+    """
+    if orjson is not None and settings.JSON_ENCODER == 'orjson' and not json_dumps_params:
+        try:
+            return orjson.dumps(data, default=encoder().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:  # Например, целые числа больше 64 бит - их записывает стандартный json
+            pass
+    params = {'ensure_ascii': False, 'separators': (',', ':'), **(json_dumps_params or {})}
+    return json.dumps(data, cls=encoder, **params).encode()
+
+
+class JsonResponse(DjangoJsonResponse):
+    """
+    Ответ JSON с компактным выводом и быстрым кодировщиком (см. описание модуля).
+    Параметры те же, что у django.http.JsonResponse.
+    """
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, json_dumps_params=None, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError("In order to allow non-dict objects to be serialized set the safe parameter to False.")
+        kwargs.setdefault('content_type', 'application/json')
+        HttpResponse.__init__(self, content=dumps(data, encoder, json_dumps_params), **kwargs)
@@ -0,0 +1,52 @@
+"""
+Отложенный импорт представлений.
+
+URLconf загружается при запуске процесса, а модули представлений тянут за собой логику хранилища,
+каталога и сторонние пакеты. lazy_view подставляет в path() обёртку, которая импортирует модуль
+представления при первом запросе к нему, поэтому холодный запуск точки входа не платит за импорт
+представлений, которые процессу могут и не понадобиться. Прогрев (logic.warmup) загружает их заранее.
+"""
+from functools import cache
+
+from django.utils.module_loading import import_string
+
+
+def lazy_view(dotted_path: str, is_async: bool = False):
+    """
+    Представление, модуль которого импортируется при первом вызове.
+
+    :param dotted_path: Путь к представлению, например 'store.views.cart_view'.
+    :param is_async: Асинхронное представление: обёртка должна быть корутинной функцией,
+                     иначе Django вызовет её как синхронную.
+    :return: Функция-представление с методом load(), возвращающим настоящее представление.
+    """
+    load = cache(lambda: import_string(dotted_path))
+
+    if is_async:
+        async def view(request, *args, **kwargs):
+            return await load()(request, *args, **kwargs)
+    else:
+        def view(request, *args, **kwargs):
+            return load()(request, *args, **kwargs)
+
+    view.__name__ = view.__qualname__ = dotted_path.rpartition('.')[2]
+    view.__module__ = dotted_path.rpartition('.')[0]
+    view.load = load
+    return view
+
+
+def load_views(patterns) -> int:
+    """
+    Импортирует модули всех отложенных представлений URLconf.
+
+    :param patterns: Шаблоны URL (get_resolver().url_patterns), вложенные include() обходятся рекурсивно.
+    :return: Количество загруженных представлений.
+    """
+    count = 0
+    for pattern in patterns:
+        if hasattr(pattern, 'url_patterns'):
+            count += load_views(pattern.url_patterns)
+        elif (load := getattr(pattern.callback, 'load', None)) is not None:
+            load()
+            count += 1
+    return count
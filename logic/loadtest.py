@@ -0,0 +1,279 @@
+"""
+Простой генератор нагрузки для сравнения режимов запуска сервера.
+
+Клиент на asyncio держит постоянные соединения HTTP/1.1 (keep-alive): каждое из concurrency соединений
+последовательно отправляет запросы, пока не выполнено заданное количество запросов или не истекло время.
+Внешние библиотеки не нужны, поэтому нагрузку можно подавать с той же машины, где запущен сервер.
+
+replay воспроизводит журнал запросов (logic.request_log): запросы отправляются в исходном темпе (или ускоренном
+в speed раз) не более чем по concurrency соединениям. Если все соединения заняты, запросы ждут в очереди,
+и опоздание отправки относительно расписания показывает, что сервер не справляется с исходной нагрузкой.
+"""
+import asyncio
+import json
+import math
+import time
+from dataclasses import dataclass, field
+from urllib.parse import quote, urlsplit
+
+
+@dataclass
+class LoadResult:
+    """Результат прогона нагрузки по одному адресу."""
+    url: str
+    concurrency: int
+    elapsed: float = 0.0  # Длительность прогона в секундах
+    latencies: list[float] = field(default_factory=list)  # Время ответа успешных запросов в секундах
+    statuses: dict[int, int] = field(default_factory=dict)  # Код ответа -> количество
+    errors: int = 0  # Ошибки соединения и разбора ответа
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def rps(self) -> float:
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, p: float) -> float:
+        """
+        Перцентиль времени ответа (метод ближайшего ранга).
+
+        :param p: Перцентиль от 0 до 100.
+        :return: Время ответа в миллисекундах.
+        """
+        return percentile(self.latencies, p) * 1000
+
+    def summary(self) -> dict:
+        """
+        Сводка прогона.
+
+        :return: Словарь с количеством запросов, RPS, перцентилями (мс), кодами ответов и ошибками.
+        """
+        return {'url': self.url, 'concurrency': self.concurrency, 'requests': self.requests,
+                'rps': round(self.rps, 1),
+                'p50': round(self.percentile(50), 2), 'p90': round(self.percentile(90), 2),
+                'p99': round(self.percentile(99), 2), 'max': round(self.percentile(100), 2),
+                'statuses': dict(sorted(self.statuses.items())), 'errors': self.errors}
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Перцентиль по методу ближайшего ранга.
+
+    :param values: Значения.
+    :param p: Перцентиль от 0 до 100.
+    :return: Значение перцентиля, 0 для пустого списка.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+async def _read_response(reader: asyncio.StreamReader, head: bool = False) -> tuple[int, bool]:
+    """
+    Читает ответ HTTP/1.1 целиком (Content-Length или chunked).
+
+    :param reader: Поток чтения соединения.
+    :param head: Ответ на запрос HEAD - без тела.
+    :return: (код ответа, можно ли переиспользовать соединение)
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Сервер закрыл соединение")
+    status = int(status_line.split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if head or status in (204, 304):  # Ответ без тела
+        return status, headers.get('connection', '').lower() != 'close'
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)  # Данные блока и завершающий \r\n
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:  # Тело до закрытия соединения
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+def _build_request(method: str, host: str, path: str, query: str, headers: dict) -> bytes:
+    """Запрос HTTP/1.1 без тела."""
+    target = quote((path or '/') + (f'?{query}' if query else ''), safe="/?&=%:+,;@")
+    return (f"{method} {target} HTTP/1.1\r\nHost: {host}\r\n"
+            + ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+            + "\r\n").encode('latin-1')
+
+
+async def _worker(url: str, headers: dict, result: LoadResult, budget: list, deadline: float | None) -> None:
+    """Одно соединение: отправляет запросы последовательно, пока есть бюджет запросов и время."""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    request = _build_request('GET', parts.netloc, parts.path, parts.query, headers)
+    writer = None
+    while deadline is None or time.perf_counter() < deadline:
+        if budget[0] <= 0:
+            break
+        budget[0] -= 1
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, port,
+                                                               ssl=parts.scheme == 'https' or None)
+            started = time.perf_counter()
+            writer.write(request)
+            status, keep_alive = await _read_response(reader)
+            result.latencies.append(time.perf_counter() - started)
+            result.statuses[status] = result.statuses.get(status, 0) + 1
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            result.errors += 1
+            keep_alive = False
+        if not keep_alive and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(url: str, concurrency: int = 10, requests: int | None = 1000,
+                   duration: float | None = None, headers: dict | None = None) -> LoadResult:
+    """
+    Подаёт нагрузку на адрес.
+
+    :param url: Адрес вида http://host:port/path?query.
+    :param concurrency: Количество одновременных соединений.
+    :param requests: [Опционально] Общее количество запросов.
+    :param duration: [Опционально] Длительность прогона в секундах.
+    :param headers: [Опционально] Дополнительные заголовки (например, Cookie).
+    :return: LoadResult.
+    """
+    result = LoadResult(url, concurrency)
+    budget = [requests if requests is not None else math.inf]
+    started = time.perf_counter()
+    deadline = started + duration if duration else None
+    await asyncio.gather(*(_worker(url, headers or {}, result, budget, deadline) for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+@dataclass
+class ReplayResult:
+    """Результат воспроизведения журнала запросов."""
+    concurrency: int
+    speed: float
+    routes: dict[str, LoadResult] = field(default_factory=dict)  # Маршрут -> результат его запросов
+    recorded: dict[str, list[float]] = field(default_factory=dict)  # Маршрут -> время обработки по журналу, с
+    lags: list[float] = field(default_factory=list)  # Опоздание отправки относительно расписания, с
+    elapsed: float = 0.0  # Длительность воспроизведения в секундах
+    span: float = 0.0  # Длительность журнала в секундах
+
+    def total(self) -> LoadResult:
+        """Результат по всем маршрутам вместе."""
+        total = LoadResult('*', self.concurrency, self.elapsed)
+        for result in self.routes.values():
+            total.latencies.extend(result.latencies)
+            total.errors += result.errors
+            for status, count in result.statuses.items():
+                total.statuses[status] = total.statuses.get(status, 0) + count
+        return total
+
+
+def read_log(path, methods: tuple = ('GET', 'HEAD'), limit: int | None = None) -> tuple[list[dict], int]:
+    """
+    Читает журнал запросов.
+
+    :param path: Путь к файлу JSON Lines (settings.REQUEST_LOG_PATH).
+    :param methods: Воспроизводимые методы: тела запросов в журнал не пишутся.
+    :param limit: [Опционально] Сколько первых по времени запросов взять.
+    :return: (записи по возрастанию времени, количество пропущенных строк - другие методы и неполные строки).
+    """
+    entries, skipped = [], 0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:  # Например, строка, которую процесс не дописал при аварийном завершении
+                skipped += 1
+                continue
+            if entry.get('method') in methods:
+                entries.append(entry)
+            else:
+                skipped += 1
+    entries.sort(key=lambda entry: entry['ts'])  # Процессы записывают свои буферы в файл по очереди
+    return entries[:limit] if limit is not None else entries, skipped
+
+
+async def _replay_worker(parts, queue: asyncio.Queue, result: ReplayResult, headers: dict,
+                         user_headers: dict) -> None:
+    """Одно соединение: берёт запросы из очереди и отправляет их последовательно."""
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    prefix = parts.path.rstrip('/')
+    writer = None
+    while (item := await queue.get()) is not None:
+        due, entry = item
+        route = entry.get('route') or entry['path']
+        routes = result.routes.setdefault(route, LoadResult(route, result.concurrency))
+        request = _build_request(entry['method'], parts.netloc, prefix + entry['path'], entry.get('query', ''),
+                                 {**headers, **user_headers.get(str(entry.get('user')), {})})
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, port,
+                                                               ssl=parts.scheme == 'https' or None)
+            started = time.perf_counter()
+            result.lags.append(max(started - due, 0.0))
+            writer.write(request)
+            status, keep_alive = await _read_response(reader, head=entry['method'] == 'HEAD')
+            routes.latencies.append(time.perf_counter() - started)
+            routes.statuses[status] = routes.statuses.get(status, 0) + 1
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            routes.errors += 1
+            keep_alive = False
+        if not keep_alive and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def replay(base_url: str, entries: list[dict], concurrency: int = 10, speed: float = 1.0,
+                 headers: dict | None = None, user_headers: dict | None = None) -> ReplayResult:
+    """
+    Воспроизводит журнал запросов на сервере.
+
+    :param base_url: Адрес сервера вида http://host:port (путь, если есть, добавляется перед путями журнала).
+    :param entries: Записи журнала по возрастанию времени (read_log).
+    :param concurrency: Количество одновременных соединений.
+    :param speed: Ускорение относительно исходного темпа: 1 - как в журнале, 2 - вдвое быстрее,
+                  0 - без пауз, так быстро, как отвечает сервер.
+    :param headers: [Опционально] Дополнительные заголовки всех запросов (например, Cookie).
+    :param user_headers: [Опционально] Заголовки запросов пользователей журнала: {id пользователя: {...}}.
+    :return: ReplayResult.
+    """
+    result = ReplayResult(concurrency, speed)
+    for entry in entries:
+        route = entry.get('route') or entry['path']
+        result.recorded.setdefault(route, []).append(entry.get('duration_ms', 0) / 1000)
+    if entries:
+        result.span = entries[-1]['ts'] - entries[0]['ts']
+    parts = urlsplit(base_url)
+    queue = asyncio.Queue(maxsize=concurrency)  # Запросы сверх занятых соединений ждут у расписания
+    workers = [asyncio.create_task(_replay_worker(parts, queue, result, headers or {}, user_headers or {}))
+               for _ in range(concurrency)]
+    started = time.perf_counter()
+    for entry in entries:
+        due = started + ((entry['ts'] - entries[0]['ts']) / speed if speed else 0)
+        if (delay := due - time.perf_counter()) > 0:
+            await asyncio.sleep(delay)
+        await queue.put((due, entry))
+    for _ in workers:
+        await queue.put(None)
+    await asyncio.gather(*workers)
+    result.elapsed = time.perf_counter() - started
+    return result
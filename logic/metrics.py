@@ -0,0 +1,295 @@
+"""
+Метрики процесса в формате Prometheus.
+
+Собираются (если settings.METRICS_ENABLED):
+    - http_request_duration_seconds - гистограмма длительности запросов по маршруту, методу и коду ответа;
+    - storage_operations_total, storage_bytes_total, storage_duration_seconds - чтения и записи файлов хранилища
+      (JSON-базы, снимки) и запросы к базе данных;
+    - request_storage_operations, request_storage_bytes - гистограммы числа и объёма операций хранилища за запрос;
+    - upstream_requests_total, upstream_duration_seconds - обращения к внешним сервисам (погода);
+    - write_behind_group_size - размер групповых записей при отложенной записи (logic.write_behind);
+    - cache_requests_total - обращения к кешу приложения (logic.cache) по пространствам имён;
+    - ratelimit_requests_total, ratelimit_tokens_remaining, ratelimit_inflight - решения ограничителя частоты,
+      запас токенов клиентов и одновременные запросы правил (logic.ratelimit);
+    - request_log_dropped_total - записи журнала запросов, отброшенные при переполнении буфера (logic.request_log);
+    - template_render_seconds - гистограмма длительности отрисовки шаблонов по имени шаблона (шаблоны, которые
+      отрисовывают render и TemplateResponse; вложенные {% include %} входят во время внешнего шаблона).
+
+Метрики хранятся в памяти процесса: при нескольких рабочих процессах каждый отдаёт свои значения.
+Если метрики выключены, промежуточный слой не подключается, а функции записи сразу возвращаются.
+"""
+import functools
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseNotFound
+from django.template.backends.django import Template
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (0, 1024, 10240, 102400, 1048576, 10485760)
+
+HELP = {
+    'http_request_duration_seconds': ('histogram', "Длительность обработки запроса"),
+    'storage_operations_total': ('counter', "Операции с хранилищем корзин и избранного"),
+    'storage_bytes_total': ('counter', "Байты, прочитанные и записанные в файлы хранилища"),
+    'storage_duration_seconds': ('histogram', "Длительность операций с файлами хранилища"),
+    'request_storage_operations': ('histogram', "Количество операций с хранилищем за запрос"),
+    'request_storage_bytes': ('histogram', "Объём операций с файлами хранилища за запрос"),
+    'upstream_requests_total': ('counter', "Запросы к внешним сервисам"),
+    'upstream_duration_seconds': ('histogram', "Длительность запросов к внешним сервисам"),
+    'write_behind_group_size': ('histogram', "Количество пользователей в одной групповой записи файла хранилища"),
+    'cache_requests_total': ('counter', "Обращения к кешу приложения по результату (hit, miss, early)"),
+    'ratelimit_requests_total': ('counter', "Решения ограничителя частоты (allowed, limited - 429, shed - 503)"),
+    'ratelimit_tokens_remaining': ('histogram', "Токены, оставшиеся в корзине после пропущенного запроса"),
+    'ratelimit_inflight': ('gauge', "Одновременно выполняемые запросы правила ограничителя в процессе"),
+    'request_log_dropped_total': ('counter', "Записи журнала запросов, отброшенные при переполнении буфера"),
+    'template_render_seconds': ('histogram', "Длительность отрисовки шаблона"),
+}
+
+_lock = threading.Lock()
+_counters: dict[tuple, float] = {}  # (имя, метки) -> значение
+_gauges: dict[tuple, float] = {}  # (имя, метки) -> текущее значение
+_histograms: dict[tuple, list] = {}  # (имя, метки) -> [границы, счётчики по корзинам, сумма, количество]
+_request_stats: ContextVar[dict | None] = ContextVar('request_storage_stats', default=None)
+_template_timing_installed = False
+
+
+def clock() -> float:
+    """
+    Время начала измеряемой операции.
+
+    :return: time.perf_counter() или 0, если метрики выключены.
+    """
+    return time.perf_counter() if settings.METRICS_ENABLED else 0.0
+
+
+def inc(name: str, labels: tuple = (), value: float = 1) -> None:
+    """
+    Увеличивает счётчик.
+
+    :param name: Имя метрики.
+    :param labels: Кортеж пар (метка, значение).
+    :param value: Прирост.
+    """
+    key = (name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, labels: tuple, value: float) -> None:
+    """
+    Устанавливает текущее значение показателя.
+
+    :param name: Имя метрики.
+    :param labels: Кортеж пар (метка, значение).
+    :param value: Значение.
+    """
+    with _lock:
+        _gauges[(name, labels)] = value
+
+
+def observe(name: str, labels: tuple, value: float, buckets: tuple = LATENCY_BUCKETS) -> None:
+    """
+    Добавляет наблюдение в гистограмму.
+
+    :param name: Имя метрики.
+    :param labels: Кортеж пар (метка, значение).
+    :param value: Наблюдаемое значение.
+    :param buckets: Верхние границы корзин гистограммы.
+    """
+    key = (name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+        for position, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[1][position] += 1
+                break
+        histogram[2] += value
+        histogram[3] += 1
+
+
+def storage_io(operation: str, path: str, size: int, started: float) -> None:
+    """
+    Записывает операцию с файлом хранилища.
+
+    :param operation: 'read' или 'write'.
+    :param path: Путь к файлу (метка - имя файла).
+    :param size: Количество байт.
+    :param started: Результат clock() перед операцией.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    elapsed = time.perf_counter() - started
+    labels = (('operation', operation), ('file', str(path).rsplit('/', 1)[-1]))
+    inc('storage_operations_total', labels)
+    inc('storage_bytes_total', labels, size)
+    observe('storage_duration_seconds', labels, elapsed)
+    if (stats := _request_stats.get()) is not None:
+        stats[operation] = stats.get(operation, 0) + 1
+        stats[f'{operation}_bytes'] = stats.get(f'{operation}_bytes', 0) + size
+
+
+def upstream(service: str, status: int | str, started: float) -> None:
+    """
+    Записывает обращение к внешнему сервису.
+
+    :param service: Название сервиса.
+    :param status: Код ответа или 'error'.
+    :param started: Результат clock() перед запросом.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    inc('upstream_requests_total', (('service', service), ('status', str(status))))
+    observe('upstream_duration_seconds', (('service', service),), time.perf_counter() - started)
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    """Считает запросы к базе данных как операции хранилища (чтение - SELECT, остальное - запись)."""
+    if (stats := _request_stats.get()) is not None:
+        operation = 'db_read' if sql.lstrip()[:6].upper() == 'SELECT' else 'db_write'
+        stats[operation] = stats.get(operation, 0) + 1
+        inc('storage_operations_total', (('operation', operation), ('file', 'db')))
+    return execute(sql, params, many, context)
+
+
+def install_template_timing() -> None:
+    """
+    Включает замер отрисовки шаблонов (template_render_seconds): оборачивает Template.render бэкенда шаблонов
+    Django, через который отрисовывают render и TemplateResponse. Повторный вызов ничего не делает.
+    """
+    global _template_timing_installed
+    if _template_timing_installed:
+        return
+    render = Template.render
+
+    @functools.wraps(render)
+    def timed_render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            observe('template_render_seconds', (('template', self.origin.template_name or 'unknown'),),
+                    time.perf_counter() - started)
+
+    Template.render = timed_render
+    _template_timing_installed = True
+
+
+def _finish_request(request, response, started: float, stats: dict) -> None:
+    """Записывает метрики завершённого запроса."""
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match is not None else 'unmatched'  # Шаблон маршрута, а не путь: число меток ограничено
+    status = getattr(response, 'status_code', 500)
+    observe('http_request_duration_seconds',
+            (('route', route), ('method', request.method), ('status', str(status))),
+            time.perf_counter() - started)
+    for operation in ('read', 'write', 'db_read', 'db_write'):
+        observe('request_storage_operations', (('route', route), ('operation', operation)),
+                stats.get(operation, 0), COUNT_BUCKETS)
+    for operation in ('read', 'write'):
+        observe('request_storage_bytes', (('route', route), ('operation', operation)),
+                stats.get(f'{operation}_bytes', 0), BYTES_BUCKETS)
+
+
+class MetricsMiddleware:
+    """Промежуточный слой сбора метрик запросов. Подключается только при settings.METRICS_ENABLED."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        install_template_timing()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = {}
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        response = None
+        try:
+            with connections['default'].execute_wrapper(_db_wrapper):
+                response = self.get_response(request)
+            return response
+        finally:
+            _finish_request(request, response, started, stats)
+            _request_stats.reset(token)
+
+    async def __acall__(self, request):
+        # Запросы к базе из потоков sync_to_async идут через другие соединения и здесь не считаются
+        stats = {}
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            _finish_request(request, response, started, stats)
+            _request_stats.reset(token)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels) + '}'
+
+
+def render() -> str:
+    """
+    Текущие метрики в текстовом формате Prometheus (версия 0.0.4).
+
+    :return: Текст для ответа эндпоинта метрик.
+    """
+    with _lock:
+        counters = {**_counters, **_gauges}
+        histograms = {key: (value[0], list(value[1]), value[2], value[3]) for key, value in _histograms.items()}
+
+    lines = []
+    for name, (kind, description) in HELP.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind in ('counter', 'gauge'):
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value:g}')
+            continue
+        for (metric, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", f"{bound:g}"),))} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total:g}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request) -> HttpResponse:
+    """
+    Эндпоинт метрик для Prometheus. Доступен только с адресов settings.METRICS_ALLOWED_IPS.
+
+    :param request: Объект запроса.
+    :return: Метрики в текстовом формате или 404.
+    """
+    if not settings.METRICS_ENABLED or request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseNotFound()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
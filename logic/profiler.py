@@ -0,0 +1,194 @@
+"""
+Выборочный профилировщик запросов для рабочего окружения.
+
+Профилируется доля запросов settings.PROFILER_SAMPLE_RATE. Пока такой запрос выполняется, фоновый поток
+раз в settings.PROFILER_INTERVAL секунд снимает стек его потока (sys._current_frames) и добавляет его
+в общую таблицу стеков. Сам запрос ничего не замеряет, поэтому профилировщик можно держать включённым:
+накладные расходы - одна проверка случайного числа на запрос и снятие стека раз в несколько миллисекунд
+только пока выполняются выбранные запросы. Число различных стеков ограничено settings.PROFILER_MAX_STACKS.
+
+Результаты (только для сотрудников, is_staff):
+    - /profiler/stacks - стеки в свёрнутом формате (flamegraph.pl, speedscope): "маршрут;f1;f2;f3 число";
+    - /profiler/top - самые горячие функции по собственному и общему числу выборок.
+Параметр ?reset=1 очищает накопленные данные после выдачи.
+
+Профилировщик работает только под WSGI, где запрос от начала до конца выполняется в одном потоке. Под ASGI
+(python manage.py runserver с daphne, uvicorn и т.п.) он не подключается: в потоке цикла событий одновременно
+выполняются многие запросы, а синхронный код запроса уходит в потоки пула (sync_to_async), поэтому стеки
+потока нельзя отнести к одному запросу.
+"""
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseNotFound
+
+from logic.http import JsonResponse
+
+MAX_DEPTH = 128  # Максимальная глубина стека
+OTHER_STACKS = '[прочие стеки]'  # Куда попадают выборки сверх settings.PROFILER_MAX_STACKS
+
+_active: dict[int, Counter] = {}  # id потока выбранного запроса -> его стеки (маршрут известен только в конце)
+_stacks = Counter()  # Свёрнутый стек -> число выборок
+_requests = Counter()  # Маршрут -> число профилированных запросов
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_sampler = None
+
+
+def _collapse(frame) -> str:
+    """Стек потока от корня к текущей функции в виде "модуль.функция;модуль.функция"."""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _sample_loop(interval: float) -> None:
+    """Фоновый поток: снимает стеки потоков выбранных запросов, пока такие запросы есть."""
+    while True:
+        _wakeup.wait()
+        _wakeup.clear()
+        while _active:
+            time.sleep(interval)
+            frames = sys._current_frames()
+            with _lock:
+                for ident, stacks in _active.items():
+                    if (frame := frames.get(ident)) is not None:
+                        stacks[_collapse(frame)] += 1
+
+
+def _begin(ident: int) -> None:
+    """Регистрирует поток выбранного запроса и будит поток выборки."""
+    global _sampler
+    with _lock:
+        if _sampler is None or not _sampler.is_alive():  # После fork поток выборки нужно запустить заново
+            _sampler = threading.Thread(target=_sample_loop, args=(settings.PROFILER_INTERVAL,),
+                                        name='request-profiler', daemon=True)
+            _sampler.start()
+        _active[ident] = Counter()
+    _wakeup.set()
+
+
+def _end(ident: int, request) -> None:
+    """Снимает поток с профилирования и добавляет его выборки в общую таблицу с маршрутом запроса."""
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match is not None else 'unmatched'
+    with _lock:
+        stacks = _active.pop(ident, Counter())
+        _requests[route] += 1
+        for stack, count in stacks.items():
+            stack = f'{route};{stack}'
+            if stack not in _stacks and len(_stacks) >= settings.PROFILER_MAX_STACKS:
+                stack = OTHER_STACKS
+            _stacks[stack] += count
+
+
+class ProfilerMiddleware:
+    """
+    Промежуточный слой выборочного профилирования. Подключается только при settings.PROFILER_ENABLED
+    и только под WSGI (см. описание модуля).
+    """
+    sync_capable = True
+    async_capable = True  # Под ASGI Django передаёт асинхронный get_response, по нему слой и отключается
+
+    def __init__(self, get_response):
+        if not settings.PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+        if iscoroutinefunction(get_response):
+            raise MiddlewareNotUsed("Профилировщик запросов не поддерживает ASGI")
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILER_SAMPLE_RATE:
+            return self.get_response(request)
+        ident = threading.get_ident()
+        _begin(ident)
+        try:
+            return self.get_response(request)
+        finally:
+            _end(ident, request)
+
+
+def collapsed_stacks(reset: bool = False) -> str:
+    """
+    Накопленные стеки в свёрнутом формате.
+
+    :param reset: Очистить накопленные данные.
+    :return: Текст, строка на стек: "кадр;кадр;кадр число".
+    """
+    with _lock:
+        stacks = sorted(_stacks.items())
+        if reset:
+            _stacks.clear()
+            _requests.clear()
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+
+def hot_functions(limit: int = 30, reset: bool = False) -> dict:
+    """
+    Самые горячие функции по накопленным стекам.
+
+    :param limit: Сколько функций вернуть.
+    :param reset: Очистить накопленные данные.
+    :return: Словарь с числом запросов и выборок и списком функций с собственным (функция на вершине стека)
+             и общим (функция где-то в стеке) числом выборок.
+    """
+    with _lock:
+        stacks = dict(_stacks)
+        requests = dict(_requests)
+        if reset:
+            _stacks.clear()
+            _requests.clear()
+
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')[1:]  # Первый элемент - маршрут запроса
+        if frames:
+            own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+
+    samples = sum(stacks.values()) or 1
+    return {'requests': requests,
+            'samples': sum(stacks.values()),
+            'interval': settings.PROFILER_INTERVAL,
+            'functions': [{'function': function, 'self': own[function], 'total': total[function],
+                           'self_percent': round(100 * own[function] / samples, 1),
+                           'total_percent': round(100 * total[function] / samples, 1)}
+                          for function, _ in own.most_common(limit)]}
+
+
+@staff_member_required
+def profiler_stacks_view(request) -> HttpResponse:
+    """
+    Свёрнутые стеки для построения flame graph.
+
+    :param request: Объект запроса.
+    :return: Текст со стеками или 404, если профилировщик выключен.
+    """
+    if not settings.PROFILER_ENABLED:
+        return HttpResponseNotFound()
+    return HttpResponse(collapsed_stacks(request.GET.get('reset') == '1'), content_type='text/plain; charset=utf-8')
+
+
+@staff_member_required
+def profiler_top_view(request) -> JsonResponse | HttpResponseNotFound:
+    """
+    Самые горячие функции.
+
+    :param request: Объект запроса. Параметры: limit - сколько функций вернуть, reset=1 - очистить данные.
+    :return: JSON с функциями или 404, если профилировщик выключен.
+    """
+    if not settings.PROFILER_ENABLED:
+        return HttpResponseNotFound()
+    limit = request.GET.get('limit', '30')
+    limit = int(limit) if limit.isdigit() else 30
+    return JsonResponse(hot_functions(limit, request.GET.get('reset') == '1'))
@@ -0,0 +1,376 @@
+"""
+Ограничение частоты запросов и сброс нагрузки для записывающих эндпоинтов и эндпоинтов, обращающихся
+к внешним сервисам.
+
+Правила (settings.RATELIMIT_RULES) привязываются к шаблонам маршрутов Django (routes) или, без маршрутов,
+применяются в коде через limit() - например, квота внешнего сервиса расходуется только запросами, которые
+действительно к нему обращаются, а не ответами из кеша. У правила могут быть:
+    - rate и burst - корзина токенов: в среднем rate запросов в секунду, пачкой до burst запросов подряд.
+      scope 'client' - своя корзина у каждого пользователя (у анонимного - у IP-адреса),
+      'global' - одна корзина на всех клиентов (например, квота внешнего сервиса);
+    - concurrency - предельное число одновременно выполняемых запросов правила в процессе.
+Превышение частоты - ответ 429, превышение concurrency - 503, оба с заголовком Retry-After. Решение
+принимается до вызова представления: лишний запрос не ждёт в очереди за файлом хранилища или внешним сервисом.
+Если запрос отклонило одно из правил маршрута, токены, уже забранные им у других правил, возвращаются:
+отклонённые запросы не расходуют чужие корзины.
+
+Корзины хранятся в хранилище settings.RATELIMIT_STORES[settings.RATELIMIT_STORE]:
+    - MemoryStore - память процесса (у каждого рабочего процесса свои корзины);
+    - SQLiteStore - файл SQLite, общий для процессов на сервере; решение - один атомарный запрос.
+Другое хранилище - класс с методами consume(key, now, interval, burst) и refund(key, interval), как у MemoryStore.
+
+Корзина реализована алгоритмом GCRA: для ключа хранится одно число - теоретическое время прибытия (TAT)
+следующего запроса. Каждый пропущенный запрос сдвигает TAT на 1 / rate секунд; запрос пропускается,
+если после сдвига TAT не дальше burst интервалов от текущего момента. TAT в прошлом означает полную корзину,
+поэтому такие ключи можно удалять без потери состояния.
+"""
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+from django.utils.module_loading import import_string
+
+from logic import metrics
+from logic.http import JsonResponse
+from logic.services import aget_user
+
+CULL_PROBABILITY = 0.01  # Доля решений, после которых из SQLiteStore удаляются полные корзины
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Правило ограничения для группы маршрутов."""
+    name: str
+    rate: float | None = None  # Запросов в секунду, None - без ограничения частоты
+    burst: int = 1  # Ёмкость корзины
+    scope: str = 'client'  # 'client' или 'global'
+    concurrency: int | None = None  # Одновременных запросов в процессе, None - без ограничения
+
+
+class MemoryStore:
+    """Корзины токенов в памяти процесса."""
+    MAX_KEYS = 100000  # При превышении удаляются полные корзины
+
+    def __init__(self):
+        self._tats: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, now: float, interval: float, burst: int) -> tuple[bool, float]:
+        """
+        Забирает токен из корзины.
+
+        :param key: Ключ корзины.
+        :param now: Текущее время (time.time()).
+        :param interval: Время пополнения одного токена, с (1 / rate).
+        :param burst: Ёмкость корзины.
+        :return: (пропущен ли запрос, TAT корзины: новый - если пропущен, текущий - если нет).
+        """
+        with self._lock:
+            tat = max(self._tats.get(key, now), now)
+            if tat + interval - now > burst * interval:
+                return False, tat
+            if len(self._tats) >= self.MAX_KEYS:
+                self._tats = {key: value for key, value in self._tats.items() if value > now}
+            self._tats[key] = tat + interval
+            return True, tat + interval
+
+    def refund(self, key: str, interval: float) -> None:
+        """
+        Возвращает в корзину токен, забранный consume (запрос отклонило другое правило).
+
+        :param key: Ключ корзины.
+        :param interval: Время пополнения одного токена, с - то же, что было передано в consume.
+        """
+        with self._lock:
+            if key in self._tats:
+                self._tats[key] -= interval
+
+
+class SQLiteStore:
+    """
+    Корзины токенов в файле SQLite, общие для процессов на одном сервере. Проверка и сдвиг TAT
+    выполняются одним запросом INSERT ... ON CONFLICT DO UPDATE ... WHERE, поэтому процессы не могут
+    одновременно забрать последний токен. У каждого потока своё соединение, после fork - новое.
+    """
+
+    def __init__(self, path):
+        self._path = str(path)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока (после fork - новое)."""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')  # Корзины можно потерять при сбое питания
+            connection.execute('CREATE TABLE IF NOT EXISTS ratelimit (key TEXT PRIMARY KEY, tat REAL NOT NULL)')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def consume(self, key: str, now: float, interval: float, burst: int) -> tuple[bool, float]:
+        """То же, что MemoryStore.consume."""
+        connection = self._connection()
+        row = connection.execute(
+            'INSERT INTO ratelimit VALUES (:key, :now + :interval) ON CONFLICT(key) DO UPDATE '
+            'SET tat = max(tat, :now) + :interval WHERE max(tat, :now) + :interval - :now <= :window '
+            'RETURNING tat',
+            {'key': key, 'now': now, 'interval': interval, 'window': burst * interval}).fetchone()
+        if random.random() < CULL_PROBABILITY:
+            connection.execute('DELETE FROM ratelimit WHERE tat <= ?', (now,))
+        if row is not None:
+            return True, row[0]
+        row = connection.execute('SELECT tat FROM ratelimit WHERE key = ?', (key,)).fetchone()
+        return False, max(row[0] if row else now, now)
+
+    def refund(self, key: str, interval: float) -> None:
+        """То же, что MemoryStore.refund."""
+        self._connection().execute('UPDATE ratelimit SET tat = tat - ? WHERE key = ?', (interval, key))
+
+
+_store = None
+_inflight: dict[str, int] = {}  # Правило -> одновременно выполняемые запросы процесса
+_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Хранилище корзин токенов settings.RATELIMIT_STORES[settings.RATELIMIT_STORE] (создаётся один раз на процесс).
+
+    :return: Объект с методом consume.
+    """
+    global _store
+    if _store is None:
+        config = settings.RATELIMIT_STORES[settings.RATELIMIT_STORE]
+        _store = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _store
+
+
+def make_rule(name: str, options: dict) -> Rule:
+    """
+    Правило из настроек.
+
+    :param name: Имя правила.
+    :param options: Параметры правила из settings.RATELIMIT_RULES.
+    :return: Rule.
+    """
+    rule = Rule(name, **{key: value for key, value in options.items() if key != 'routes'})
+    if rule.scope not in ('client', 'global'):
+        raise ValueError(f"Неизвестная область правила {name}: {rule.scope}")
+    return rule
+
+
+def load_rules(config: dict) -> dict[str, list[Rule]]:
+    """
+    Правила по шаблонам маршрутов. Правила без routes применяются через limit().
+
+    :param config: settings.RATELIMIT_RULES: {имя: {'routes': (...), 'rate': ..., 'burst': ..., ...}}.
+    :return: Словарь {шаблон маршрута: [правила]}.
+    """
+    routes = {}
+    for name, options in config.items():
+        rule = make_rule(name, options)
+        for route in options.get('routes', ()):
+            routes.setdefault(route, []).append(rule)
+    return routes
+
+
+def client_key(request, user) -> str:
+    """
+    Ключ клиента: пользователь, а для анонимного - IP-адрес (из заголовка settings.RATELIMIT_IP_HEADER
+    за обратным прокси, иначе REMOTE_ADDR).
+
+    :param request: Объект запроса.
+    :param user: Пользователь запроса.
+    :return: Строка вида "user:12" или "ip:127.0.0.1".
+    """
+    if user.is_authenticated:
+        return f'user:{user.pk}'
+    address = request.META.get(settings.RATELIMIT_IP_HEADER or 'REMOTE_ADDR') or request.META.get('REMOTE_ADDR')
+    return f"ip:{(address or '').split(',')[0].strip()}"
+
+
+def _count(rule: Rule, result: str) -> None:
+    if settings.METRICS_ENABLED:
+        metrics.inc('ratelimit_requests_total', (('rule', rule.name), ('result', result)))
+
+
+def _set_inflight(rule: Rule, value: int) -> None:
+    if settings.METRICS_ENABLED:
+        metrics.set_gauge('ratelimit_inflight', (('rule', rule.name),), value)
+
+
+def release(rules: list[Rule]) -> None:
+    """Освобождает места одновременных запросов, занятые admit."""
+    with _lock:
+        for rule in rules:
+            _inflight[rule.name] -= 1
+            _set_inflight(rule, _inflight[rule.name])
+
+
+def admit(rules: list[Rule], client: str | None) -> tuple[JsonResponse | None, list[Rule]]:
+    """
+    Решает, выполнять ли запрос: сначала занимает места одновременных запросов, затем забирает токены.
+    Если токена нет у одного из правил, токены, забранные у предыдущих, возвращаются в их корзины.
+
+    :param rules: Правила маршрута запроса.
+    :param client: Ключ клиента (client_key) или None, если правил с областью 'client' нет.
+    :return: (ответ 429/503 или None, правила с занятыми местами - их нужно освободить через release
+             после ответа представления).
+    """
+    acquired = []
+    with _lock:
+        for rule in rules:
+            if rule.concurrency is None:
+                continue
+            if _inflight.get(rule.name, 0) >= rule.concurrency:
+                for taken in acquired:
+                    _inflight[taken.name] -= 1
+                    _set_inflight(taken, _inflight[taken.name])
+                _count(rule, 'shed')
+                return _reject(503, "Сервер перегружен, повторите запрос позже", 1), []
+            _inflight[rule.name] = _inflight.get(rule.name, 0) + 1
+            acquired.append(rule)
+        for rule in acquired:
+            _set_inflight(rule, _inflight[rule.name])
+
+    now = time.time()
+    store = get_store()
+    consumed = []
+    for rule in rules:
+        if rule.rate is None:
+            continue
+        interval = 1 / rule.rate
+        key = f'{rule.name}:{client}' if rule.scope == 'client' else rule.name
+        allowed, tat = store.consume(key, now, interval, rule.burst)
+        if not allowed:
+            for taken_key, taken_interval in consumed:
+                store.refund(taken_key, taken_interval)
+            release(acquired)
+            _count(rule, 'limited')
+            return _reject(429, "Слишком много запросов, повторите запрос позже",
+                           tat + interval - rule.burst * interval - now), []
+        if settings.METRICS_ENABLED:
+            metrics.observe('ratelimit_tokens_remaining', (('rule', rule.name),),
+                            math.floor((now + rule.burst * interval - tat) / interval + 1e-6), metrics.COUNT_BUCKETS)
+        consumed.append((key, interval))
+    for rule in rules:
+        _count(rule, 'allowed')
+    return None, acquired
+
+
+def _reject(status: int, answer: str, retry_after: float) -> JsonResponse:
+    return JsonResponse({'answer': answer}, status=status,
+                        headers={'Retry-After': str(max(1, math.ceil(retry_after)))})
+
+
+class RateLimited(Exception):
+    """Вызов отклонён правилом limit(); response - готовый ответ 429 или 503 для клиента."""
+
+    def __init__(self, response: JsonResponse):
+        super().__init__(response.status_code)
+        self.response = response
+
+
+@contextmanager
+def limit(name: str, client: str | None = None):
+    """
+    Применяет правило settings.RATELIMIT_RULES[name] к участку кода, например к обращению к внешнему сервису
+    (только при settings.RATELIMIT_ENABLED).
+
+    :param name: Имя правила.
+    :param client: Ключ клиента (client_key) для правила с областью 'client'.
+    :raise RateLimited: Если правило не пропускает вызов.
+    """
+    if not settings.RATELIMIT_ENABLED:
+        yield
+        return
+    response, acquired = admit([make_rule(name, settings.RATELIMIT_RULES[name])], client)
+    if response is not None:
+        raise RateLimited(response)
+    try:
+        yield
+    finally:
+        release(acquired)
+
+
+class RateLimitMiddleware:
+    """
+    Промежуточный слой ограничения частоты и одновременных запросов. Подключается только при
+    settings.RATELIMIT_ENABLED, стоит после AuthenticationMiddleware (ключ клиента - пользователь).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.RATELIMIT_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.routes = load_rules(settings.RATELIMIT_RULES)
+        # Постоянные начала шаблонов маршрутов: остальные запросы проходят без разбора адреса
+        self.prefixes = tuple({route.split('<', 1)[0] for route in self.routes})
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _rules(self, request) -> list[Rule] | None:
+        """Правила маршрута запроса."""
+        if not request.path_info[1:].startswith(self.prefixes):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        return self.routes.get(match.route)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not (rules := self._rules(request)):
+            return self.get_response(request)
+        client = None
+        if any(rule.scope == 'client' and rule.rate is not None for rule in rules):
+            client = client_key(request, request.user)
+        response, acquired = admit(rules, client)
+        if response is not None:
+            return response
+        try:
+            return self.get_response(request)
+        finally:
+            release(acquired)
+
+    async def __acall__(self, request):
+        if not (rules := self._rules(request)):
+            return await self.get_response(request)
+        client = None
+        if any(rule.scope == 'client' and rule.rate is not None for rule in rules):
+            # Пользователь запоминается в request.user, представление не читает его повторно
+            client = client_key(request, await aget_user(request))
+        if isinstance(get_store(), MemoryStore):
+            response, acquired = admit(rules, client)
+        else:  # Запрос к хранилищу (SQLiteStore и др.) блокирует поток и выполняется вне цикла событий
+            response, acquired = await sync_to_async(admit, thread_sensitive=False)(rules, client)
+        if response is not None:
+            return response
+        try:
+            return await self.get_response(request)
+        finally:
+            release(acquired)
+
+
+def _after_fork() -> None:
+    # Запросы родителя в дочернем процессе не выполняются; блокировка создаётся заново
+    global _lock
+    _lock = threading.Lock()
+    _inflight.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
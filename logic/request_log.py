@@ -0,0 +1,150 @@
+"""
+Журнал запросов для воспроизведения нагрузки (python manage.py replay).
+
+RequestLogMiddleware записывает долю запросов settings.REQUEST_LOG_SAMPLE_RATE в файл settings.REQUEST_LOG_PATH
+в формате JSON Lines, по строке на запрос:
+    {"ts": 1700000000.123, "method": "GET", "path": "/cart/", "query": "page=2", "route": "cart/",
+     "user": 1, "status": 200, "duration_ms": 3.512, "sample": 0.1}
+ts - время начала запроса (по нему воспроизводится исходный темп), user - id пользователя, если представление
+обращалось к нему (сам журнал сессию не читает), sample - доля записываемых запросов. Тела запросов, cookie
+и заголовки не записываются.
+
+Запрос только добавляет запись в буфер процесса. Фоновый поток раз в settings.REQUEST_LOG_FLUSH_INTERVAL секунд
+(или раньше, если накопилось settings.REQUEST_LOG_BATCH записей) записывает буфер в конец файла одной записью
+под блокировкой файла (fcntl.flock), поэтому строки процессов не перемешиваются. Если запись не успевает,
+буфер ограничен settings.REQUEST_LOG_MAX_BUFFER записями: лишние отбрасываются (request_log_dropped_total).
+Буфер записывается при завершении процесса (atexit).
+"""
+import atexit
+import fcntl
+import logging
+import os
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.functional import empty
+
+from logic import metrics
+from logic.http import dumps
+
+logger = logging.getLogger(__name__)
+
+_buffer: list[dict] = []
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wakeup = threading.Event()
+_writer = None
+
+
+def _user_id(request) -> int | None:
+    """id пользователя, если он уже загружен представлением или промежуточным слоем (без чтения сессии)."""
+    user = getattr(request, 'user', None)
+    if user is None or getattr(user, '_wrapped', None) is empty:
+        return None
+    return user.pk if user.is_authenticated else None
+
+
+def record(request, response, started: float, duration: float) -> None:
+    """
+    Добавляет запрос в буфер журнала.
+
+    :param request: Объект запроса.
+    :param response: Объект ответа.
+    :param started: Время начала запроса (time.time()).
+    :param duration: Длительность обработки, с.
+    """
+    global _writer
+    match = getattr(request, 'resolver_match', None)
+    entry = {'ts': round(started, 6), 'method': request.method, 'path': request.path,
+             'query': request.META.get('QUERY_STRING', ''), 'route': match.route if match is not None else None,
+             'user': _user_id(request), 'status': response.status_code, 'duration_ms': round(duration * 1000, 3),
+             'sample': settings.REQUEST_LOG_SAMPLE_RATE}
+    with _lock:
+        if len(_buffer) >= settings.REQUEST_LOG_MAX_BUFFER:
+            if settings.METRICS_ENABLED:
+                metrics.inc('request_log_dropped_total')
+            return
+        _buffer.append(entry)
+        size = len(_buffer)
+        if _writer is None or not _writer.is_alive():  # После fork поток записи нужно запустить заново
+            _writer = threading.Thread(target=_write_loop, name='request-log', daemon=True)
+            _writer.start()
+    if size >= settings.REQUEST_LOG_BATCH:
+        _wakeup.set()
+
+
+def flush() -> int:
+    """
+    Записывает буфер в конец файла журнала.
+
+    :return: Количество записанных запросов.
+    """
+    global _buffer
+    with _flush_lock:
+        with _lock:
+            entries, _buffer = _buffer, []
+        if not entries:
+            return 0
+        data = b''.join(dumps(entry) + b'\n' for entry in entries)
+        path = settings.REQUEST_LOG_PATH
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, mode='ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)  # Снимается при закрытии файла
+            f.write(data)
+        return len(entries)
+
+
+def _write_loop() -> None:
+    while True:
+        _wakeup.wait(settings.REQUEST_LOG_FLUSH_INTERVAL)
+        _wakeup.clear()
+        try:
+            flush()
+        except OSError:  # Журнал не должен мешать обработке запросов: записи пропадают
+            logger.exception("Ошибка записи журнала запросов")
+            time.sleep(1)
+
+
+class RequestLogMiddleware:
+    """Промежуточный слой журнала запросов. Подключается только при settings.REQUEST_LOG_ENABLED."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_LOG_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.REQUEST_LOG_SAMPLE_RATE:
+            return self.get_response(request)
+        started, clock = time.time(), time.perf_counter()
+        response = self.get_response(request)
+        record(request, response, started, time.perf_counter() - clock)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= settings.REQUEST_LOG_SAMPLE_RATE:
+            return await self.get_response(request)
+        started, clock = time.time(), time.perf_counter()
+        response = await self.get_response(request)
+        record(request, response, started, time.perf_counter() - clock)
+        return response
+
+
+def _after_fork() -> None:
+    # Записи родителя запишет он сам; блокировки и событие создаются заново
+    global _buffer, _lock, _flush_lock, _wakeup, _writer
+    _buffer, _lock, _flush_lock, _wakeup, _writer = [], threading.Lock(), threading.Lock(), threading.Event(), None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+atexit.register(flush)
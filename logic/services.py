@@ -1,159 +1,505 @@
 import json
 import os
+import threading
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache, partial
+from typing import Callable, Iterable, Iterator
 
-from django.contrib.auth import get_user
-from store.models import DATABASE
-from random import shuffle
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import F
+from store.catalog import Catalog, get_catalog, register_index
+from store.pricing_rules import delivery_price, get_coupon
+from store.models import Product, CartItem
+from wishlist.models import WishlistItem
 
+from logic import metrics, write_behind
+from logic.snapshot import is_fresh, read_user, source_stamp, write_snapshot
 
-def add_user_to_wishlist(request, username: str) -> None:
+CART_FILE = 'cart.json'  # База корзин пользователей
+CART_SNAPSHOT_FILE = 'cart.snap'  # Снимок базы корзин с индексом по пользователям для быстрого чтения
+WISHLIST_FILE = 'wishlist.json'  # База избранного пользователей
+WISHLIST_SNAPSHOT_FILE = 'wishlist.snap'  # Снимок базы избранного с индексом по пользователям
+
+_basket_listeners: list[Callable[[str, str, int], None]] = []  # Получатели изменений, см. on_basket_change
+
+
+def use_db() -> bool:
     """
-    Добавляет пользователя в базу данных избранного, если его там не было.
+    Проверяет, хранятся ли корзины и избранное в базе данных (settings.STORE_STORAGE == 'db').
+
+    :return: True для хранилища в базе данных, False для JSON-файлов.
+    """
+    return settings.STORE_STORAGE == 'db'
+
+
+async def run_storage(func, *args):
+    """
+    Выполняет синхронную функцию работы с хранилищем корзин и избранного из асинхронного представления.
+    Функция выполняется в отдельном потоке (sync_to_async с thread_sensitive=True), поэтому цикл событий
+    не блокируется файловым вводом-выводом и запросами к базе, а изменения JSON-файлов,
+    выполняемые как чтение-изменение-запись, не пересекаются между собой.
+
+    :param func: Синхронная функция сервисного слоя.
+    :param args: Аргументы функции.
+    :return: Результат функции.
+    """
+    return await sync_to_async(func, thread_sensitive=True)(*args)
+
+
+def _resolve_user(request):
+    request.user.is_authenticated  # Вычисление ленивого request.user: сессия и пользователь читаются один раз
+    return request.user
+
+
+async def aget_user(request):
+    """
+    Асинхронное получение пользователя запроса (чтение сессии и пользователя из базы выполняется в потоке).
+    Результат запоминается в request.user, повторные обращения в этом запросе не ходят в базу.
 
     :param request: Объект запроса.
+    :return: Пользователь или AnonymousUser.
+    """
+    return await sync_to_async(_resolve_user)(request)
+
+
+def save_users(path: str, users: dict) -> None:
+    """
+    Записывает базу пользователей в JSON-файл. Файл заменяется атомарно, снимок для чтения по одному пользователю
+    пересоздаётся при следующем чтении (view_user_data).
+
+    :param path: Путь к JSON-файлу базы.
+    :param users: Содержимое базы.
+    :return: None
+    """
+    started = metrics.clock()
+    tmp_path = f'{path}.tmp{os.getpid()}.{threading.get_ident()}'  # Уникален для потока
+    with open(tmp_path, mode='w', encoding='utf-8') as f:
+        json.dump(users, f)
+        size = f.tell()
+    os.replace(tmp_path, path)
+    metrics.storage_io('write', path, size, started)
+
+
+def load_user(username: str, view_all, path: str, snapshot_path: str, default: dict) -> tuple[dict | None, dict]:
+    """
+    Читает данные пользователя для изменения. При отложенной записи читается только сам пользователь
+    (из буфера или снимка), иначе - вся база, которая затем записывается целиком через save_user.
+
+    :param username: Имя пользователя.
+    :param view_all: Функция чтения всей базы (view_in_cart или view_in_wishlist).
+    :param path: Путь к JSON-файлу базы.
+    :param snapshot_path: Путь к файлу снимка.
+    :param default: Данные пользователя, которого ещё нет в базе.
+    :return: Пара (вся база или None при отложенной записи, данные пользователя).
+    """
+    if write_behind.enabled():
+        return None, view_user_data(username, view_all, path, snapshot_path) or default
+    users = view_all(username)
+    return users, users.setdefault(username, default)
+
+
+def save_user(users: dict | None, username: str, operation: tuple, path: str) -> None:
+    """
+    Сохраняет изменение данных пользователя, прочитанных load_user: операцию - в буфер отложенной записи
+    (она применяется к записи, перечитанной из файла при групповой записи, см. logic.write_behind.apply)
+    или всю базу, в которой данные уже изменены.
+
+    :param users: Вся база из load_user или None.
+    :param username: Имя пользователя.
+    :param operation: Выполненная над данными пользователя операция, например ('add', id_product).
+    :param path: Путь к JSON-файлу базы.
+    :return: None
+    """
+    if users is None:
+        write_behind.put(path, username, operation)
+    else:
+        save_users(path, users)
+
+
+def on_basket_change(listener: Callable[[str, str, int], None]) -> None:
+    """
+    Регистрирует получателя изменений состава корзин и избранного (например, store.recommendations).
+    listener(имя пользователя, id товара, delta) вызывается в запросе, когда товар добавлен в корзину или избранное
+    (delta=1) или убран оттуда (delta=-1); изменение количества товара в корзине не передаётся.
+
+    :param listener: Функция, которая должна только запомнить изменение.
+    :return: None
+    """
+    _basket_listeners.append(listener)
+
+
+def _basket_changed(username: str, id_product: str, delta: int) -> None:
+    for listener in _basket_listeners:
+        listener(username, str(id_product), delta)
+
+
+def read_users(path: str) -> dict | None:
+    """
+    Читает JSON-файл базы пользователей целиком.
+
+    :param path: Путь к JSON-файлу базы.
+    :return: Содержимое базы или None, если файла нет.
+    """
+    if not os.path.exists(path):
+        return None
+    started = metrics.clock()
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+        metrics.storage_io('read', path, os.fstat(f.fileno()).st_size, started)
+    return data
+
+
+def view_user_data(username: str, view_all, path: str, snapshot_path: str) -> dict | None:
+    """
+    Возвращает данные одного пользователя из базы. Данные читаются из снимка через mmap
+    без разбора всего JSON-файла; если снимок отсутствует или файл изменился после его построения,
+    снимок пересоздаётся (первым чтением после записи).
+
+    :param username: Имя пользователя.
+    :param view_all: Функция чтения всей базы (view_in_cart или view_in_wishlist).
+    :param path: Путь к JSON-файлу базы.
+    :param snapshot_path: Путь к файлу снимка.
+    :return: Данные пользователя или None, если пользователя нет в базе.
+    """
+    if not is_fresh(snapshot_path, path):
+        # Отметка до чтения: если файл перезапишут во время построения, снимок не будет свежим
+        source = source_stamp(path)
+        users = read_users(path)  # Снимок - только содержимое файла, без буфера отложенной записи
+        write_snapshot(snapshot_path, users if users is not None else view_all(username), source)
+    data = read_user(snapshot_path, username)
+    if write_behind.enabled():
+        data = write_behind.replay(path, username, data)  # Изменения этого процесса ещё не записаны в файл
+    return data
+
+
+def view_user_cart(username: str) -> dict | None:
+    """
+    Просматривает корзину одного пользователя.
+
+    :param username: Имя пользователя.
+    :return: Корзина пользователя вида {'products': {id: количество}} или None.
+    """
+    if use_db():
+        items = CartItem.objects.filter(user__username=username).values_list('product_id', 'quantity')
+        return {'products': {str(id_product): quantity for id_product, quantity in items}}
+    return view_user_data(username, view_in_cart, CART_FILE, CART_SNAPSHOT_FILE)
+
+
+def view_user_wishlist(username: str) -> dict | None:
+    """
+    Просматривает избранное одного пользователя.
+
+    :param username: Имя пользователя.
+    :return: Избранное пользователя вида {'products': [id, ...]} или None.
+    """
+    if use_db():
+        items = WishlistItem.objects.filter(user__username=username).values_list('product_id', flat=True)
+        return {'products': [str(id_product) for id_product in items]}
+    return view_user_data(username, view_in_wishlist, WISHLIST_FILE, WISHLIST_SNAPSHOT_FILE)
+
+
+LIST_SORTS = {'added': None, 'price': 'price_after', 'name': 'name'}  # Сортировки корзины и избранного: поле товара
+
+
+def list_params(params) -> tuple[str | None, str, bool]:
+    """
+    Параметры страницы корзины или избранного из запроса.
+
+    :param params: Параметры запроса (request.GET): page, sort (ключ LIST_SORTS), reverse=true.
+    :return: (номер страницы, сортировка, по убыванию). Неизвестная сортировка заменяется на added.
+    """
+    sort = params.get('sort')
+    return params.get('page'), sort if sort in LIST_SORTS else 'added', params.get('reverse') in ('true', 'True')
+
+
+def page_of_ids(ids: Iterable[str], page_number, sort: str = 'added', reverse: bool = False,
+                catalog: Catalog | None = None) -> Page:
+    """
+    Страница id товаров корзины или избранного. Для сортировки из каталога читается только одно поле товара,
+    словари товаров не копируются; товары, убранные из каталога, пропускаются.
+
+    :param ids: id товаров в порядке добавления.
+    :param page_number: Номер страницы из запроса (неверный номер заменяется ближайшей существующей страницей).
+    :param sort: Ключ LIST_SORTS: added - по порядку добавления, price - по цене, name - по названию.
+    :param reverse: Сортировка по убыванию.
+    :param catalog: Снимок каталога, по умолчанию текущий.
+    :return: Страница (django.core.paginator.Page) со списком id товаров страницы в object_list.
+    """
+    products = (catalog or get_catalog()).products
+    ids = [id_product for id_product in ids if id_product in products]
+    if (field := LIST_SORTS.get(sort)) is not None:
+        ids.sort(key=lambda id_product: products[id_product][field], reverse=reverse)
+    elif reverse:
+        ids.reverse()
+    return Paginator(ids, settings.USER_LIST_PAGE_SIZE).get_page(page_number)
+
+
+def iter_cart_products(ids: Iterable[str], lines: dict[str, dict], catalog: Catalog | None = None) -> Iterator[dict]:
+    """
+    Генератор товаров страницы корзины: словари товаров копируются из каталога только для переданных id.
+
+    :param ids: id товаров страницы.
+    :param lines: Позиции расчёта корзины (calculate_cart_total) по id товара.
+    :param catalog: Снимок каталога, по умолчанию текущий.
+    :return: Словари товаров с количеством и общей ценой позиции.
+    """
+    catalog = catalog or get_catalog()
+    for id_product in ids:
+        product = catalog.get(id_product)
+        if product is None or id_product not in lines:  # Товар убран из каталога или корзины после расчёта
+            continue
+        product = dict(product)  # Копия, словари каталога общие для всех запросов
+        product['quantity'] = lines[id_product]['quantity']
+        product['price_total'] = format_minor(lines[id_product]['total'])  # Общая цена позиции с 2 знаками
+        yield product
+
+
+def _page_of_items_db(items, page_number, sort: str, reverse: bool) -> Page:
+    """Страница позиций корзины или избранного из базы данных: LIMIT/OFFSET и COUNT выполняет база."""
+    field = LIST_SORTS.get(sort)
+    order = 'added_at' if field is None else f'product__{field}'
+    items = items.order_by(f'-{order}' if reverse else order, '-id' if reverse else 'id')
+    return Paginator(items, settings.USER_LIST_PAGE_SIZE).get_page(page_number)
+
+
+def cart_products_db(username: str, lines: dict[str, dict], page_number=None, sort: str = 'added',
+                     reverse: bool = False, catalog: Catalog | None = None) -> tuple[Page, Iterator[dict]]:
+    """
+    Формирует страницу товаров корзины пользователя из базы данных: база выполняет сортировку и разбиение
+    на страницы, а товары и цены берутся из того же снимка каталога, что и итоги (calculate_cart_total).
+
+    :param username: Имя пользователя.
+    :param lines: Позиции расчёта корзины (calculate_cart_total) по id товара.
+    :param page_number: Номер страницы.
+    :param sort: Ключ LIST_SORTS.
+    :param reverse: Сортировка по убыванию.
+    :param catalog: Снимок каталога, по которому рассчитаны позиции, по умолчанию текущий.
+    :return: Страница позиций и генератор словарей товаров страницы с количеством и общей ценой позиции.
+    """
+    items = CartItem.objects.filter(user__username=username).only('product_id')
+    page = _page_of_items_db(items, page_number, sort, reverse)
+    return page, iter_cart_products((str(item.product_id) for item in page), lines, catalog)
+
+
+def wishlist_products_db(username: str, page_number=None, sort: str = 'added',
+                         reverse: bool = False) -> tuple[Page, Iterator[dict]]:
+    """
+    Формирует страницу товаров избранного пользователя из базы данных.
+
+    :param username: Имя пользователя.
+    :param page_number: Номер страницы.
+    :param sort: Ключ LIST_SORTS.
+    :param reverse: Сортировка по убыванию.
+    :return: Страница позиций и генератор словарей товаров страницы.
+    """
+    items = (WishlistItem.objects.filter(user__username=username)
+             .select_related('product__category')
+             .only('product__category', *Product.only_fields(prefix='product__')))
+    page = _page_of_items_db(items, page_number, sort, reverse)
+    return page, (item.product.to_dict(Product.LIST_FIELDS) for item in page)
+
+
+def product_exists_db(id_product: str) -> bool:
+    """
+    Проверяет наличие товара в каталоге и в базе данных. Товары каталога переносятся в базу при его загрузке
+    (store.catalog.sync_products_db); убранные из каталога товары остаются в базе, но считаются отсутствующими.
+
+    :param id_product: Идентификационный номер продукта в виде строки.
+    :return: True, если товар существует.
+    """
+    return (id_product.isdigit() and id_product in get_catalog().products
+            and Product.objects.filter(pk=int(id_product)).exists())
+
+
+def add_user_to_wishlist(username: str) -> None:
+    """
+    Добавляет пользователя в базу данных избранного, если его там не было.
+
     :param username: Имя пользователя
     :return: None
     """
-    wishlist_users = view_in_wishlist(request)  # Чтение всей базы избранного
+    if use_db():  # В базе данных пользователю не нужна отдельная запись избранного
+        return
 
-    wishlist = wishlist_users.get(username)  # Получение избранного конкретного пользователя
+    # Чтение базы избранного и избранного конкретного пользователя
+    wishlist_users, wishlist = load_user(username, view_in_wishlist, WISHLIST_FILE, WISHLIST_SNAPSHOT_FILE, {})
 
     if not wishlist:  # Если пользователя до настоящего момента не было в избранном, то создаём его и записываем в базу
-        with open('wishlist.json', mode='w', encoding='utf-8') as f:
-            wishlist_users[username] = {'products': []}
-            json.dump(wishlist_users, f)
+        wishlist['products'] = []
+        save_user(wishlist_users, username, ('init', wishlist), WISHLIST_FILE)
 
 
-def view_in_wishlist(request) -> dict:
+def view_in_wishlist(username: str) -> dict:
     """
     Просматривает содержимое базы данных избранного wishlist.json
 
-    :param request: Объект запроса.
+    :param username: Имя пользователя, для которого создаётся пустая запись, если файла базы ещё нет.
     :return: Содержимое 'wishlist.json'
     """
-    if os.path.exists('wishlist.json'):  # Если файл существует
-        with open('wishlist.json', encoding='utf-8') as f:
-            return json.load(f)
+    if (data := read_users(WISHLIST_FILE)) is not None:  # Если файл существует
+        return write_behind.overlay(WISHLIST_FILE, data) if write_behind.enabled() else data
 
-    user = get_user(request).username  # Получаем авторизированного пользователя
-    wishlist = {user: {'products': []}}  # Создаём пустое избранное
-    with open('wishlist.json', mode='x', encoding='utf-8') as f:  # Создаём файл и записываем туда пустое избранное
+    wishlist = {username: {'products': []}}  # Создаём пустое избранное
+    with open(WISHLIST_FILE, mode='x', encoding='utf-8') as f:  # Создаём файл и записываем туда пустое избранное
         json.dump(wishlist, f)
 
     return wishlist
 
 
-def add_to_wishlist(request, id_product: str) -> bool:
+def add_to_wishlist(user, id_product: str) -> bool:
     """
     Добавляет продукт в избранное, если в избранном нет такого продукта.
 
-    :param request: Объект запроса.
+    :param user: Пользователь запроса (request.user).
     :param id_product: Идентификационный номер продукта в виде строки.
     :return: Возвращает True в случае успешного добавления, а False в случае неуспешного добавления(товара по id_product
     не существует).
     """
-    wishlist_users = view_in_wishlist(request)
-    wishlist = wishlist_users[get_user(request).username]  # получить кизбранное авторизированного пользователя
-
-    if id_product not in wishlist.get('products'):
-        if id_product not in DATABASE:
+    if use_db():
+        if not product_exists_db(id_product):
             return False
-        else:
-            wishlist['products'].append(id_product)
+        if WishlistItem.objects.get_or_create(user=user, product_id=int(id_product))[1]:
+            _basket_changed(user.username, id_product, 1)
+        return True
 
-    with open('wishlist.json', mode='w', encoding='utf-8') as f:  # Записываем данные в избранное
-        json.dump(wishlist_users, f)
+    # получить избранное авторизированного пользователя
+    wishlist_users, wishlist = load_user(user.username, view_in_wishlist, WISHLIST_FILE, WISHLIST_SNAPSHOT_FILE,
+                                         {'products': []})
+
+    if id_product in wishlist['products']:
+        return True  # Товар уже в избранном - базу не перезаписываем
+    if id_product not in get_catalog().products:
+        return False
+    wishlist['products'].append(id_product)
+
+    # Записываем данные в избранное
+    save_user(wishlist_users, user.username, ('append', id_product), WISHLIST_FILE)
+    _basket_changed(user.username, id_product, 1)
 
     return True
 
 
-def remove_from_wishlist(request, id_product: str) -> bool:
+def remove_from_wishlist(user, id_product: str) -> bool:
     """
     Удаляет позицию продукт из избранного. Если в избранном есть такой продукт, то он удаляется из списка.
 
-    :param request: Объект запроса.
+    :param user: Пользователь запроса (request.user).
     :param id_product: Идентификационный номер продукта в виде строки.
     :return: Возвращает True в случае успешного удаления, а False в случае неуспешного удаления(товара по id_product
     не существует).
     """
-    wishlist_users = view_in_wishlist(request)
-    wishlist = wishlist_users[get_user(request).username]
+    if not user.is_authenticated:  # У анонимного пользователя нет избранного
+        return False
+    if use_db():
+        if not id_product.isdigit():
+            return False
+        deleted, _ = WishlistItem.objects.filter(user=user, product_id=int(id_product)).delete()
+        if deleted:
+            _basket_changed(user.username, id_product, -1)
+        return bool(deleted)
 
-    if id_product not in wishlist.get('products'):
+    wishlist_users, wishlist = load_user(user.username, view_in_wishlist, WISHLIST_FILE, WISHLIST_SNAPSHOT_FILE,
+                                         {'products': []})
+
+    try:
+        wishlist['products'].remove(id_product)  # Один проход по списку вместо проверки и удаления
+    except ValueError:
         return False
-    else:
-        wishlist['products'].remove(id_product)
 
-    with open('wishlist.json', mode='w', encoding='utf-8') as f:
-        json.dump(wishlist_users, f)
+    save_user(wishlist_users, user.username, ('remove', id_product), WISHLIST_FILE)
+    _basket_changed(user.username, id_product, -1)
 
     return True
 
 
-def add_user_to_cart(request, username: str) -> None:
+def add_user_to_cart(username: str) -> None:
     """
     Добавляет пользователя в базу данных корзины, если его там не было.
 
-    :param request: Объект запроса.
     :param username: Имя пользователя
     :return: None
     """
-    cart_users = view_in_cart(request)  # Чтение всей базы корзин
+    if use_db():  # В базе данных пользователю не нужна отдельная запись корзины
+        return
 
-    cart = cart_users.get(username)  # Получение корзины конкретного пользователя
+    # Чтение базы корзин и корзины конкретного пользователя
+    cart_users, cart = load_user(username, view_in_cart, CART_FILE, CART_SNAPSHOT_FILE, {})
 
     if not cart:  # Если пользователя до настоящего момента не было в корзине, то создаём его и записываем в базу
-        with open('cart.json', mode='w', encoding='utf-8') as f:
-            cart_users[username] = {'products': {}}
-            json.dump(cart_users, f)
+        cart['products'] = {}
+        save_user(cart_users, username, ('init', cart), CART_FILE)
 
 
-def filter_same_category(current_product: dict,
-                         database: dict[str, dict]) -> list[dict]:
+def iter_user_products(max_items: int | None = None) -> Iterator[tuple[str, dict[str, int]]]:
     """
-    Формирует  список продуктов той же категории, что и у выбранного продукта.
+    Перебирает пользователей и товары из их корзины и избранного (без дубликатов, в порядке добавления).
+    Используется для сбора статистики совместных покупок, запрос пользователя не нужен.
 
-    :param current_product: Текущий выбранный продукт.
-    :param database: База данны продуктов.
-    :return: Список словарей продуктов той же категории
+    :param max_items: [Опционально] Сколько последних добавленных товаров пользователя учитывать.
+    :return: Итератор пар (имя пользователя, {id товара: в скольких списках пользователя он есть - 1 или 2}).
     """
-    data = list(filter(lambda x: x.get('category') == current_product.get('category'), database.values()))
-    if current_product in data: data.remove(current_product)
-    shuffle(data)
-    return data[:4]
+    baskets = {}
+    if use_db():
+        for model in (CartItem, WishlistItem):
+            for username, id_product in (model.objects.order_by('added_at', 'id')
+                                         .values_list('user__username', 'product_id').iterator()):
+                products = baskets.setdefault(username, {})
+                products[str(id_product)] = products.get(str(id_product), 0) + 1
+    else:
+        for path in (CART_FILE, WISHLIST_FILE):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as f:
+                for username, data in json.load(f).items():
+                    products = baskets.setdefault(username, {})
+                    for id_product in data['products']:
+                        products[id_product] = products.get(id_product, 0) + 1
 
+    for username, products in baskets.items():
+        yield username, dict(list(products.items())[-max_items:]) if max_items else products
 
-def view_in_cart(request) -> dict:
+
+def view_in_cart(username: str) -> dict:
     """
     Просматривает содержимое cart.json
 
-    :param request: Объект запроса.
+    :param username: Имя пользователя, для которого создаётся пустая запись, если файла базы ещё нет.
     :return: Содержимое 'cart.json'
     """
-    if os.path.exists('cart.json'):  # Если файл существует
-        with open('cart.json', encoding='utf-8') as f:
-            return json.load(f)
+    if (data := read_users(CART_FILE)) is not None:  # Если файл существует
+        return write_behind.overlay(CART_FILE, data) if write_behind.enabled() else data
 
-    user = get_user(request).username  # Получаем авторизированного пользователя
-    cart = {user: {'products': {}}}  # Создаём пустую корзину
-    with open('cart.json', mode='x', encoding='utf-8') as f:  # Создаём файл и записываем туда пустую корзину
+    cart = {username: {'products': {}}}  # Создаём пустую корзину
+    with open(CART_FILE, mode='x', encoding='utf-8') as f:  # Создаём файл и записываем туда пустую корзину
         json.dump(cart, f)
 
     return cart
 
 
-def add_to_cart(request, id_product: str) -> bool:
+def add_to_cart(user, id_product: str) -> bool:
     """
     Добавляет продукт в корзину. Если в корзине нет данного продукта, то добавляет его с количеством равное 1.
     Если в корзине есть такой продукт, то добавляет количеству данного продукта + 1.
 
-    :param request: Объект запроса.
+    :param user: Пользователь запроса (request.user).
     :param id_product: Идентификационный номер продукта в виде строки.
     :return: Возвращает True в случае успешного добавления, а False в случае неуспешного добавления(товара по id_product
     не существует).
     """
-    cart_users = view_in_cart(request)
-    cart = cart_users[get_user(request).username]  # получить корзину авторизированного пользователя
+    if use_db():
+        if not product_exists_db(id_product):
+            return False
+        item, created = CartItem.objects.get_or_create(user=user, product_id=int(id_product))
+        if not created:  # Увеличение количества на стороне базы, без гонки между запросами
+            CartItem.objects.filter(pk=item.pk).update(quantity=F('quantity') + 1)
+        else:
+            _basket_changed(user.username, id_product, 1)
+        return True
+
+    # получить корзину авторизированного пользователя
+    cart_users, cart = load_user(user.username, view_in_cart, CART_FILE, CART_SNAPSHOT_FILE, {'products': {}})
 
     # ! Обратите внимание, что в переменной cart находится словарь с ключом products.
     # ! Именно в cart["products"] лежит словарь гдк по id продуктов можно получить число продуктов в корзине.
@@ -163,37 +509,49 @@ def add_to_cart(request, id_product: str) -> bool:
 
     # Проверьте, а существует ли такой товар в корзине, если нет,
     # то перед тем как его добавить - проверьте есть ли такой id_product товара
-    # в вашей базе данных DATABASE, чтобы уберечь себя от добавления несуществующего товара.
+    # в каталоге товаров, чтобы уберечь себя от добавления несуществующего товара.
     # Если товар существует, то увеличиваем его количество на 1
     # Не забываем записать обновленные данные cart в 'cart.json'. Так как именно из этого файла мы считываем данные и если мы не запишем изменения, то считать измененные данные не получится.
 
     if id_product not in cart.get('products'):
-        if id_product not in DATABASE:
+        if id_product not in get_catalog().products:
             return False
         else:
             cart['products'][id_product] = 1
     else:
         cart['products'][id_product] += 1
 
-    with open('cart.json', mode='w', encoding='utf-8') as f:  # Записываем данные в корзину
-        json.dump(cart_users, f)
+    # Записываем данные в корзину
+    save_user(cart_users, user.username, ('add', id_product), CART_FILE)
+    if cart['products'][id_product] == 1:  # Товар добавлен в корзину, а не увеличено количество
+        _basket_changed(user.username, id_product, 1)
 
     return True
 
 
-def remove_from_cart(request, id_product: str) -> bool:
+def remove_from_cart(user, id_product: str) -> bool:
     """
     Удаляет позицию продукта из корзины. Если в корзине есть такой продукт, то удаляется ключ в словаре
     с этим продуктом.
 
-    :param request: Объект запроса.
+    :param user: Пользователь запроса (request.user).
     :param id_product: Идентификационный номер продукта в виде строки.
     :return: Возвращает True в случае успешного удаления, а False в случае неуспешного удаления(товара по id_product
     не существует).
     """
-    cart_users = view_in_cart(request)  # Помните, что у вас есть уже реализация просмотра корзины,
+    if not user.is_authenticated:  # У анонимного пользователя нет корзины
+        return False
+    if use_db():
+        if not id_product.isdigit():
+            return False
+        deleted, _ = CartItem.objects.filter(user=user, product_id=int(id_product)).delete()
+        if deleted:
+            _basket_changed(user.username, id_product, -1)
+        return bool(deleted)
+
+    # Помните, что у вас есть уже реализация просмотра корзины,
     # поэтому, чтобы загрузить данные из корзины, не нужно заново писать код.
-    cart = cart_users[get_user(request).username]
+    cart_users, cart = load_user(user.username, view_in_cart, CART_FILE, CART_SNAPSHOT_FILE, {'products': {}})
 
     # С переменной cart функции remove_from_cart ситуация аналогичная, что с cart функции add_to_cart
     # Проверьте, а существует ли такой товар в корзине, если нет, то возвращаем False.
@@ -205,12 +563,93 @@ def remove_from_cart(request, id_product: str) -> bool:
     else:
         del cart['products'][id_product]
 
-    with open('cart.json', mode='w', encoding='utf-8') as f:  # Записываем данные в корзину
-        json.dump(cart_users, f)
+    # Записываем данные в корзину
+    save_user(cart_users, user.username, ('remove', id_product), CART_FILE)
+    _basket_changed(user.username, id_product, -1)
 
     return True
 
 
+def to_minor(value: float | int | str | Decimal) -> int:
+    """
+    Переводит сумму в рублях в целое число копеек (с округлением половины вверх), чтобы расчёты
+    не накапливали погрешность float.
+
+    :param value: Сумма в рублях.
+    :return: Сумма в копейках.
+    """
+    return int((Decimal(str(value)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_minor(value: int) -> str:
+    """
+    Форматирует сумму в копейках как рубли с двумя знаками после точки.
+
+    :param value: Сумма в копейках.
+    :return: Строка вида '210.00'.
+    """
+    sign = '-' if value < 0 else ''
+    rubles, kopecks = divmod(abs(value), 100)
+    return f"{sign}{rubles}.{kopecks:02d}"
+
+
+def _price_cart(catalog: Catalog, items: tuple[tuple[str, int], ...],
+                discount_percent: int, delivery: int | None) -> dict:
+    """
+    Расчёт стоимости корзины по ценам снимка каталога. Результат мемоизируется в самом снимке
+    (индекс 'cart_prices'): ключ - состав корзины, скидка купона и стоимость доставки, поэтому повторный расчёт
+    той же корзины не выполняется, а с заменой снимка кеш освобождается вместе со старыми ценами.
+    Возвращаемый словарь общий для всех вызовов с тем же ключом, его нельзя изменять.
+    """
+    lines = []
+    subtotal = 0
+    for id_product, quantity in items:
+        product = catalog.get(id_product)
+        if product is None:  # Товар убран из каталога
+            continue
+        price = to_minor(product['price_after'])
+        lines.append({'id': product['id'], 'name': product['name'], 'quantity': quantity,
+                      'price': price, 'total': price * quantity})
+        subtotal += price * quantity
+    discount = (subtotal * discount_percent + 50) // 100  # Округление половины копейки вверх
+    return {'currency': 'RUB',
+            'minor_units': 100,
+            'catalog_version': catalog.version,
+            'lines': lines,
+            'subtotal': subtotal,
+            'discount_percent': discount_percent,
+            'discount': discount,
+            'delivery': delivery,
+            'total': subtotal - discount + (delivery or 0)}
+
+
+register_index('cart_prices', lambda catalog: lru_cache(maxsize=1024)(partial(_price_cart, catalog)))
+
+
+def calculate_cart_total(cart: dict, coupon: str | None = None, country: str | None = None,
+                         city: str | None = None, region: str | None = None, code: str | None = None) -> dict:
+    """
+    Рассчитывает стоимость корзины на сервере: позиции, промежуточный итог, скидку по купону,
+    доставку и итог. Все суммы - целые числа в копейках.
+
+    :param cart: Корзина пользователя вида {'products': {id: количество}}.
+    :param coupon: [Опционально] Код купона. Недействительный, неизвестный или исчерпавший лимит применений
+                   купон не даёт скидки.
+    :param country: [Опционально] Страна доставки. Без страны доставка не рассчитывается.
+    :param city: [Опционально] Город доставки.
+    :param region: [Опционально] Регион доставки.
+    :param code: [Опционально] Почтовый индекс.
+    :return: Словарь с ключами lines, subtotal, discount_percent, discount, delivery (None - не рассчитана
+             или недоступна), total и др.
+    """
+    data_coupon = get_coupon(coupon) if coupon else None
+    discount_percent = data_coupon.value if data_coupon is not None and data_coupon.is_valid() else 0
+    delivery = delivery_price(country, city, region, code) if country else None
+    delivery = to_minor(delivery) if delivery is not None else None
+    items = tuple((str(id_product), quantity) for id_product, quantity in cart['products'].items())
+    return get_catalog().index('cart_prices')(items, discount_percent, delivery)
+
+
 def filtering_category(database: dict[str, dict],
                        category_key: [None, str] = None,
                        ordering_key: [None, str] = None,
@@ -218,7 +657,7 @@ def filtering_category(database: dict[str, dict],
     """
     Функция фильтрации данных по параметрам
 
-    :param database: База данных. (словарь словарей. При проверке в качестве database будет передаваться словарь DATABASE из models.py)
+    :param database: База данных. (словарь словарей, например get_catalog().products)
     :param category_key: [Опционально] Ключ для группировки категории. Если нет ключа, то рассматриваются все товары.
     :param ordering_key: [Опционально] Ключ по которому будет произведена сортировка результата.
     :param reverse: [Опционально] Выбор направления сортировки:
@@ -0,0 +1,191 @@
+"""
+Бинарные снимки баз корзин и избранного с индексом по пользователям.
+
+Формат файла снимка:
+    - заголовок (56 байт): сигнатура b'USRSNAP2', число слотов хеш-таблицы, смещение таблицы, число записей
+      и отметка исходного JSON-файла (время изменения, размер, inode), из которого построен снимок;
+    - записи: для каждого пользователя JSON-массив [имя пользователя, данные] в UTF-8;
+    - хеш-таблица с открытой адресацией: слоты вида (хеш имени, смещение записи, длина записи).
+
+Чтение идёт через mmap: для ответа об одном пользователе вычисляется хеш имени, по таблице находится
+смещение записи и декодируется только она. Страницы файла разделяются между процессами через кеш ОС.
+
+Снимок не обновляется при каждом изменении базы: запись меняет только JSON-файл, а снимок пересоздаётся при первом
+чтении после неё (см. is_fresh). Отметка файла берётся до его чтения, поэтому изменение файла во время построения
+снимка не остаётся незамеченным. Сравниваются не только время изменения, но и размер и inode: перезапись файла
+с тем же временем изменения (грубое время в файловой системе, os.utime, копирование с сохранением времени)
+тоже делает снимок устаревшим.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from hashlib import blake2b
+from typing import Iterable
+
+from logic import metrics
+
+MAGIC = b'USRSNAP2'
+# сигнатура, число слотов, смещение таблицы, число записей, отметка исходного файла (время изменения, размер, inode)
+HEADER = struct.Struct('<8sQQQqQQ')
+NO_SOURCE = (0, 0, 0)  # Отметка снимка, построенного не из файла
+SLOT = struct.Struct('<QQQ')  # хеш имени, смещение записи, длина записи (0 - пустой слот)
+
+_readers = {}  # Кеш открытых снимков: путь -> SnapshotReader
+
+
+def _hash_key(username: str) -> int:
+    """
+    Стабильный между процессами 64-битный хеш имени пользователя.
+
+    :param username: Имя пользователя.
+    :return: Хеш в виде целого числа.
+    """
+    return int.from_bytes(blake2b(username.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def source_stamp(path: str) -> tuple[int, int, int] | None:
+    """
+    Отметка версии исходного JSON-файла для сравнения со снимком.
+
+    :param path: Путь к файлу.
+    :return: (время изменения в нс, размер, inode) или None, если файла нет.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def write_snapshot(path: str, users: dict | Iterable[tuple[str, dict]],
+                   source: tuple[int, int, int] | None = None) -> int:
+    """
+    Записывает снимок базы пользователей. Записи пишутся потоково, поэтому в памяти держится
+    только индекс (три числа на пользователя), а не данные всех пользователей.
+    Файл заменяется атомарно, читатели никогда не видят наполовину записанный снимок.
+
+    :param path: Путь к файлу снимка.
+    :param users: Словарь {имя пользователя: данные} или итерируемый объект пар (имя, данные).
+    :param source: [Опционально] Отметка JSON-файла (source_stamp), взятая до его чтения: записывается
+                   в заголовок снимка для is_fresh.
+    :return: Количество записанных пользователей.
+    """
+    items = users.items() if isinstance(users, dict) else users
+    hashes, offsets, lengths = array('Q'), array('Q'), array('Q')
+
+    started = metrics.clock()
+    tmp_path = f'{path}.tmp{os.getpid()}.{threading.get_ident()}'  # Уникален для потока
+    with open(tmp_path, mode='wb') as f:
+        f.write(bytes(HEADER.size))  # Место под заголовок, заполняется в конце
+        offset = HEADER.size
+        for username, data in items:
+            record = json.dumps([username, data], ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            f.write(record)
+            hashes.append(_hash_key(username))
+            offsets.append(offset)
+            lengths.append(len(record))
+            offset += len(record)
+
+        slot_count = 8
+        while slot_count < len(hashes) * 2:  # Заполненность таблицы не больше половины
+            slot_count *= 2
+        mask = slot_count - 1
+        table = bytearray(slot_count * SLOT.size)
+        for key_hash, record_offset, length in zip(hashes, offsets, lengths):
+            slot = key_hash & mask
+            while SLOT.unpack_from(table, slot * SLOT.size)[2]:  # Линейное пробирование до пустого слота
+                slot = (slot + 1) & mask
+            SLOT.pack_into(table, slot * SLOT.size, key_hash, record_offset, length)
+        f.write(table)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, slot_count, offset, len(hashes), *(source or NO_SOURCE)))
+    os.replace(tmp_path, path)
+    metrics.storage_io('write', path, offset + len(table), started)
+    return len(hashes)
+
+
+class SnapshotReader:
+    """
+    Читатель снимка, отображённого в память. Поиск записи пользователя выполняется за O(1)
+    от числа пользователей и не читает другие записи.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, mode='rb') as f:
+            stat = os.fstat(f.fileno())
+            self.stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER.size or self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError(f"Файл {path} не является снимком пользователей")
+        _, self.slot_count, self.table_offset, self.record_count, *source = HEADER.unpack_from(self._mm, 0)
+        self.source = tuple(source)  # Отметка исходного файла, см. source_stamp
+
+    def get(self, username: str) -> dict | None:
+        """
+        Возвращает данные пользователя из снимка.
+
+        :param username: Имя пользователя.
+        :return: Данные пользователя или None, если пользователя нет в снимке.
+        """
+        started = metrics.clock()
+        key_hash = _hash_key(username)
+        mask = self.slot_count - 1
+        slot = key_hash & mask
+        for _ in range(self.slot_count):
+            slot_hash, offset, length = SLOT.unpack_from(self._mm, self.table_offset + slot * SLOT.size)
+            if not length:
+                return None
+            if slot_hash == key_hash:
+                name, data = json.loads(self._mm[offset:offset + length])
+                if name == username:
+                    metrics.storage_io('read', self.path, length, started)
+                    return data
+            slot = (slot + 1) & mask
+        return None
+
+
+def _reader(path: str) -> SnapshotReader:
+    """Открытый снимок из кеша; переоткрывается, только если файл был заменён."""
+    stat = os.stat(path)
+    reader = _readers.get(path)
+    if reader is None or reader.stamp != (stat.st_mtime_ns, stat.st_size, stat.st_ino):
+        # Старый читатель не закрывается явно: им ещё может пользоваться другой поток,
+        # отображение будет освобождено сборщиком мусора
+        reader = _readers[path] = SnapshotReader(path)
+    return reader
+
+
+def read_user(path: str, username: str) -> dict | None:
+    """
+    Читает данные одного пользователя из снимка. Открытый снимок кешируется и переоткрывается,
+    только если файл был заменён.
+
+    :param path: Путь к файлу снимка.
+    :param username: Имя пользователя.
+    :return: Данные пользователя или None, если пользователя нет в снимке.
+    """
+    return _reader(path).get(username)
+
+
+def is_fresh(snapshot_path: str, source_path: str) -> bool:
+    """
+    Проверяет, что снимок существует и построен из текущей версии исходного JSON-файла: отметка файла
+    в заголовке снимка (время изменения, размер, inode) совпадает с текущей (см. write_snapshot, source).
+    Снимок старого формата или повреждённый файл считаются устаревшими.
+
+    :param snapshot_path: Путь к файлу снимка.
+    :param source_path: Путь к исходному JSON-файлу.
+    :return: True, если снимком можно пользоваться.
+    """
+    if (stamp := source_stamp(source_path)) is None:
+        return False
+    try:
+        return _reader(snapshot_path).source == stamp
+    except (OSError, ValueError):
+        return False
@@ -0,0 +1,127 @@
+"""
+Бэкенд кеша Django в файле SQLite, общий для всех процессов на одном сервере.
+
+В отличие от файлового кеша Django операция add атомарна (INSERT ... ON CONFLICT в одной транзакции),
+поэтому на ней можно строить блокировки между процессами (см. logic.cache.get_or_set). Целые числа хранятся
+без pickle, и incr выполняется одним UPDATE ... RETURNING (нужен SQLite 3.35+): одновременные увеличения
+счётчика из разных процессов не теряются (поколения пространств имён, logic.cache.invalidate).
+Файл открывается в режиме WAL: чтения не ждут записей. У каждого потока своё соединение,
+после fork соединение открывается заново.
+
+Подключение:
+    CACHES = {'default': {'BACKEND': 'logic.sqlite_cache.SQLiteCache', 'LOCATION': '/path/cache.sqlite3'}}
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+CULL_PROBABILITY = 0.01  # Доля операций записи, после которых удаляются просроченные и лишние записи
+INTEGER_RANGE = range(-2 ** 63, 2 ** 63)  # Целые, которые помещаются в INTEGER SQLite
+
+
+def _dumps(value):
+    """Целые числа сохраняются как INTEGER SQLite (для атомарного incr), остальные значения - через pickle."""
+    if type(value) is int and value in INTEGER_RANGE:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _loads(value):
+    return value if isinstance(value, int) else pickle.loads(value)
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = str(location)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока (после fork - новое)."""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')  # Кеш можно потерять при сбое питания
+            connection.execute('CREATE TABLE IF NOT EXISTS cache '
+                               '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None) -> bool:
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'INSERT INTO cache VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE '
+            'SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',  # Просроченная запись считается отсутствующей
+            (key, _dumps(value), self.get_backend_timeout(timeout), time.time()))
+        self._maybe_cull()
+        return cursor.rowcount > 0
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute('SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                                         (key, time.time())).fetchone()
+        return default if row is None else _loads(row[0])
+
+    def get_many(self, keys, version=None) -> dict:
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not keys:
+            return {}
+        rows = self._connection().execute(
+            f"SELECT key, value FROM cache WHERE key IN ({', '.join('?' * len(keys))}) "
+            f"AND (expires IS NULL OR expires > ?)", (*keys, time.time()))
+        return {keys[key]: _loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None) -> None:
+        key = self.make_and_validate_key(key, version=version)
+        self._connection().execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                                   (key, _dumps(value), self.get_backend_timeout(timeout)))
+        self._maybe_cull()
+
+    def incr(self, key, delta=1, version=None) -> int:
+        full_key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            "UPDATE cache SET value = value + ? WHERE key = ? AND typeof(value) = 'integer' "
+            "AND (expires IS NULL OR expires > ?) RETURNING value", (delta, full_key, time.time())).fetchone()
+        if row is not None:
+            return row[0]
+        if not self.has_key(key, version=version):
+            raise ValueError(f"Key '{full_key}' not found")
+        # Значение сохранено через pickle (не целое или записано старой версией бэкенда): get + set, как в BaseCache
+        return super().incr(key, delta, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None) -> bool:
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()))
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None) -> bool:
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount > 0
+
+    def has_key(self, key, version=None) -> bool:
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute('SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                                          (key, time.time())).fetchone() is not None
+
+    def clear(self) -> None:
+        self._connection().execute('DELETE FROM cache')
+
+    def _maybe_cull(self) -> None:
+        """Изредка удаляет просроченные записи и, если записей больше MAX_ENTRIES, - ближайшие к истечению."""
+        if random.random() >= CULL_PROBABILITY:
+            return
+        connection = self._connection()
+        connection.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            connection.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires IS NULL, '
+                               'expires LIMIT ?)', (count // self._cull_frequency,))
@@ -0,0 +1,88 @@
+"""
+Синтетические данные магазина для бенчмарков и нагрузочных тестов: каталог товаров в формате
+store/data/catalog.json и корзины/избранное пользователей в формате cart.json/wishlist.json.
+
+Генерация детерминирована: одинаковые параметры и seed дают одинаковые данные.
+Популярность товаров подчиняется закону Ципфа с показателем skew: вес товара с рангом r равен 1 / r ** skew
+(0 - все товары равновероятны, 1 и больше - небольшая доля товаров собирает большую часть корзин).
+"""
+import random
+from itertools import accumulate
+from typing import Iterator
+
+# Категория -> (латинское имя для slug, список (название товара, slug))
+CATEGORIES = {
+    'Овощи': ('vegetables', [('Перец', 'pepper'), ('Томаты', 'tomato'), ('Огурцы', 'cucumber'),
+                             ('Морковь', 'carrot'), ('Капуста', 'cabbage'), ('Картофель', 'potato')]),
+    'Фрукты': ('fruits', [('Яблоки', 'apple'), ('Груши', 'pear'), ('Апельсины', 'orange'),
+                          ('Бананы', 'banana'), ('Виноград', 'grape'), ('Манго', 'mango')]),
+    'Соки': ('juices', [('Сок яблочный', 'apple_juice'), ('Сок апельсиновый', 'orange_juice'),
+                        ('Сок томатный', 'tomato_juice'), ('Нектар персиковый', 'peach_nectar')]),
+    'Ягоды': ('berries', [('Клубника', 'strawberry'), ('Малина', 'raspberry'), ('Черника', 'blueberry'),
+                          ('Смородина', 'currant')]),
+    'Зелень': ('greens', [('Укроп', 'dill'), ('Петрушка', 'parsley'), ('Базилик', 'basil'),
+                          ('Шпинат', 'spinach')]),
+}
+ADJECTIVES = ('свежие', 'отборные', 'фермерские', 'сладкие', 'сочные', 'органические', 'местные', 'сезонные')
+DESCRIPTIONS = ("Выращено без спешки и собрано в срок.", "Подходит для салатов и гарниров.",
+                "Яркий вкус и аромат на каждый день.", "Хранить в прохладном месте.")
+IMAGES = 12  # Количество картинок товаров в store/static/store/images
+
+
+def generate_products(count: int, seed: int = 0) -> Iterator[dict]:
+    """
+    Генерирует товары со всеми полями каталога (см. store.catalog.REQUIRED_FIELDS), id с 1 по count.
+
+    :param count: Количество товаров.
+    :param seed: Начальное значение генератора случайных чисел.
+    :return: Итератор словарей товаров.
+    """
+    rng = random.Random(seed)
+    categories = list(CATEGORIES.items())
+    for id_product in range(1, count + 1):
+        category, (category_slug, items) = rng.choice(categories)
+        name, slug = rng.choice(items)
+        discount = rng.choice((0, 0, 5, 10, 15, 20, 30, 50))
+        price_before = float(rng.randrange(50, 1000, 10))
+        yield {
+            'name': f"{name} {rng.choice(ADJECTIVES)}",
+            'discount': discount,
+            'price_before': price_before,
+            'price_after': round(price_before * (100 - discount) / 100, 2),
+            'description': rng.choice(DESCRIPTIONS),
+            'rating': round(rng.uniform(3.0, 5.0), 1),
+            'review': rng.randint(0, 1000),
+            'sold_value': int(rng.paretovariate(1.5) * 10),
+            'weight_in_stock': rng.randint(0, 1000),
+            'category': category,
+            'id': id_product,
+            'url': f"store/images/product-{(id_product - 1) % IMAGES + 1}.jpg",
+            'html': f"{category_slug}_{slug}_{id_product}",
+        }
+
+
+def generate_baskets(users: int, products: int, seed: int = 0, skew: float = 1.0,
+                     cart_size: int = 5, wishlist_size: int = 5) -> Iterator[tuple[str, dict, dict]]:
+    """
+    Генерирует корзины и избранное пользователей user1 ... userN по одному пользователю за раз.
+    Размер корзины и избранного каждого пользователя равномерно распределён от 0 до удвоенного среднего.
+
+    :param users: Количество пользователей.
+    :param products: Количество товаров в каталоге (id с 1 по products).
+    :param seed: Начальное значение генератора случайных чисел.
+    :param skew: Показатель закона Ципфа для популярности товаров.
+    :param cart_size: Среднее количество позиций в корзине.
+    :param wishlist_size: Среднее количество товаров в избранном.
+    :return: Итератор (имя пользователя, {'products': {id: количество}}, {'products': [id, ...]}).
+    """
+    rng = random.Random(seed)
+    ranking = [str(id_product) for id_product in range(1, products + 1)]
+    rng.shuffle(ranking)  # Самые популярные товары разбросаны по каталогу, а не идут первыми
+    cum_weights = list(accumulate(1 / rank ** skew for rank in range(1, products + 1)))
+
+    for number in range(1, users + 1):
+        cart = {}
+        for id_product in rng.choices(ranking, cum_weights=cum_weights, k=rng.randint(0, 2 * cart_size)):
+            cart[id_product] = cart.get(id_product, 0) + 1
+        wishlist = rng.choices(ranking, cum_weights=cum_weights, k=rng.randint(0, 2 * wishlist_size))
+        yield f'user{number}', {'products': cart}, {'products': list(dict.fromkeys(wishlist))}
@@ -0,0 +1,441 @@
+import datetime
+import json
+import multiprocessing
+import os
+import threading
+import tempfile
+import uuid
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.test import SimpleTestCase, override_settings
+from django.test.client import AsyncClient
+from django.utils.translation import gettext_lazy
+
+from logic import cache, http, ratelimit, snapshot, warmup, write_behind
+from logic.ratelimit import MemoryStore, Rule, SQLiteStore
+from logic.sqlite_cache import SQLiteCache
+from logic.services import calculate_cart_total, format_minor, to_minor
+from store import recommendations
+from store.catalog import get_catalog
+
+
+class TempDirMixin:
+    """Временный каталог для файлов теста."""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+
+class SnapshotTests(TempDirMixin, SimpleTestCase):
+    """Снимок базы пользователей: хеш-таблица с открытой адресацией поверх mmap."""
+
+    def test_every_user_is_found(self):
+        users = {f'user{number}': {'products': {str(number): number}} for number in range(1000)}
+        path = os.path.join(self.tmp, 'cart.snap')
+        self.assertEqual(snapshot.write_snapshot(path, users), len(users))
+        for username, data in users.items():
+            self.assertEqual(snapshot.read_user(path, username), data)
+
+    def test_missing_user(self):
+        path = os.path.join(self.tmp, 'cart.snap')
+        snapshot.write_snapshot(path, {'user': {'products': {}}})
+        self.assertIsNone(snapshot.read_user(path, 'other'))
+
+    def test_empty_snapshot(self):
+        path = os.path.join(self.tmp, 'cart.snap')
+        snapshot.write_snapshot(path, {})
+        self.assertIsNone(snapshot.read_user(path, 'user'))
+
+    def test_replaced_snapshot_is_reopened(self):
+        path = os.path.join(self.tmp, 'cart.snap')
+        snapshot.write_snapshot(path, {'user': {'products': {'1': 1}}})
+        self.assertEqual(snapshot.read_user(path, 'user'), {'products': {'1': 1}})
+        snapshot.write_snapshot(path, {'user': {'products': {'1': 2}}})
+        self.assertEqual(snapshot.read_user(path, 'user'), {'products': {'1': 2}})
+
+    def write_source(self, source: str, data: dict, mtime_ns: int | None = None) -> None:
+        """Заменяет файл новым (как save_users), при необходимости с прежним временем изменения."""
+        with open(f'{source}.tmp', mode='w', encoding='utf-8') as f:
+            json.dump(data, f)
+        if mtime_ns is not None:
+            os.utime(f'{source}.tmp', ns=(mtime_ns, mtime_ns))
+        os.replace(f'{source}.tmp', source)
+
+    def test_is_fresh_follows_source(self):
+        source, path = os.path.join(self.tmp, 'cart.json'), os.path.join(self.tmp, 'cart.snap')
+        self.assertFalse(snapshot.is_fresh(path, source))
+        self.write_source(source, {'user': {'products': {'1': 1}}})
+        snapshot.write_snapshot(path, {'user': {'products': {'1': 1}}}, snapshot.source_stamp(source))
+        self.assertTrue(snapshot.is_fresh(path, source))
+        os.utime(source, ns=(os.stat(source).st_mtime_ns + 1,) * 2)  # Файл изменён после построения снимка
+        self.assertFalse(snapshot.is_fresh(path, source))
+
+    def test_same_mtime_rewrite_is_stale(self):
+        source, path = os.path.join(self.tmp, 'cart.json'), os.path.join(self.tmp, 'cart.snap')
+        self.write_source(source, {'user': {'products': {'1': 1}}})
+        snapshot.write_snapshot(path, {'user': {'products': {'1': 1}}}, snapshot.source_stamp(source))
+        mtime_ns = os.stat(source).st_mtime_ns
+        self.write_source(source, {'user': {'products': {'1': 2}}}, mtime_ns)  # Тот же размер и время изменения
+        self.assertFalse(snapshot.is_fresh(path, source))
+        snapshot.write_snapshot(path, {'user': {'products': {'1': 2}}}, snapshot.source_stamp(source))
+        self.assertTrue(snapshot.is_fresh(path, source))
+        with open(source, mode='a', encoding='utf-8') as f:  # Дописан на месте: inode прежний, размер другой
+            f.write(' ')
+        os.utime(source, ns=(mtime_ns, mtime_ns))
+        self.assertFalse(snapshot.is_fresh(path, source))
+
+    def test_old_format_is_stale(self):
+        source, path = os.path.join(self.tmp, 'cart.json'), os.path.join(self.tmp, 'cart.snap')
+        self.write_source(source, {})
+        with open(path, mode='wb') as f:
+            f.write(b'USRSNAP1' + bytes(24))
+        self.assertFalse(snapshot.is_fresh(path, source))
+
+
+class MoneyTests(SimpleTestCase):
+    """Суммы в копейках: без погрешности float и с округлением половины копейки вверх."""
+
+    def test_to_minor(self):
+        self.assertEqual(to_minor(0.1) * 3, to_minor(0.3))
+        self.assertEqual(to_minor('2.675'), 268)
+        self.assertEqual(to_minor(Decimal('19.99')), 1999)
+        self.assertEqual(to_minor(210), 21000)
+
+    def test_format_minor(self):
+        self.assertEqual(format_minor(21000), '210.00')
+        self.assertEqual(format_minor(5), '0.05')
+        self.assertEqual(format_minor(-5), '-0.05')
+
+    def test_cart_total(self):
+        totals = calculate_cart_total({'products': {'1': 3, '2': 1, 'missing': 5}})
+        prices = {line['id']: line['price'] for line in totals['lines']}
+        self.assertEqual(set(prices), {1, 2})
+        self.assertEqual(totals['subtotal'], prices[1] * 3 + prices[2])
+        self.assertEqual(totals['total'], totals['subtotal'])
+        self.assertIsNone(totals['delivery'])
+
+    def test_cart_total_with_coupon(self):
+        totals = calculate_cart_total({'products': {'1': 1}}, coupon='coupon')
+        self.assertEqual(totals['discount_percent'], 10)
+        self.assertEqual(totals['discount'], (totals['subtotal'] * 10 + 50) // 100)
+        self.assertEqual(totals['total'], totals['subtotal'] - totals['discount'])
+
+    def test_cart_total_is_memoized(self):
+        cart = {'products': {'1': 2}}
+        self.assertIs(calculate_cart_total(cart), calculate_cart_total(dict(cart)))
+
+
+class RateLimitStoreTests(TempDirMixin, SimpleTestCase):
+    """Корзина токенов GCRA: burst запросов подряд, затем один запрос на interval секунд."""
+
+    def check_store(self, store):
+        now, interval, burst = 1000.0, 1.0, 3
+        for _ in range(burst):
+            self.assertTrue(store.consume('key', now, interval, burst)[0])
+        allowed, tat = store.consume('key', now, interval, burst)
+        self.assertFalse(allowed)
+        self.assertEqual(tat, now + burst * interval)
+        self.assertTrue(store.consume('other', now, interval, burst)[0])  # У другого ключа своя корзина
+        self.assertTrue(store.consume('key', now + interval, interval, burst)[0])
+        self.assertFalse(store.consume('key', now + interval, interval, burst)[0])
+        self.assertTrue(store.consume('key', now + 100, interval, burst)[0])  # Корзина снова полная
+        for _ in range(burst - 1):
+            store.consume('key', now + 100, interval, burst)
+        self.assertFalse(store.consume('key', now + 100, interval, burst)[0])
+        store.refund('key', interval)  # Запрос отклонило другое правило
+        self.assertTrue(store.consume('key', now + 100, interval, burst)[0])
+
+    def test_memory_store(self):
+        self.check_store(MemoryStore())
+
+    def test_sqlite_store(self):
+        self.check_store(SQLiteStore(os.path.join(self.tmp, 'ratelimit.sqlite3')))
+
+
+@override_settings(METRICS_ENABLED=False)
+class AdmitTests(TempDirMixin, SimpleTestCase):
+    """Решения по всем правилам маршрута: отклонённый запрос не расходует токены других правил."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(ratelimit, '_store', MemoryStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rejected_request_refunds_other_rules(self):
+        wide, narrow = Rule('wide', rate=0.001, burst=3), Rule('narrow', rate=0.001, burst=1, scope='global')
+        self.assertIsNone(ratelimit.admit([wide, narrow], 'user:1')[0])
+        for _ in range(5):
+            self.assertEqual(ratelimit.admit([wide, narrow], 'user:1')[0].status_code, 429)
+        # У правила wide забран только один токен - пропущенным запросом
+        self.assertEqual([ratelimit.admit([wide], 'user:1')[0] for _ in range(2)], [None, None])
+        self.assertEqual(ratelimit.admit([wide], 'user:1')[0].status_code, 429)
+
+    def test_concurrency(self):
+        rule = Rule('slots', concurrency=1)
+        response, acquired = ratelimit.admit([rule], None)
+        self.assertIsNone(response)
+        self.assertEqual(ratelimit.admit([rule], None)[0].status_code, 503)
+        ratelimit.release(acquired)
+        self.assertIsNone(ratelimit.admit([rule], None)[0])
+        ratelimit.release([rule])
+
+    @override_settings(RATELIMIT_ENABLED=True, RATELIMIT_RULES={'upstream': {'scope': 'global', 'rate': 0.001}})
+    def test_limit(self):
+        with ratelimit.limit('upstream'):
+            pass
+        with self.assertRaises(ratelimit.RateLimited) as raised, ratelimit.limit('upstream'):
+            self.fail("Вызов сверх квоты выполнен")
+        self.assertEqual(raised.exception.response.status_code, 429)
+
+    @override_settings(RATELIMIT_ENABLED=True, RATELIMIT_STORE='sqlite',
+                       RATELIMIT_RULES={'cart_write': {'routes': ('cart/add/<str:id_product>',),
+                                                       'rate': 0.001, 'burst': 1}})
+    async def test_async_middleware_does_not_block_event_loop(self):
+        loop_thread = threading.current_thread()
+        store = SQLiteStore(os.path.join(self.tmp, 'ratelimit.sqlite3'))
+        threads = []
+        consume = store.consume
+
+        def record_consume(*args):
+            threads.append(threading.current_thread())
+            return consume(*args)
+
+        client = AsyncClient()
+        with mock.patch.object(ratelimit, '_store', store), mock.patch.object(store, 'consume', record_consume):
+            self.assertNotEqual((await client.get('/cart/add/1')).status_code, 429)
+            self.assertEqual((await client.get('/cart/add/1')).status_code, 429)
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(loop_thread, threads)
+
+
+@override_settings(WRITE_BEHIND_ENABLED=True, WRITE_BEHIND_INTERVAL=3600, WRITE_BEHIND_MAX_PENDING=1000)
+class WriteBehindTests(TempDirMixin, SimpleTestCase):
+    """Отложенная запись: операции буфера применяются к записи, перечитанной из файла."""
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.tmp, 'cart.json')
+        self.addCleanup(write_behind.flush)
+
+    def write(self, data: dict) -> None:
+        with open(self.path, mode='w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+    def read(self) -> dict:
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_apply(self):
+        data = write_behind.apply(None, [('init', {'products': {}}), ('add', '1'), ('add', '1'), ('add', '2'),
+                                         ('remove', '2'), ('remove', '3')])
+        self.assertEqual(data, {'products': {'1': 2}})
+        self.assertEqual(write_behind.apply({'products': ['1']}, [('append', '1'), ('append', '2')]),
+                         {'products': ['1', '2']})
+        self.assertIsNone(write_behind.apply(None, [('remove', '1')]))
+        with self.assertRaises(ValueError):
+            write_behind.apply(None, [('unknown', '1')])
+
+    def test_flush_merges_changes_written_by_another_process(self):
+        self.write({'user': {'products': {'1': 1}}, 'other': {'products': {'5': 1}}})
+        write_behind.put(self.path, 'user', ('add', '1'))
+        write_behind.put(self.path, 'user', ('add', '2'))
+        self.assertEqual(write_behind.replay(self.path, 'user', {'products': {'1': 1}}),
+                         {'products': {'1': 2, '2': 1}})
+        # Другой процесс записал своё добавление того же товара, пока операции ждали в буфере
+        self.write({'user': {'products': {'1': 2}}, 'other': {'products': {'5': 1}}})
+        write_behind.flush()
+        self.assertEqual(self.read(), {'user': {'products': {'1': 3, '2': 1}}, 'other': {'products': {'5': 1}}})
+        self.assertEqual(write_behind.replay(self.path, 'user', None), None)  # Буфер пуст
+
+    def test_overlay(self):
+        self.write({'user': {'products': {'1': 1}}})
+        write_behind.put(self.path, 'new', ('init', {'products': {}}))
+        write_behind.put(self.path, 'user', ('remove', '1'))
+        self.assertEqual(write_behind.overlay(self.path, self.read()),
+                         {'user': {'products': {}}, 'new': {'products': {}}})
+
+
+@skipIf(http.orjson is None, "orjson не установлен")
+class JsonEncoderTests(SimpleTestCase):
+    """Ответы с orjson и со стандартным json совпадают по содержанию (запись float в экспоненте может отличаться)."""
+    DATA = {
+        'text': 'Болгарский перец "красный"\n',
+        'numbers': [0, -1, 2 ** 63, 1.5, 0.1, 1e-7, 12345678.9],
+        'decimal': Decimal('19.90'),
+        'datetime': datetime.datetime(2024, 1, 2, 3, 4, 5, 678000, tzinfo=datetime.timezone.utc),
+        'naive': datetime.datetime(2024, 1, 2, 3, 4, 5),
+        'date': datetime.date(2024, 1, 2),
+        'time': datetime.time(3, 4, 5),
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'lazy': gettext_lazy('Hello'),
+        'keys': {1: 'int', 'str': None, 'bool': True},
+        'nested': [{'a': []}, {}, [[]]],
+    }
+
+    @staticmethod
+    def encode(data) -> tuple[bytes, bytes]:
+        with override_settings(JSON_ENCODER='orjson'):
+            fast = http.dumps(data)
+        with override_settings(JSON_ENCODER='json'):
+            standard = http.dumps(data)
+        return fast, standard
+
+    def test_same_content(self):
+        fast, standard = self.encode(self.DATA)
+        self.assertEqual(json.loads(fast), json.loads(standard))
+
+    def test_same_bytes_for_catalog(self):
+        fast, standard = self.encode([dict(product) for product in get_catalog().products.values()])
+        self.assertEqual(fast, standard)
+
+    def test_response(self):
+        with override_settings(JSON_ENCODER='orjson'):
+            response = http.JsonResponse({'name': 'перец'})
+        self.assertEqual(response.content, '{"name":"перец"}'.encode())
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+
+@override_settings(RECOMMENDATIONS_REFRESH_INTERVAL=60)
+class WarmupTests(SimpleTestCase):
+    """Прогрев перед fork: таблицы строятся синхронно, потоки запускаются только в дочернем процессе."""
+
+    def setUp(self):
+        for name in ('_recommender', '_refresher'):
+            patcher = mock.patch.object(recommendations, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_no_threads_before_fork(self):
+        with mock.patch.object(recommendations.threading.Thread, 'start') as start, \
+                mock.patch.object(warmup.connections, 'close_all') as close_all:
+            result = warmup.warmup(freeze=False)
+        start.assert_not_called()
+        close_all.assert_called_once()
+        self.assertIsNotNone(recommendations._recommender.catalog_version)  # Таблица построена до fork
+        self.assertGreater(result['views'], 0)
+
+        with mock.patch.object(recommendations.threading.Thread, 'start') as start, \
+                mock.patch('store.catalog.start_watcher') as start_watcher:
+            warmup._after_fork_in_child()
+        start_watcher.assert_called_once()
+        start.assert_called_once()
+
+
+def _incr_many(backend: SQLiteCache, key: str, count: int) -> None:
+    for _ in range(count):
+        backend.incr(key)
+
+
+def _invalidate_many(namespace: str, count: int) -> None:
+    for _ in range(count):
+        cache.invalidate(namespace)
+
+
+def run_in_processes(target, *args, processes: int = 4) -> None:
+    """Запускает target в нескольких процессах (fork) одновременно и ждёт их завершения."""
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=target, args=args) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+@skipIf(not hasattr(os, 'fork'), "нужен fork")
+class SQLiteCacheTests(TempDirMixin, SimpleTestCase):
+    """Бэкенд кеша SQLite: целые числа без pickle и атомарный incr."""
+
+    def setUp(self):
+        super().setUp()
+        self.backend = SQLiteCache(os.path.join(self.tmp, 'cache.sqlite3'), {})
+
+    def test_incr(self):
+        self.backend.set('counter', 1)
+        self.assertEqual(self.backend.incr('counter'), 2)
+        self.assertEqual(self.backend.incr('counter', 5), 7)
+        self.assertEqual(self.backend.decr('counter'), 6)
+        self.assertEqual(self.backend.get('counter'), 6)
+        self.backend.set('float', 1.5)  # Значение через pickle
+        self.assertEqual(self.backend.incr('float'), 2.5)
+        self.backend.set('expired', 1, timeout=-1)
+        for key in ('missing', 'expired'):
+            with self.assertRaises(ValueError):
+                self.backend.incr(key)
+
+    def test_incr_is_atomic_across_processes(self):
+        self.backend.set('counter', 0, None)
+        run_in_processes(_incr_many, self.backend, 'counter', 200)
+        self.assertEqual(self.backend.get('counter'), 800)
+
+
+class CacheTests(TempDirMixin, SimpleTestCase):
+    """Кеш приложения на общем бэкенде SQLite: пространства имён, поколения, XFetch и блокировка пересчёта."""
+
+    def setUp(self):
+        super().setUp()
+        caches = {'default': {'BACKEND': 'logic.sqlite_cache.SQLiteCache',
+                              'LOCATION': os.path.join(self.tmp, 'cache.sqlite3')}}
+        override = self.settings(CACHES=caches, CACHE_LOCK_TIMEOUT=0.5)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_namespaces(self):
+        cache.set_value('catalog', 'key', 1)
+        self.assertEqual(cache.get('catalog', 'key'), 1)
+        self.assertIsNone(cache.get('weather', 'key'))
+        self.assertEqual(cache.get('weather', 'key', 'default'), 'default')
+        cache.delete('catalog', 'key')
+        self.assertIsNone(cache.get('catalog', 'key'))
+        self.assertTrue(cache.make_key('catalog', ('a', 1)).endswith(':a:1'))
+        self.assertTrue(cache.make_key('catalog', 'ключ с пробелом').isascii())
+        with self.assertRaises(ValueError):
+            cache.make_key('unknown', 'key')
+
+    def test_invalidate(self):
+        cache.set_value('catalog', 'key', 1)
+        cache.set_value('weather', 'key', 2)
+        cache.invalidate('catalog')
+        self.assertIsNone(cache.get('catalog', 'key'))
+        self.assertEqual(cache.get('weather', 'key'), 2)
+        cache.set_value('catalog', 'key', 3)
+        self.assertEqual(cache.get('catalog', 'key'), 3)
+
+    @skipIf(not hasattr(os, 'fork'), "нужен fork")
+    def test_concurrent_invalidations_are_not_lost(self):
+        generation = cache._generation('catalog')
+        run_in_processes(_invalidate_many, 'catalog', 200)
+        self.assertEqual(cache._generation('catalog'), generation + 800)
+
+    def test_early_recompute(self):
+        full_key = cache.make_key('catalog', 'key')
+        cache._store(full_key, 'old', 1, 1000)  # Срок через секунду, вычисление занимало 1000 с
+        with mock.patch.object(cache.random, 'random', return_value=0.5):
+            self.assertEqual(cache.get_or_set('catalog', 'key', lambda: 'new', beta=0), 'old')
+            self.assertEqual(cache.get_or_set('catalog', 'key', lambda: 'new'), 'new')
+        self.assertEqual(cache.get('catalog', 'key'), 'new')
+
+    def test_early_recompute_under_lock(self):
+        full_key = cache.make_key('catalog', 'key')
+        cache._store(full_key, 'old', 1, 1000)
+        cache._cache().add(f'{full_key}:lock', 1)  # Значение уже обновляет другой запрос
+        with mock.patch.object(cache.random, 'random', return_value=0.5):
+            self.assertEqual(cache.get_or_set('catalog', 'key', lambda: 'new', lock=True), 'old')
+
+    def test_lock_waits_for_result(self):
+        full_key = cache.make_key('catalog', 'key')
+        cache._cache().add(f'{full_key}:lock', 1)
+        threading.Timer(0.1, cache._store, (full_key, 'computed', 60, 0.0)).start()
+        compute = mock.Mock(return_value='own')
+        self.assertEqual(cache.get_or_set('catalog', 'key', compute, lock=True), 'computed')
+        compute.assert_not_called()
+
+    def test_lock_timeout(self):
+        full_key = cache.make_key('catalog', 'key')
+        cache._cache().add(f'{full_key}:lock', 1)  # Получивший блокировку так и не сохранил значение
+        self.assertEqual(cache.get_or_set('catalog', 'key', lambda: 'own', lock=True), 'own')
+        self.assertEqual(cache.get('catalog', 'key'), 'own')
@@ -0,0 +1,137 @@
+"""
+Прогрев процесса перед запуском обработчиков запросов.
+
+При запуске с предварительной загрузкой приложения (gunicorn --preload) прогрев выполняется один раз
+в главном процессе до fork: загружаются каталог и его индексы, таблица рекомендаций, все представления
+(через URLconf) и шаблоны. После этого объекты переводятся в постоянное поколение сборщика мусора
+(gc.freeze), чтобы сборщик в дочерних процессах не трогал их заголовки и страницы памяти оставались
+общими (copy-on-write), а первые запросы после запуска не тратили время на загрузку.
+"""
+import gc
+import logging
+import os
+import resource
+import time
+
+from django.db import connections
+from django.template import engines
+from django.template.utils import get_app_template_dirs
+from django.urls import get_resolver
+
+from logic.lazy import load_views
+
+logger = logging.getLogger(__name__)
+
+_fork_hook_installed = False
+
+
+def _template_names(dirs) -> list[str]:
+    """Имена всех шаблонов .html в каталогах шаблонов."""
+    names = []
+    for directory in dirs:
+        for root, _, files in os.walk(directory):
+            for file in files:
+                if file.endswith('.html'):
+                    names.append(os.path.relpath(os.path.join(root, file), directory).replace(os.sep, '/'))
+    return names
+
+
+def preload_templates() -> int:
+    """
+    Компилирует все шаблоны приложений и проекта в кеш загрузчика шаблонов.
+
+    :return: Количество загруженных шаблонов.
+    """
+    count = 0
+    for engine in engines.all():
+        dirs = list(getattr(engine, 'dirs', []))
+        if getattr(engine, 'app_dirs', False):
+            dirs += get_app_template_dirs('templates')
+        for name in _template_names(dirs):
+            try:
+                engine.get_template(name)
+                count += 1
+            except Exception as exc:  # Шаблоны сторонних приложений могут зависеть от неустановленных пакетов
+                logger.debug("Шаблон %s не загружен: %s", name, exc)
+    return count
+
+
+def _after_fork_in_child() -> None:
+    """В дочернем процессе нет потоков родителя: запускаем слежение за каталогом и обновление рекомендаций."""
+    from store.catalog import start_watcher
+    from store.recommendations import get_recommender
+    start_watcher()
+    get_recommender()
+
+
+def warmup(freeze: bool = True) -> dict:
+    """
+    Прогревает процесс: каталог с индексами, рекомендации, представления и шаблоны.
+
+    :param freeze: Перевести загруженные объекты в постоянное поколение сборщика мусора (gc.freeze).
+    :return: Словарь с длительностью этапов в секундах и количеством загруженных объектов.
+    """
+    from store.catalog import reload_catalog
+    from store.recommendations import get_recommender
+
+    timings = {}
+    started = time.perf_counter()
+
+    catalog = reload_catalog()  # Вместе с индексами; поток слежения до fork не запускается, см. _after_fork_in_child
+    timings['catalog'] = time.perf_counter() - started
+
+    stage = time.perf_counter()
+    get_recommender(build=True, start=False)  # Поток обновления запускается после fork, см. _after_fork_in_child
+    timings['recommendations'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    views = load_views(get_resolver().url_patterns)  # URLconf и модули отложенных представлений (logic.lazy)
+    timings['urls'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    templates = preload_templates()
+    timings['templates'] = time.perf_counter() - stage
+
+    # Соединения с базой (загрузка каталога и рекомендаций в режиме STORE_STORAGE='db') не должны
+    # достаться дочерним процессам: общий сокет у нескольких процессов ломает протокол базы
+    connections.close_all()
+
+    if freeze:
+        stage = time.perf_counter()
+        gc.collect()  # Мусор собирается до заморозки, иначе он останется в памяти навсегда
+        gc.freeze()
+        timings['freeze'] = time.perf_counter() - stage
+
+    global _fork_hook_installed
+    if not _fork_hook_installed:
+        os.register_at_fork(after_in_child=_after_fork_in_child)
+        _fork_hook_installed = True
+    timings['total'] = time.perf_counter() - started
+    logger.info("Прогрев завершён за %.3f с: %d товаров, %d представлений, %d шаблонов",
+                timings['total'], len(catalog), views, templates)
+    return {'timings': timings, 'products': len(catalog), 'views': views, 'templates': templates,
+            'frozen': gc.get_freeze_count()}
+
+
+def memory_usage(pid: int | str = 'self') -> dict[str, int]:
+    """
+    Использование памяти процессом в килобайтах.
+    В Linux берётся из /proc/<pid>/smaps_rollup: rss - резидентная память, pss - доля с учётом общих страниц,
+    shared - страницы, общие с другими процессами (после fork - с родителем), private - собственные страницы.
+    В других системах доступен только максимальный rss текущего процесса.
+
+    :param pid: PID процесса или 'self'.
+    :return: Словарь {показатель: килобайты}.
+    """
+    fields = {'Rss': 'rss', 'Pss': 'pss', 'Shared_Clean': 'shared', 'Shared_Dirty': 'shared',
+              'Private_Clean': 'private', 'Private_Dirty': 'private'}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            usage = {}
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in fields:
+                    usage[fields[name]] = usage.get(fields[name], 0) + int(value.split()[0])
+            return usage
+    except OSError:
+        return {'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
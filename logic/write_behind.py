@@ -0,0 +1,238 @@
+"""
+Отложенная запись (write-behind) баз корзин и избранного в JSON-хранилище.
+
+Изменения пользователя не записываются сразу, а попадают в буфер процесса в виде операций
+(создать запись, добавить товар, увеличить количество, удалить товар - см. apply). Фоновый поток
+записывает все накопленные изменения одного файла одной записью (group commit): раз в
+settings.WRITE_BEHIND_INTERVAL секунд (0 - сразу после предыдущей записи, пока запросы продолжают
+копиться в буфере) или раньше, если в буфере settings.WRITE_BEHIND_MAX_PENDING пользователей.
+Запись выполняется под блокировкой файла (fcntl.flock): процесс перечитывает файл и применяет свои операции
+к только что прочитанным записям. Поэтому процессы не теряют изменения друг друга, в том числе изменения
+одного и того же пользователя: два добавления товара в корзину на разных процессах дают количество 2.
+
+Чтения в том же процессе видят свои ещё не записанные изменения (replay, overlay); другие процессы
+видят их после записи. Буфер записывается при завершении процесса (atexit). Изменения, которые
+не успели записаться до аварийного завершения процесса, теряются - это плата за режим.
+
+settings.WRITE_BEHIND_FSYNC: 'always' - fsync файла после каждой групповой записи (переживает сбой ОС),
+'never' - файл сбрасывается на диск операционной системой.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from logic import metrics
+
+logger = logging.getLogger(__name__)
+
+_pending: dict[str, dict[str, list]] = {}  # Путь базы -> {имя пользователя: [операции]}, ждут записи
+_flushing: dict[str, dict[str, list]] = {}  # Записываются прямо сейчас, ещё видны читателям
+_lock = threading.Lock()  # Защищает буферы
+_flush_lock = threading.Lock()  # Одна групповая запись в процессе за раз
+_wakeup = threading.Event()
+_flusher = None
+_stats = {'flushes': 0, 'users': 0}
+
+
+def enabled() -> bool:
+    """
+    Проверяет, включена ли отложенная запись (settings.WRITE_BEHIND_ENABLED).
+
+    :return: True, если изменения пишутся через буфер.
+    """
+    return settings.WRITE_BEHIND_ENABLED
+
+
+def apply(data: dict | None, operations: list) -> dict | None:
+    """
+    Применяет операции к данным пользователя. Операции:
+        ('init', данные) - создать запись пользователя, если её нет;
+        ('add', id) - корзина: увеличить количество товара на 1 (добавить с количеством 1);
+        ('append', id) - избранное: добавить товар в конец списка, если его там нет;
+        ('remove', id) - удалить товар из корзины или избранного, если он там есть.
+
+    :param data: Данные пользователя ({'products': {...}} или {'products': [...]}) или None, если его нет в базе.
+             Изменяется на месте.
+    :param operations: Операции в порядке выполнения.
+    :return: Данные пользователя после операций (None - записи так и нет).
+    """
+    for operation, value in operations:
+        if operation == 'init':
+            if not data:  # Пустая запись {} тоже считается отсутствующей, как в add_user_to_cart
+                data = {key: item.copy() for key, item in value.items()}
+            continue
+        if data is None:
+            if operation == 'remove':
+                continue
+            data = {'products': {} if operation == 'add' else []}
+        products = data.setdefault('products', {} if operation == 'add' else [])
+        if operation == 'add':
+            products[value] = products.get(value, 0) + 1
+        elif operation == 'append':
+            if value not in products:
+                products.append(value)
+        elif operation == 'remove':
+            if isinstance(products, dict):
+                products.pop(value, None)
+            elif value in products:
+                products.remove(value)
+        else:
+            raise ValueError(f"Неизвестная операция {operation!r}")
+    return data
+
+
+def put(path: str, username: str, operation: tuple) -> None:
+    """
+    Помещает операцию над данными пользователя в буфер.
+
+    :param path: Путь к JSON-файлу базы.
+    :param username: Имя пользователя.
+    :param operation: Операция (см. apply).
+    """
+    global _flusher
+    with _lock:
+        _pending.setdefault(path, {}).setdefault(username, []).append(operation)
+        size = sum(map(len, _pending.values()))
+        if _flusher is None or not _flusher.is_alive():  # После fork поток записи нужно запустить заново
+            _flusher = threading.Thread(target=_flush_loop, name='write-behind', daemon=True)
+            _flusher.start()
+    if not settings.WRITE_BEHIND_INTERVAL or size >= settings.WRITE_BEHIND_MAX_PENDING:
+        _wakeup.set()
+
+
+def _operations(path: str, username: str) -> list:
+    """Не записанные операции пользователя: сначала записываемые сейчас, затем ждущие записи."""
+    with _lock:
+        return [*_flushing.get(path, {}).get(username, ()), *_pending.get(path, {}).get(username, ())]
+
+
+def replay(path: str, username: str, data: dict | None) -> dict | None:
+    """
+    Накладывает не записанные изменения пользователя на его данные, прочитанные из файла или снимка.
+
+    :param path: Путь к JSON-файлу базы.
+    :param username: Имя пользователя.
+    :param data: Данные пользователя из файла или None (изменяются на месте).
+    :return: Данные с учётом буфера.
+    """
+    return apply(data, operations) if (operations := _operations(path, username)) else data
+
+
+def overlay(path: str, users: dict) -> dict:
+    """
+    Накладывает изменения из буфера на прочитанную базу.
+
+    :param path: Путь к JSON-файлу базы.
+    :param users: Содержимое базы из файла (изменяется на месте).
+    :return: users.
+    """
+    with _lock:
+        buffered = {}
+        for buffer in (_flushing, _pending):  # Более новые операции применяются последними
+            for username, operations in buffer.get(path, {}).items():
+                buffered.setdefault(username, []).extend(operations)
+    for username, operations in buffered.items():
+        if (data := apply(users.get(username), operations)) is not None:
+            users[username] = data
+    return users
+
+
+def _flush_loop() -> None:
+    while True:
+        _wakeup.wait(settings.WRITE_BEHIND_INTERVAL or None)
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception:  # Поток записи не должен завершаться: изменения вернулись в буфер
+            logger.exception("Ошибка отложенной записи корзин и избранного")
+            time.sleep(1)
+
+
+def _write_file(path: str, users: dict[str, list]) -> None:
+    """Перечитывает базу под блокировкой файла, применяет операции пользователей и записывает её атомарно."""
+    with open(f'{path}.lock', mode='a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)  # Снимается при закрытии файла
+        data = {}
+        if os.path.exists(path):
+            started = metrics.clock()
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+                metrics.storage_io('read', path, os.fstat(f.fileno()).st_size, started)
+        for username, operations in users.items():
+            if (user_data := apply(data.get(username), operations)) is not None:
+                data[username] = user_data
+
+        started = metrics.clock()
+        tmp_path = f'{path}.tmp{os.getpid()}.{threading.get_ident()}'  # Уникален для потока
+        with open(tmp_path, mode='w', encoding='utf-8') as f:
+            json.dump(data, f)
+            size = f.tell()
+            if settings.WRITE_BEHIND_FSYNC == 'always':
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        metrics.storage_io('write', path, size, started)
+
+
+def flush() -> int:
+    """
+    Записывает все изменения из буфера: по одной записи на файл базы.
+
+    :return: Количество записанных пользователей.
+    """
+    with _flush_lock:
+        with _lock:
+            if not _pending:
+                return 0
+            _flushing.update(_pending)
+            _pending.clear()
+        written = 0
+        try:
+            for path, users in list(_flushing.items()):
+                _write_file(path, users)
+                with _lock:
+                    del _flushing[path]
+                written += len(users)
+                if settings.METRICS_ENABLED:
+                    metrics.observe('write_behind_group_size', (('file', os.path.basename(path)),), len(users),
+                                    metrics.COUNT_BUCKETS)
+        finally:
+            with _lock:  # Не записанное из-за ошибки возвращается в буфер перед более новыми операциями
+                for path, users in _flushing.items():
+                    pending = _pending.setdefault(path, {})
+                    for username, operations in users.items():
+                        pending[username] = operations + pending.get(username, [])
+                _flushing.clear()
+                _stats['flushes'] += 1
+                _stats['users'] += written
+        return written
+
+
+def stats() -> dict:
+    """
+    Статистика групповых записей процесса.
+
+    :return: Словарь с числом групповых записей, записанных пользователей и пользователей в буфере.
+    """
+    with _lock:
+        return {**_stats, 'pending': sum(map(len, _pending.values()))}
+
+
+def _after_fork() -> None:
+    # Дочерний процесс не должен повторно записывать изменения, принятые родителем;
+    # блокировки создаются заново: в момент fork их мог держать другой поток
+    global _flusher, _lock, _flush_lock
+    _lock, _flush_lock = threading.Lock(), threading.Lock()
+    _pending.clear()
+    _flushing.clear()
+    _flusher = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+atexit.register(flush)
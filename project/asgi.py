@@ -12,5 +12,15 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', '1')  # Под ASGI API корзины и избранного работают асинхронно
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402 - настройки доступны после создания приложения
+
+if settings.WARMUP_ON_STARTUP:  # С gunicorn --preload прогрев выполняется один раз до fork
+    from logic.warmup import warmup
+    warmup()
+else:  # Каталог и его индексы загружаются при запуске, а не первым запросом
+    from store.catalog import get_catalog
+    get_catalog()
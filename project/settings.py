@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,11 +45,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'logic.metrics.MetricsMiddleware',
+    'logic.request_log.RequestLogMiddleware',
+    'logic.profiler.ProfilerMiddleware',
+    'logic.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'logic.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -125,3 +131,175 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Хранилище корзин и избранного пользователей:
+# 'json' - файлы cart.json и wishlist.json со снимками для быстрого чтения;
+# 'db' - модели CartItem и WishlistItem в базе данных.
+STORE_STORAGE = 'json'
+USER_LIST_PAGE_SIZE = 20  # Товаров на странице корзины и избранного
+
+# Каталог товаров: файл .json или .csv, перезагружается без перезапуска процессов
+CATALOG_PATH = Path(os.environ.get('DJANGO_CATALOG_PATH', BASE_DIR / 'store' / 'data' / 'catalog.json'))
+CATALOG_WATCH_INTERVAL = 2  # Период проверки изменения файла каталога в секундах, 0 - не следить
+CATALOG_RELOAD_SIGNAL = 'SIGHUP'  # Сигнал перезагрузки каталога, None - не устанавливать обработчик
+
+# Рекомендации на странице товара
+RECOMMENDATIONS_TOP_K = 4  # Количество связанных товаров
+RECOMMENDATIONS_REFRESH_INTERVAL = 60  # Период применения изменений корзин и избранного в секундах, 0 - не обновлять
+RECOMMENDATIONS_RESYNC_INTERVAL = 3600  # Период сверки со всеми корзинами и избранным (изменения других процессов)
+
+# Таблицы купонов и стоимости доставки, перечитываются при изменении файлов
+COUPONS_PATH = BASE_DIR / 'store' / 'data' / 'coupons.json'
+DELIVERY_PATH = BASE_DIR / 'store' / 'data' / 'delivery.json'
+PRICING_RULES_CHECK_INTERVAL = 2  # Как часто проверять изменение файлов правил, в секундах
+
+# Отложенная запись корзин и избранного в JSON-хранилище (logic/write_behind.py): изменения копятся в памяти
+# процесса и записываются одной записью файла раз в WRITE_BEHIND_INTERVAL секунд (0 - сразу после предыдущей
+# записи) или при WRITE_BEHIND_MAX_PENDING изменённых пользователях. Включается DJANGO_WRITE_BEHIND=1.
+WRITE_BEHIND_ENABLED = os.environ.get('DJANGO_WRITE_BEHIND') == '1'
+WRITE_BEHIND_INTERVAL = 0.05
+WRITE_BEHIND_MAX_PENDING = 1000
+WRITE_BEHIND_FSYNC = os.environ.get('DJANGO_WRITE_BEHIND_FSYNC', 'never')  # 'always' - fsync каждой записи
+
+# Ограничение частоты запросов и сброс нагрузки (logic/ratelimit.py), включается DJANGO_RATELIMIT=1.
+# Правило: routes - шаблоны маршрутов (без них правило применяется в коде через logic.ratelimit.limit);
+# rate - запросов в секунду и burst - запросов пачкой подряд (429 сверх них);
+# scope - 'client' (пользователь или IP-адрес) или 'global' (все клиенты вместе);
+# concurrency - одновременных запросов правила в процессе (503 сверх него).
+RATELIMIT_ENABLED = os.environ.get('DJANGO_RATELIMIT') == '1'
+RATELIMIT_RULES = {
+    'cart_write': {'routes': ('cart/add/<str:id_product>', 'cart/del/<str:id_product>',
+                              'cart/buy/<str:id_product>', 'cart/remove/<str:id_product>'),
+                   'rate': 5, 'burst': 20, 'concurrency': 16},
+    'wishlist_write': {'routes': ('wishlist/api/add/<str:id_product>', 'wishlist/api/del/<str:id_product>',
+                                  'wishlist/api/remove/<str:id_product>'),
+                       'rate': 5, 'burst': 20, 'concurrency': 16},
+    'weather': {'routes': ('weather/',), 'rate': 0.5, 'burst': 5},
+    # Квота сервиса погоды: расходуется только при обращении к нему (промах кеша, app_weather.views.fetch_weather)
+    'weather_upstream': {'scope': 'global', 'rate': 10, 'burst': 30, 'concurrency': 8},
+}
+# Хранилище корзин токенов (DJANGO_RATELIMIT_STORE): 'memory' - память процесса;
+# 'sqlite' - файл SQLite, общий для процессов на сервере
+RATELIMIT_STORE = os.environ.get('DJANGO_RATELIMIT_STORE', 'memory')
+RATELIMIT_STORES = {
+    'memory': {'BACKEND': 'logic.ratelimit.MemoryStore'},
+    'sqlite': {'BACKEND': 'logic.ratelimit.SQLiteStore',
+               'OPTIONS': {'path': BASE_DIR / '.cache' / 'ratelimit.sqlite3'}},
+}
+RATELIMIT_IP_HEADER = None  # Заголовок с адресом клиента за обратным прокси, например 'HTTP_X_REAL_IP'
+
+# Ответы JSON (logic/http.py): 'orjson' - пакет orjson, если установлен, иначе стандартный json; 'json' - стандартный
+JSON_ENCODER = os.environ.get('DJANGO_JSON_ENCODER', 'orjson')
+
+# Сжатие ответов (logic/compression.py): brotli (пакет brotli, если установлен) или gzip.
+# DJANGO_COMPRESSION=0 - не сжимать (например, если ответы сжимает обратный прокси).
+COMPRESSION_ENABLED = os.environ.get('DJANGO_COMPRESSION', '1') == '1'
+COMPRESSION_MIN_SIZE = 1024  # Ответы короче не сжимаются, байт
+COMPRESSION_TYPES = ('text/html', 'application/json', 'text/plain', 'text/css', 'text/javascript',
+                     'application/javascript')
+COMPRESSION_BROTLI_QUALITY = 5  # 0-11: выше - меньше ответ и дороже сжатие
+
+# Уменьшенные копии изображений товаров (store/thumbnails.py); без пакета Pillow выводятся исходные изображения
+THUMBNAIL_WIDTHS = (270, 540, 800)  # Ширины копий для srcset, px
+THUMBNAIL_SOURCES = ('store/images/',)  # Статические файлы, для которых создаются копии
+THUMBNAIL_ROOT = BASE_DIR / '.cache' / 'thumbnails'
+THUMBNAIL_QUALITY = 80  # Качество JPEG, 1-95
+THUMBNAIL_WORKERS = 2  # Процессов уменьшения
+THUMBNAIL_MAX_PENDING = 32  # Заданий в очереди, сверх них - перенаправление на исходное изображение
+THUMBNAIL_TIMEOUT = 5  # Ожидание копии, с
+
+# Асинхронные версии JSON API корзины и избранного. Включаются при запуске через project.asgi
+# (переменная окружения DJANGO_ASYNC_VIEWS=1); под WSGI используются синхронные представления.
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS') == '1'
+
+# Прогрев процесса при импорте project.wsgi / project.asgi (каталог, индексы, шаблоны, gc.freeze).
+# Имеет смысл при запуске с предварительной загрузкой приложения до fork: gunicorn --preload.
+WARMUP_ON_STARTUP = os.environ.get('DJANGO_WARMUP') == '1'
+
+# Бюджет времени холодного запуска project.wsgi вместе с URLconf, мс (проверка: python manage.py importtime).
+# Измеренная медиана около 265 мс (вместе с загрузкой каталога), запас ~20% на разброс замеров
+STARTUP_BUDGET_MS = 325
+
+# Метрики запросов, хранилища и внешних сервисов в формате Prometheus (эндпоинт /metrics)
+METRICS_ENABLED = os.environ.get('DJANGO_METRICS') == '1'
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')  # С каких адресов доступен эндпоинт метрик
+
+# Выборочный профилировщик запросов (/profiler/stacks, /profiler/top, только для is_staff); только под WSGI
+PROFILER_ENABLED = os.environ.get('DJANGO_PROFILER') == '1'
+PROFILER_SAMPLE_RATE = float(os.environ.get('DJANGO_PROFILER_RATE', '0.01'))  # Доля профилируемых запросов
+PROFILER_INTERVAL = 0.005  # Период снятия стеков в секундах
+PROFILER_MAX_STACKS = 5000  # Ограничение числа различных стеков в памяти
+
+# Журнал запросов в формате JSON Lines для воспроизведения нагрузки (logic/request_log.py, python manage.py replay)
+REQUEST_LOG_ENABLED = os.environ.get('DJANGO_REQUEST_LOG') == '1'
+REQUEST_LOG_PATH = Path(os.environ.get('DJANGO_REQUEST_LOG_PATH', BASE_DIR / 'logs' / 'request_log.jsonl'))
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get('DJANGO_REQUEST_LOG_RATE', '1'))  # Доля записываемых запросов
+REQUEST_LOG_FLUSH_INTERVAL = 1.0  # Период записи буфера в файл, с
+REQUEST_LOG_BATCH = 1000  # Записей в буфере, при которых он записывается раньше
+REQUEST_LOG_MAX_BUFFER = 100000  # Записей в буфере, сверх них записи отбрасываются
+
+# Хранилище сессий (переменная окружения DJANGO_SESSION_BACKEND):
+# 'db' - таблица django_session, запрос к базе на каждый запрос пользователя;
+# 'cached_db' - чтение из кеша, запись в кеш и в базу (сессия переживает очистку кеша);
+# 'cache' - только кеш; 'signed_cookies' - данные сессии в подписанной cookie, без обращения к хранилищу.
+SESSION_BACKENDS = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_BACKENDS[os.environ.get('DJANGO_SESSION_BACKEND', 'cached_db')]
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Кеш приложения (logic/cache.py), бэкенд выбирается переменной окружения DJANGO_CACHE_BACKEND:
+# 'locmem' - память процесса; 'sqlite' - файл SQLite, общий для процессов на одном сервере (атомарные блокировки);
+# 'file' - файловый кеш Django; 'redis' - сервер DJANGO_REDIS_URL (пакет redis);
+# 'fakeredis' - Redis в памяти процесса для тестов без сервера (пакеты redis и fakeredis).
+CACHE_BACKEND = os.environ.get('DJANGO_CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'app',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'sqlite': {
+        'BACKEND': 'logic.sqlite_cache.SQLiteCache',
+        'LOCATION': BASE_DIR / '.cache' / 'app.sqlite3',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'app',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('DJANGO_REDIS_URL', 'redis://127.0.0.1:6379/0'),
+    },
+}
+if CACHE_BACKEND == 'fakeredis':
+    import fakeredis
+
+    CACHE_BACKENDS['fakeredis'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://fakeredis/0',
+        'OPTIONS': {'connection_class': fakeredis.FakeConnection},
+    }
+APP_CACHE_ALIAS = 'default'
+CACHE_TIMEOUTS = {'catalog': 3600, 'weather': 600, 'fragments': 3600, 'pricing': 3600}  # Срок хранения, с
+CACHE_LOCK_TIMEOUT = 10  # Срок блокировки пересчёта ключа и предельное время ожидания её снятия, с
+
+# Кеш сессий ('sessions') общий для всех процессов на сервере (файловый), чтобы выход из аккаунта в одном процессе
+# не оставлял действующую сессию в кеше другого. DJANGO_SESSION_CACHE=locmem - кеш в памяти процесса
+# (только для запуска в одном процессе).
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache' / 'sessions',
+    } if os.environ.get('DJANGO_SESSION_CACHE', 'file') == 'file' else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+    },
+}
@@ -20,7 +20,13 @@ from django.urls import path, include
 from random import random
 from django.http import HttpResponse
 
-from app_datetime.views import datetime_view
+from logic.lazy import lazy_view
+
+# Модули представлений импортируются при первом запросе, см. logic.lazy
+datetime_view = lazy_view('app_datetime.views.datetime_view')
+metrics_view = lazy_view('logic.metrics.metrics_view')
+profiler_stacks_view = lazy_view('logic.profiler.profiler_stacks_view')
+profiler_top_view = lazy_view('logic.profiler.profiler_top_view')
 
 
 def random_view(request):
@@ -33,6 +39,9 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('random/', random_view),
     path('datetime/', datetime_view),
+    path('metrics', metrics_view),
+    path('profiler/stacks', profiler_stacks_view),
+    path('profiler/top', profiler_top_view),
     path('', include('app_weather.urls')),
     path('', include('store.urls')),
     path('login/', include('app_login.urls')),
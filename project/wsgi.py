@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402 - настройки доступны после создания приложения
+
+if settings.WARMUP_ON_STARTUP:  # С gunicorn --preload прогрев выполняется один раз до fork
+    from logic.warmup import warmup
+    warmup()
+else:  # Каталог и его индексы загружаются при запуске, а не первым запросом
+    from store.catalog import get_catalog
+    get_catalog()
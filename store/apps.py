@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        from .catalog import install_signal_handler
+        # Регистрируют построители производных индексов каталога до его первой загрузки
+        from . import facets, search  # noqa: F401
+        from logic import services  # noqa: F401
+        install_signal_handler()
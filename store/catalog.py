@@ -0,0 +1,297 @@
+"""
+Каталог товаров магазина.
+
+Каталог загружается из внешнего файла (settings.CATALOG_PATH, JSON или CSV) в неизменяемый снимок
+с версией. При изменении файла снимок пересобирается в фоновом потоке вместе со всеми производными
+индексами и атомарно подменяется. Запрос, получивший снимок через get_catalog(), работает с ним до конца,
+даже если в это время был загружен новый каталог.
+
+При хранении корзин и избранного в базе данных (settings.STORE_STORAGE == 'db') каждый загруженный каталог
+переносится в таблицы Product и Category (sync_products_db) до подмены снимка: цены и состав товаров
+в базе и в каталоге совпадают.
+
+Перезагрузку можно вызвать:
+    - изменением файла каталога (фоновая проверка раз в settings.CATALOG_WATCH_INTERVAL секунд);
+    - сигналом settings.CATALOG_RELOAD_SIGNAL (по умолчанию SIGHUP);
+    - командой `python manage.py reload_catalog`.
+"""
+import csv
+import hashlib
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from types import MappingProxyType
+from typing import Callable
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ('name', 'discount', 'price_before', 'price_after', 'description', 'rating', 'review',
+                   'sold_value', 'weight_in_stock', 'category', 'id', 'url', 'html')
+# Преобразование типов для полей, прочитанных из CSV
+CSV_TYPES = {'discount': int, 'price_before': float, 'price_after': float, 'rating': float, 'review': int,
+             'sold_value': int, 'weight_in_stock': int, 'id': int}
+
+_index_builders: dict[str, Callable] = {}  # Построители производных индексов: имя -> функция(catalog)
+_current = None  # Текущий снимок каталога
+_lock = threading.Lock()  # Сериализует перезагрузки каталога
+_reload_requested = threading.Event()
+_watcher = None
+
+
+class Catalog:
+    """
+    Неизменяемый снимок каталога.
+
+    products - словарь {id в виде строки: словарь товара}. Словари товаров общие для всех запросов,
+    их нельзя изменять: для добавления полей (количество в корзине и т.п.) нужно делать копию.
+    """
+
+    def __init__(self, products: dict[str, dict], version: str, mtime_ns: int = 0):
+        self.products = MappingProxyType(products)
+        self.version = version  # Хеш содержимого файла, совпадает у всех процессов с одним каталогом
+        self.mtime_ns = mtime_ns
+        self.loaded_at = time.time()
+        self.by_slug = MappingProxyType({product['html']: product for product in products.values()})
+        by_category = {}
+        for product in products.values():
+            by_category.setdefault(product['category'], []).append(product)
+        self.by_category = MappingProxyType({key: tuple(value) for key, value in by_category.items()})
+        self.categories = tuple(self.by_category)
+        self._indexes = {}
+
+    def __len__(self):
+        return len(self.products)
+
+    def get(self, id_product: str | int) -> dict | None:
+        """
+        Возвращает товар по его id.
+
+        :param id_product: Идентификационный номер продукта.
+        :return: Словарь товара или None.
+        """
+        return self.products.get(str(id_product))
+
+    def get_many(self, ids) -> list[dict]:
+        """
+        Возвращает товары по списку id в том же порядке, пропуская отсутствующие в каталоге.
+
+        :param ids: Итерируемый объект id товаров.
+        :return: Список словарей товаров.
+        """
+        products = self.products
+        return [product for id_product in ids if (product := products.get(str(id_product))) is not None]
+
+    def index(self, name: str):
+        """
+        Возвращает производный индекс, построенный для этого снимка каталога.
+
+        :param name: Имя индекса, под которым зарегистрирован его построитель.
+        :return: Индекс.
+        """
+        try:
+            return self._indexes[name]
+        except KeyError:  # Снимок создан не через reload_catalog (например, в тестах)
+            index = self._indexes[name] = _index_builders[name](self)
+            return index
+
+    def build_indexes(self) -> None:
+        """Строит все зарегистрированные производные индексы снимка."""
+        for name, builder in list(_index_builders.items()):
+            self._indexes[name] = builder(self)
+
+
+def register_index(name: str, builder: Callable) -> None:
+    """
+    Регистрирует построитель производного индекса каталога (поиск, фасеты, рекомендации и т.п.).
+    Индекс строится при каждой загрузке каталога до подмены снимка, то есть вне обработки запросов.
+    Модули с построителями импортируются в StoreConfig.ready, до первой загрузки; если каталог уже загружен,
+    индекс текущего снимка строится сразу.
+
+    :param name: Имя индекса.
+    :param builder: Функция, принимающая Catalog и возвращающая индекс.
+    :return: None
+    """
+    _index_builders[name] = builder
+    if (catalog := _current) is not None:
+        catalog._indexes[name] = builder(catalog)
+
+
+def load_catalog_file(path) -> dict[str, dict]:
+    """
+    Читает файл каталога.
+
+    :param path: Путь к файлу .json (словарь {id: товар} или список товаров) или .csv (строка на товар).
+    :return: Словарь {id в виде строки: словарь товара}.
+    """
+    path = str(path)
+    if path.endswith('.csv'):
+        with open(path, encoding='utf-8', newline='') as f:
+            products = []
+            for row in csv.DictReader(f):
+                for field, cast in CSV_TYPES.items():
+                    row[field] = cast(row[field]) if row.get(field) not in (None, '') else None
+                products.append(row)
+    else:
+        with open(path, encoding='utf-8') as f:
+            products = json.load(f)
+        if isinstance(products, dict):
+            products = list(products.values())
+
+    catalog = {}
+    for product in products:
+        if missing := [field for field in REQUIRED_FIELDS if field not in product]:
+            raise ValueError(f"У товара {product.get('id')} нет полей: {', '.join(missing)}")
+        catalog[str(product['id'])] = product
+    return catalog
+
+
+def sync_products_db(catalog: Catalog) -> None:
+    """
+    Переносит товары снимка каталога в базу данных: новые товары и категории добавляются, у существующих
+    товаров обновляются все поля. Товары, убранные из каталога, остаются в базе (на них ссылаются позиции
+    корзин и избранного), но добавить их нельзя: product_exists_db проверяет и каталог.
+
+    :param catalog: Снимок каталога.
+    :return: None
+    """
+    from store.models import Category, Product
+
+    products = catalog.products.values()
+    names = {product['category'] for product in products}
+    with transaction.atomic():
+        Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+        categories = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+        fields = [field for field in Product.DICT_FIELDS if field not in ('id', 'category')]
+        Product.objects.bulk_create(
+            [Product(id=int(product['id']), category_id=categories[product['category']],
+                     **{field: product[field] for field in fields})
+             for product in products],
+            update_conflicts=True, unique_fields=['id'], update_fields=[*fields, 'category'],
+        )
+
+
+def _file_version(path) -> tuple[str, int]:
+    """
+    Версия файла каталога: хеш содержимого и время изменения.
+
+    :param path: Путь к файлу каталога.
+    :return: (хеш содержимого, mtime в наносекундах)
+    """
+    with open(path, mode='rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+        return digest, os.fstat(f.fileno()).st_mtime_ns
+
+
+def reload_catalog(force: bool = False) -> Catalog:
+    """
+    Загружает каталог из файла, строит производные индексы и атомарно подменяет текущий снимок.
+    Если содержимое файла не изменилось, текущий снимок остаётся прежним.
+    При ошибке в файле остаётся прежний снимок, если он уже был загружен.
+
+    :param force: Пересобрать снимок, даже если файл не изменился.
+    :return: Текущий снимок каталога.
+    """
+    global _current
+    path = settings.CATALOG_PATH
+    with _lock:
+        try:
+            version, mtime_ns = _file_version(path)
+            if not force and _current is not None and _current.version == version:
+                return _current  # Файл перезаписан тем же содержимым, пересборка не нужна
+            catalog = Catalog(load_catalog_file(path), version, mtime_ns)
+            catalog.build_indexes()
+        except (OSError, ValueError) as exc:
+            if _current is None:
+                raise
+            logger.error("Каталог %s не загружен, используется версия %s: %s", path, _current.version, exc)
+            return _current
+        if settings.STORE_STORAGE == 'db':
+            try:
+                sync_products_db(catalog)
+            except DatabaseError:  # Например, таблицы ещё не созданы (до migrate)
+                logger.exception("Товары каталога %s версии %s не перенесены в базу данных", path, version)
+        _current = catalog  # Присваивание ссылки атомарно: запросы видят либо старый, либо новый снимок
+        logger.info("Загружен каталог %s: %d товаров, версия %s", path, len(catalog), version)
+        return catalog
+
+
+def get_catalog() -> Catalog:
+    """
+    Возвращает текущий снимок каталога. Запрос должен получать снимок один раз и работать с ним до конца.
+    Первый снимок загружается при запуске процесса (project.wsgi, project.asgi, прогрев); здесь - только если
+    каталог ещё не загружен (тесты, команды manage.py).
+
+    :return: Снимок каталога.
+    """
+    catalog = _current
+    if catalog is None:
+        catalog = reload_catalog()
+        start_watcher()
+    return catalog
+
+
+def _watch(interval: float) -> None:
+    """Фоновый цикл: перезагружает каталог при изменении файла или по сигналу."""
+    seen_mtime_ns = _current.mtime_ns if _current is not None else 0
+    while True:
+        _reload_requested.wait(interval)
+        forced = _reload_requested.is_set()
+        _reload_requested.clear()
+        try:
+            mtime_ns = os.stat(settings.CATALOG_PATH).st_mtime_ns
+            if forced or mtime_ns != seen_mtime_ns:  # Файл с ошибкой повторно не разбирается, пока не изменится
+                seen_mtime_ns = mtime_ns
+                reload_catalog()
+        except Exception:
+            logger.exception("Ошибка фоновой перезагрузки каталога")
+
+
+def start_watcher() -> None:
+    """
+    Запускает фоновый поток слежения за файлом каталога (если settings.CATALOG_WATCH_INTERVAL > 0).
+    Поток запускается в каждом процессе отдельно, в том числе в процессах, созданных через fork.
+    """
+    global _watcher
+    interval = settings.CATALOG_WATCH_INTERVAL
+    if interval and (_watcher is None or not _watcher.is_alive()):
+        _watcher = threading.Thread(target=_watch, args=(interval,), name='catalog-watcher', daemon=True)
+        _watcher.start()
+
+
+def request_reload(*args) -> None:
+    """
+    Просит фоновый поток перезагрузить каталог. Подходит как обработчик сигнала:
+    сама перезагрузка выполняется не в обработчике и не в потоке запроса.
+    """
+    if settings.CATALOG_WATCH_INTERVAL:
+        _reload_requested.set()
+        start_watcher()
+    else:
+        threading.Thread(target=reload_catalog, name='catalog-reload', daemon=True).start()
+
+
+def _after_fork() -> None:
+    # Блокировку в момент fork мог держать поток слежения родителя, а сам поток в дочерний процесс не переходит
+    global _lock
+    _lock = threading.Lock()
+    if _watcher is not None:
+        start_watcher()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def install_signal_handler() -> None:
+    """Устанавливает обработчик сигнала перезагрузки каталога (settings.CATALOG_RELOAD_SIGNAL)."""
+    signal_name = settings.CATALOG_RELOAD_SIGNAL
+    if not signal_name or not hasattr(signal, signal_name):
+        return
+    if threading.current_thread() is not threading.main_thread():  # Сигналы ставятся только из главного потока
+        return
+    signal.signal(getattr(signal, signal_name), request_reload)
@@ -0,0 +1,109 @@
+"""
+Фасетные счётчики для фильтров магазина: категория, диапазон цены, диапазон рейтинга.
+
+Для каждого значения фасета при загрузке снимка каталога строится битовое множество товаров
+(целое число, бит i - i-й товар снимка). Количество товаров при любом наборе фильтров считается
+пересечением множеств и подсчётом единичных битов, без обхода каталога.
+Результаты кешируются в индексе, который живёт ровно столько, сколько его снимок каталога,
+поэтому кеш автоматически относится к одной версии каталога.
+"""
+from .catalog import Catalog, get_catalog, register_index
+
+# Диапазоны цены (по price_after) и рейтинга: (название, нижняя граница включительно, верхняя граница)
+PRICE_BANDS = (('0-100', 0, 100), ('100-200', 100, 200), ('200-300', 200, 300), ('300-500', 300, 500),
+               ('500+', 500, None))
+RATING_BANDS = (('4.5+', 4.5, None), ('4-4.5', 4.0, 4.5), ('3-4', 3.0, 4.0), ('0-3', 0, 3.0))
+CACHE_SIZE = 1024
+
+
+def _band(value: float, bands: tuple) -> str | None:
+    """
+    Название диапазона, в который попадает значение.
+
+    :param value: Значение.
+    :param bands: Диапазоны вида (название, нижняя граница, верхняя граница или None).
+    :return: Название диапазона или None.
+    """
+    for name, low, high in bands:
+        if value >= low and (high is None or value < high):
+            return name
+    return None
+
+
+class FacetIndex:
+    """Битовые множества товаров для каждого значения каждого фасета."""
+    FACETS = {
+        'category': lambda product: product['category'],
+        'price': lambda product: _band(product['price_after'], PRICE_BANDS),
+        'rating': lambda product: _band(product['rating'], RATING_BANDS),
+    }
+
+    def __init__(self, catalog: Catalog):
+        self.version = catalog.version
+        size = len(catalog.products)
+        self.all = (1 << size) - 1
+        # Биты собираются в bytearray и один раз превращаются в число: сдвиги и OR на больших числах
+        # по одному товару дали бы квадратичное время построения
+        buffers = {facet: {} for facet in self.FACETS}
+        for position, product in enumerate(catalog.products.values()):
+            for facet, key in self.FACETS.items():
+                value = key(product)
+                if value is not None:
+                    buffer = buffers[facet].get(value)
+                    if buffer is None:
+                        buffer = buffers[facet][value] = bytearray((size + 7) // 8)
+                    buffer[position >> 3] |= 1 << (position & 7)
+        self.bits = {facet: {value: int.from_bytes(buffer, 'little') for value, buffer in values.items()}
+                     for facet, values in buffers.items()}
+        # Порядок значений в ответе: диапазоны - в порядке объявления, категории - как в каталоге
+        self.values = {'category': list(catalog.categories),
+                       'price': [name for name, _, _ in PRICE_BANDS],
+                       'rating': [name for name, _, _ in RATING_BANDS]}
+        self._cache = {}
+
+    def counts(self, filters: dict[str, str]) -> dict:
+        """
+        Количество товаров по значениям каждого фасета при активных фильтрах.
+        Для каждого фасета учитываются фильтры только по другим фасетам, чтобы показать,
+        сколько товаров будет при выборе другого значения этого фасета.
+
+        :param filters: Активные фильтры {фасет: значение}; неизвестные фасеты игнорируются.
+        :return: Словарь {'total': число товаров под всеми фильтрами, 'facets': {фасет: {значение: число}}}.
+        """
+        filters = {facet: value for facet, value in filters.items() if facet in self.FACETS and value}
+        key = tuple(sorted(filters.items()))
+        if (result := self._cache.get(key)) is not None:
+            return result
+
+        masks = {facet: self.bits[facet].get(value, 0) for facet, value in filters.items()}
+        total = self.all
+        for mask in masks.values():
+            total &= mask
+
+        facets = {}
+        for facet in self.FACETS:
+            others = self.all
+            for other, mask in masks.items():
+                if other != facet:
+                    others &= mask
+            facets[facet] = {value: (self.bits[facet].get(value, 0) & others).bit_count()
+                             for value in self.values[facet]}
+
+        result = {'total': total.bit_count(), 'version': self.version, 'facets': facets}
+        if len(self._cache) >= CACHE_SIZE:
+            self._cache.clear()
+        self._cache[key] = result
+        return result
+
+
+register_index('facets', FacetIndex)
+
+
+def facet_counts(filters: dict[str, str]) -> dict:
+    """
+    Фасетные счётчики для текущего снимка каталога.
+
+    :param filters: Активные фильтры {фасет: значение}.
+    :return: Результат FacetIndex.counts.
+    """
+    return get_catalog().index('facets').counts(filters)
@@ -0,0 +1,89 @@
+import gzip
+import json
+import statistics
+import time
+
+from django.core.management.base import CommandError
+from django.test import Client
+
+from logic.compression import brotli
+from logic.http import orjson, ORJSON_OPTIONS
+from store.management.commands import benchmark
+
+
+def _timeit(func, repeat: int) -> float:
+    """Медиана времени вызова func в микросекундах."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(timings)
+
+
+class Command(benchmark.Command):
+    help = ("Бенчмарк объёма ответов и стоимости их кодирования на тех же данных и адресах, что и benchmark. "
+            "Для каждого эндпоинта: размер ответа в прежнем формате JSON (отступы 4 пробела), текущий размер "
+            "(компактный JSON), размер после gzip и brotli, сколько байт уходит клиенту с Accept-Encoding: gzip, br "
+            "(wire), время кодирования JSON стандартным json с отступами и без и orjson, время сжатия. "
+            "Времена - медианы по --iterations повторам в микросекундах; brotli и orjson - если пакеты установлены. "
+            "--compare сравнивает байты wire с базовыми значениями.")
+
+    @staticmethod
+    def _measure(client: Client, urls: list[str], options: dict) -> dict:
+        repeat = options['iterations']
+        response = client.get(urls[0])  # Без Accept-Encoding: ответ не сжимается
+        if response.status_code >= 500:
+            raise CommandError(f"{urls[0]} ответил {response.status_code}")
+        body = response.content
+        wire = client.get(urls[0], HTTP_ACCEPT_ENCODING='gzip, br')
+        result = {'type': response.get('Content-Type', '').split(';')[0],
+                  'bytes': len(body),
+                  'wire': len(wire.content),
+                  'encoding': wire.get('Content-Encoding', '-'),
+                  'gzip': len(gzip.compress(body, compresslevel=6, mtime=0)),
+                  'gzip_us': _timeit(lambda: gzip.compress(body, compresslevel=6, mtime=0), repeat)}
+        if brotli is not None:
+            result['br'] = len(brotli.compress(body, mode=brotli.MODE_TEXT, quality=5))
+            result['br_us'] = _timeit(lambda: brotli.compress(body, mode=brotli.MODE_TEXT, quality=5), repeat)
+
+        if result['type'] == 'application/json':
+            data = json.loads(body)
+            result['bytes_before'] = len(json.dumps(data, ensure_ascii=False, indent=4).encode())
+            result['json_indent_us'] = _timeit(lambda: json.dumps(data, ensure_ascii=False, indent=4).encode(),
+                                               repeat)
+            result['json_us'] = _timeit(
+                lambda: json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode(), repeat)
+            if orjson is not None:
+                result['orjson_us'] = _timeit(lambda: orjson.dumps(data, option=ORJSON_OPTIONS), repeat)
+        return result
+
+    def _print(self, report: dict, baseline: dict | None, thresholds: dict) -> None:
+        row = "{:<24} {:>8} {:>8} {:>8} {:>8} {:>12} {:>11} {:>9} {:>9} {:>9} {:>9}  {}"
+        self.stdout.write(row.format('benchmark', 'до, Б', 'ответ, Б', 'gzip, Б', 'br, Б', 'wire, Б', 'indent, мкс',
+                                     'json, мкс', 'orjson', 'gzip, мкс', 'br, мкс', 'к базовым' if baseline else ''))
+        for name, result in report['results'].items():
+            change = ''
+            if baseline and (base := baseline['results'].get(name)):
+                change = f"{(result['wire'] / base['wire'] - 1) * 100:+.1f}%"
+
+            def value(key, digits=0):
+                return '-' if key not in result else f"{result[key]:.{digits}f}"
+
+            self.stdout.write(row.format(name, value('bytes_before'), result['bytes'], result['gzip'], value('br'),
+                                         f"{result['wire']} {result['encoding']}", value('json_indent_us', 1),
+                                         value('json_us', 1), value('orjson_us', 1), value('gzip_us', 1),
+                                         value('br_us', 1), change))
+
+    def _check(self, report: dict, baseline: dict, thresholds: dict) -> None:
+        """Проверяет рост байт, уходящих клиенту, относительно базовых значений."""
+        regressions = []
+        for name, result in report['results'].items():
+            if (base := baseline['results'].get(name)) is None or 'wire' not in base:
+                continue
+            limit = thresholds.get(name, thresholds['*'])
+            if result['wire'] > base['wire'] * (1 + limit):
+                regressions.append(f"{name}: {base['wire']} -> {result['wire']} Б (порог +{limit * 100:.0f}%)")
+        if regressions:
+            raise CommandError("Рост объёма ответов относительно базовых значений:\n" + '\n'.join(regressions))
+        self.stdout.write("Регрессий относительно базовых значений нет")
@@ -0,0 +1,123 @@
+import contextlib
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from logic import write_behind
+from logic.services import CART_FILE, add_to_cart
+from logic.synthetic import generate_baskets, generate_products
+from store.catalog import reload_catalog
+
+
+def _total_quantity(path: str) -> int:
+    with open(path, encoding='utf-8') as f:
+        return sum(sum(cart['products'].values()) for cart in json.load(f).values())
+
+
+def _writer(usernames: list[str], ids: list[str], count: int, latencies: list[float], lock) -> None:
+    """Поток нагрузки: count добавлений в корзины своих пользователей."""
+    for number in range(count):
+        user = SimpleNamespace(username=usernames[number % len(usernames)])
+        started = time.perf_counter()
+        with lock:
+            add_to_cart(user, ids[number % len(ids)])
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк записи корзин в JSON-хранилище: немедленная запись всего файла на каждое изменение (sync) "
+            "против отложенной записи (logic.write_behind) с разными интервалами групповой записи. "
+            "Несколько потоков добавляют товары в корзины, у каждого потока свои пользователи. Выводятся "
+            "изменения в секунду (с учётом финальной записи буфера), число записей файла, средний размер группы, "
+            "задержка одного изменения (с ожиданием очереди) и число потерянных изменений. Немедленная запись "
+            "перезаписывает файл на месте, поэтому её изменения выполняются по одному, как в run_storage.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="Пользователей в cart.json")
+        parser.add_argument('--products', type=int, default=200, help="Товаров в каталоге")
+        parser.add_argument('--writes', type=int, default=2000, help="Всего изменений")
+        parser.add_argument('--threads', type=int, default=4, help="Потоков нагрузки")
+        parser.add_argument('--interval', action='append', default=[],
+                            help="Интервал групповой записи в секундах или sync (можно указать несколько раз), "
+                                 "по умолчанию sync, 0, 0.01, 0.05, 0.2")
+        parser.add_argument('--fsync', action='append', choices=('never', 'always'), default=[],
+                            help="Политика fsync (можно указать несколько раз), по умолчанию never")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        intervals = options['interval'] or ['sync', '0', '0.01', '0.05', '0.2']
+        policies = options['fsync'] or ['never']
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as work:
+            catalog_path = os.path.join(work, 'catalog.json')
+            products = [str(product['id']) for product in generate_products(options['products'], options['seed'])]
+            with open(catalog_path, mode='w', encoding='utf-8') as f:
+                json.dump({str(product['id']): product
+                           for product in generate_products(options['products'], options['seed'])}, f)
+            carts = {username: cart for username, cart, _ in generate_baskets(
+                options['users'], options['products'], options['seed'])}
+
+            row = "{:<8} {:>10} {:>12} {:>12} {:>10} {:>12} {:>12} {:>8}"
+            self.stdout.write(row.format('fsync', 'interval', 'writes/s', 'file writes', 'group', 'p50, мс',
+                                         'p99, мс', 'lost'))
+            with override_settings(CATALOG_PATH=catalog_path, CATALOG_WATCH_INTERVAL=0, STORE_STORAGE='json',
+                                   METRICS_ENABLED=False):
+                reload_catalog(force=True)
+                try:
+                    for policy in policies:
+                        for interval in intervals:
+                            run = os.path.join(work, f'{policy}-{interval}')
+                            os.makedirs(run)
+                            os.chdir(run)  # Файлы хранилища открываются относительно текущего каталога
+                            with open(CART_FILE, mode='w', encoding='utf-8') as f:
+                                json.dump(carts, f)
+                            result = self._run(carts, products, options, interval, policy)
+                            self.stdout.write(row.format(policy, interval, f"{result['rate']:.0f}",
+                                                         result['file_writes'], f"{result['group']:.1f}",
+                                                         f"{result['p50']:.3f}", f"{result['p99']:.3f}",
+                                                         result['lost']))
+                finally:
+                    os.chdir(cwd)
+
+    @staticmethod
+    def _run(carts: dict, products: list[str], options: dict, interval: str, policy: str) -> dict:
+        """Один прогон: нагрузка потоками, финальная запись буфера и проверка файла."""
+        usernames = list(carts)
+        before = _total_quantity(CART_FILE)
+        threads_count = options['threads']
+        per_thread = options['writes'] // threads_count
+        latencies = [[] for _ in range(threads_count)]
+        lock = threading.Lock() if interval == 'sync' else contextlib.nullcontext()
+        threads = [threading.Thread(target=_writer, args=(usernames[number::threads_count],
+                                                          products[number::threads_count] or products,
+                                                          per_thread, latencies[number], lock))
+                   for number in range(threads_count)]
+        with override_settings(WRITE_BEHIND_ENABLED=interval != 'sync',
+                               WRITE_BEHIND_INTERVAL=0 if interval == 'sync' else float(interval),
+                               WRITE_BEHIND_FSYNC=policy):
+            flushes = write_behind.stats()['flushes']
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            write_behind.flush()
+            elapsed = time.perf_counter() - started
+            flushes = write_behind.stats()['flushes'] - flushes
+
+        writes = per_thread * threads_count
+        timings = sorted(value for values in latencies for value in values)
+        file_writes = writes if interval == 'sync' else flushes
+        return {'rate': writes / elapsed,
+                'file_writes': file_writes,
+                'group': writes / max(file_writes, 1),
+                'p50': statistics.median(timings),
+                'p99': timings[min(int(len(timings) * 0.99), len(timings) - 1)],
+                'lost': before + writes - _total_quantity(CART_FILE)}
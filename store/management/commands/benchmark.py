@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import platform
+import statistics
+import tempfile
+import time
+from unittest import mock
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from logic.synthetic import generate_baskets, generate_products
+from store.catalog import reload_catalog
+from store.models import CartItem
+from wishlist.models import WishlistItem
+
+# Ответ weatherapi.com, которым подменяется внешний сервис погоды
+WEATHER_STUB = {
+    'location': {'name': 'Saint Petersburg'},
+    'current': {'last_updated': '2024-05-01 12:00', 'temp_c': 12.0, 'feelslike_c': 10.5, 'pressure_mb': 1013.0,
+                'humidity': 70, 'wind_kph': 14.4, 'gust_kph': 25.2, 'wind_dir': 'NW'},
+}
+
+
+class _WeatherResponse:
+    status_code = 200
+
+    @staticmethod
+    def json():
+        return WEATHER_STUB
+
+
+def _benchmarks(products: list[dict], requests: int) -> dict[str, list[str]]:
+    """
+    Адреса для каждого бенчмарка. Если адресов несколько, они перебираются по кругу.
+    Добавление и удаление работают с одними и теми же товарами (по одному на запрос, если товаров хватает),
+    поэтому удаление идёт после добавления и каждый его запрос действительно удаляет товар.
+
+    :param products: Товары синтетического каталога.
+    :param requests: Количество запросов на бенчмарк (с прогревом).
+    :return: Словарь {название бенчмарка: список адресов}.
+    """
+    product = products[0]
+    ids = [str(item['id']) for item in products[:requests]]
+    return {
+        'shop_view': ['/'],
+        'products_view': ['/product/'],
+        'products_view_category': [f"/product/?category={product['category']}&ordering=price_after"],
+        'products_page_view': [f"/product/{item['html']}.html" for item in products[:50]],
+        'cart_view': ['/cart/'],
+        'cart_view_json': ['/cart/?format=JSON'],
+        'cart_add_view': [f'/cart/add/{id_product}' for id_product in ids],
+        'cart_del_view': [f'/cart/del/{id_product}' for id_product in ids],
+        'wishlist_view': ['/wishlist/'],
+        'wishlist_json': ['/wishlist/api/'],
+        'wishlist_add_json': [f'/wishlist/api/add/{id_product}' for id_product in ids],
+        'wishlist_del_json': [f'/wishlist/api/del/{id_product}' for id_product in ids],
+        'weather': ['/weather/?lat=59.93&lon=30.31'],
+    }
+
+
+def _measure(client: Client, urls: list[str], iterations: int, warmup: int) -> dict:
+    """
+    Выполняет запросы и возвращает статистику времени ответа в миллисекундах.
+
+    :param client: Тестовый клиент Django.
+    :param urls: Адреса, перебираемые по кругу.
+    :param iterations: Количество замеряемых запросов.
+    :param warmup: Количество запросов до замера.
+    :return: Словарь со статистикой.
+    """
+    for number in range(warmup):
+        client.get(urls[number % len(urls)])
+    timings = []
+    with CaptureQueriesContext(connection) as queries:
+        for number in range(iterations):
+            url = urls[number % len(urls)]
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 500:
+                raise CommandError(f"{url} ответил {response.status_code}")
+    timings.sort()
+    return {'median': round(statistics.median(timings), 4),
+            'p95': round(timings[min(int(len(timings) * 0.95), len(timings) - 1)], 4),
+            'min': round(timings[0], 4),
+            'mean': round(statistics.fmean(timings), 4),
+            'queries': round(len(queries) / iterations, 2),  # Запросов к базе данных на один HTTP-запрос
+            'iterations': iterations}
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк представлений магазина, избранного и погоды на синтетическом каталоге и базе пользователей "
+            "заданного размера (тестовый клиент Django, временная база и временные файлы хранилища, "
+            "внешний сервис погоды подменён). Результаты можно сохранить как базовые (--save) и сравнить "
+            "с базовыми (--compare): команда завершается с ошибкой, если медиана бенчмарка выросла больше порога.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help="Количество товаров в каталоге")
+        parser.add_argument('--users', type=int, default=1000, help="Количество пользователей")
+        parser.add_argument('--cart-size', type=int, default=5, help="Среднее число позиций в корзине")
+        parser.add_argument('--wishlist-size', type=int, default=5, help="Среднее число товаров в избранном")
+        parser.add_argument('--skew', type=float, default=1.0, help="Показатель Ципфа популярности товаров")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--storage', choices=('json', 'db'), default=settings.STORE_STORAGE,
+                            help="Хранилище корзин и избранного")
+        parser.add_argument('-n', '--iterations', type=int, default=200, help="Замеряемых запросов на бенчмарк")
+        parser.add_argument('--warmup', type=int, default=20, help="Запросов до замера")
+        parser.add_argument('--only', action='append', default=[], help="Запустить только указанные бенчмарки")
+        parser.add_argument('--save', help="Сохранить результаты в JSON-файл (базовые значения)")
+        parser.add_argument('--compare', help="Сравнить с базовыми значениями из JSON-файла")
+        parser.add_argument('--threshold', action='append', default=[], metavar='[NAME=]FRACTION',
+                            help="Допустимый рост медианы, например 0.25 (+25%%) для всех или cart_view=0.5")
+
+    def handle(self, *args, **options):
+        thresholds = {'*': 0.25}
+        for item in options['threshold']:
+            name, _, value = item.rpartition('=')
+            thresholds[name or '*'] = float(value)
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as work:
+            catalog_path = os.path.join(work, 'catalog.json')
+            products = list(generate_products(options['products'], options['seed']))
+            with open(catalog_path, mode='w', encoding='utf-8') as f:
+                json.dump({str(product['id']): product for product in products}, f, ensure_ascii=False)
+
+            overrides = override_settings(CATALOG_PATH=catalog_path, CATALOG_WATCH_INTERVAL=0,
+                                          RECOMMENDATIONS_REFRESH_INTERVAL=0, STORE_STORAGE=options['storage'],
+                                          METRICS_ENABLED=False, PROFILER_ENABLED=False)
+            overrides.enable()
+            os.chdir(work)  # Файлы cart.json и wishlist.json открываются относительно текущего каталога
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0)  # Миграции загружают синтетический каталог
+            try:
+                results = self._run(products, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+                os.chdir(cwd)
+                overrides.disable()
+
+        report = {'meta': {'products': options['products'], 'users': options['users'],
+                           'cart_size': options['cart_size'], 'wishlist_size': options['wishlist_size'],
+                           'skew': options['skew'], 'seed': options['seed'], 'storage': options['storage'],
+                           'iterations': options['iterations'], 'python': platform.python_version(),
+                           'django': django.get_version()},
+                  'results': results}
+        self._print(report, baseline, thresholds)
+
+        if options['save']:
+            with open(options['save'], mode='w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=4)
+            self.stdout.write(f"Результаты сохранены в {options['save']}")
+
+        if baseline is not None:
+            self._check(report, baseline, thresholds)
+
+    def _run(self, products: list[dict], options: dict) -> dict:
+        """Готовит хранилище пользователей и выполняет бенчмарки."""
+        baskets = generate_baskets(options['users'], options['products'], options['seed'], options['skew'],
+                                   options['cart_size'], options['wishlist_size'])
+        carts, wishlists = {}, {}
+        for username, cart, wishlist in baskets:
+            carts[username], wishlists[username] = cart, wishlist
+
+        if options['storage'] == 'db':
+            User.objects.bulk_create([User(username=username) for username in carts], batch_size=5000)
+            ids = {user.username: user.id for user in User.objects.only('id', 'username')}
+            CartItem.objects.bulk_create([CartItem(user_id=ids[username], product_id=int(id_product), quantity=count)
+                                          for username, cart in carts.items()
+                                          for id_product, count in cart['products'].items()], batch_size=5000)
+            WishlistItem.objects.bulk_create([WishlistItem(user_id=ids[username], product_id=int(id_product))
+                                              for username, wishlist in wishlists.items()
+                                              for id_product in wishlist['products']], batch_size=5000)
+        else:
+            for path, data in (('cart.json', carts), ('wishlist.json', wishlists)):
+                with open(path, mode='w', encoding='utf-8') as f:
+                    json.dump(data, f)
+        user = User.objects.get_or_create(username='user1')[0]
+
+        reload_catalog(force=True)
+        client = Client()
+        client.force_login(user)
+        benchmarks = _benchmarks(products, options['warmup'] + options['iterations'])
+        results = {}
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)  # Ответы 404 (товар уже удалён и т.п.) не засоряют вывод
+        with mock.patch('requests.get', return_value=_WeatherResponse()):
+            for name, urls in benchmarks.items():
+                if options['only'] and name not in options['only']:
+                    continue
+                results[name] = self._measure(client, urls, options)
+        request_logger.setLevel(level)
+        return results
+
+    @staticmethod
+    def _measure(client: Client, urls: list[str], options: dict) -> dict:
+        """Замер одного бенчмарка (переопределяется в командах, замеряющих другое на тех же данных)."""
+        return _measure(client, urls, options['iterations'], options['warmup'])
+
+    def _print(self, report: dict, baseline: dict | None, thresholds: dict) -> None:
+        """Таблица результатов, при сравнении - с изменением медианы относительно базовых значений."""
+        row = "{:<24} {:>10} {:>10} {:>10} {:>10} {:>8}  {}"
+        self.stdout.write(row.format('benchmark', 'median, мс', 'p95, мс', 'min, мс', 'mean, мс', 'queries',
+                                     'к базовым' if baseline else ''))
+        for name, result in report['results'].items():
+            change = ''
+            if baseline and (base := baseline['results'].get(name)):
+                change = f"{(result['median'] / base['median'] - 1) * 100:+.1f}%"
+            self.stdout.write(row.format(name, f"{result['median']:.3f}", f"{result['p95']:.3f}",
+                                         f"{result['min']:.3f}", f"{result['mean']:.3f}",
+                                         result.get('queries', '-'), change))
+
+    def _check(self, report: dict, baseline: dict, thresholds: dict) -> None:
+        """Проверяет рост медиан относительно базовых значений."""
+        if different := {key: (value, report['meta'].get(key)) for key, value in baseline['meta'].items()
+                         if key in ('products', 'users', 'cart_size', 'wishlist_size', 'storage')
+                         and report['meta'].get(key) != value}:
+            self.stderr.write(f"Параметры прогона отличаются от базовых (базовые, текущие): {different}")
+        regressions = []
+        for name, result in report['results'].items():
+            if (base := baseline['results'].get(name)) is None:
+                continue
+            limit = thresholds.get(name, thresholds['*'])
+            if result['median'] > base['median'] * (1 + limit):
+                regressions.append(f"{name}: {base['median']:.3f} -> {result['median']:.3f} мс "
+                                   f"(порог +{limit * 100:.0f}%)")
+        if regressions:
+            raise CommandError("Замедление относительно базовых значений:\n" + '\n'.join(regressions))
+        self.stdout.write("Регрессий относительно базовых значений нет")
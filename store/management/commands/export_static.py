@@ -0,0 +1,201 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import resolve
+
+from logic.services import filtering_category
+from store.catalog import reload_catalog
+from store.recommendations import get_recommender, related_products
+
+STATE_FILE = '.export-state.json'  # Отпечатки входных данных отрисованных страниц и статических файлов
+MANIFEST_FILE = 'manifest.json'  # Список статических файлов с хешами, кладётся в <output>/static
+SHOP_ORDERINGS = ('price_after', 'price_before', 'rating', 'review', 'sold_value')  # Сортировки страниц магазина
+BATCH_SIZE = 50  # Страниц на одно задание рабочего процесса
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, mode='rb') as f:
+        while chunk := f.read(1 << 16):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _templates_digest() -> str:
+    """Отпечаток шаблонов магазина: их изменение требует перерисовать все страницы."""
+    files = []
+    for root, _, names in os.walk(settings.BASE_DIR / 'store' / 'templates'):
+        files += [os.path.join(root, name) for name in names]
+    return _digest(sorted((os.path.relpath(path, settings.BASE_DIR), _file_hash(path)) for path in files),
+                   settings.STATIC_URL)
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, mode='wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _render_pages(output: str, pages: list[tuple[str, str]]) -> list[str]:
+    """
+    Рабочий процесс: отрисовывает страницы для анонимного пользователя и записывает их в файлы.
+
+    :param output: Каталог экспорта.
+    :param pages: Список (адрес страницы, путь файла относительно output).
+    :return: Адреса страниц, которые не удалось отрисовать.
+    """
+    factory = RequestFactory()
+    failed = []
+    for url, relpath in pages:
+        request = factory.get(url)
+        request.user = AnonymousUser()
+        match = resolve(request.path_info)
+        request.resolver_match = match
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.status_code != 200:
+            failed.append(f'{url} ({response.status_code})')
+            continue
+        _write_atomic(os.path.join(output, relpath), response.content)
+    return failed
+
+
+def _shop_pages(catalog) -> dict[str, tuple[str, str]]:
+    """
+    Страницы магазина: все сочетания категории, сортировки и направления.
+    Файл страницы с параметрами - shop/<строка запроса>.html, без параметров - index.html.
+
+    :return: Словарь {путь файла: (адрес, отпечаток данных)}.
+    """
+    categories = sorted({product['category'] for product in catalog.products.values()})
+    digests = {None: catalog.version}
+    for category in categories:  # Страница категории зависит только от её товаров
+        digests[category] = _digest(filtering_category(catalog.products, category, 'id'))
+    pages = {}
+    for category in (None, *categories):
+        variants = [(None, False)] + [(ordering, reverse) for ordering in SHOP_ORDERINGS for reverse in (False, True)]
+        for ordering, reverse in variants:
+            params = {key: value for key, value in (('category', category), ('ordering', ordering),
+                                                    ('reverse', 'true' if reverse else None)) if value is not None}
+            query = urlencode(params)
+            url = f'/?{query}' if query else '/'
+            pages[f'shop/{query}.html' if query else 'index.html'] = (url, digests[category])
+    return pages
+
+
+class Command(BaseCommand):
+    help = ("Экспортирует страницы магазина для анонимных пользователей в статические файлы: страницы всех товаров "
+            "(product/<slug>.html), все сочетания категории и сортировки главной страницы (index.html и "
+            "shop/<строка запроса>.html) и статические файлы с манифестом хешей (static/). Экспорт инкрементальный: "
+            "перерисовываются только страницы, данные которых (товар, связанные товары, шаблоны) изменились; "
+            "отрисовка идёт параллельно в нескольких процессах. Пример для nginx: "
+            "location = / { try_files /shop/$args.html /index.html; } location / { try_files $uri @django; }")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='static_export', help="Каталог экспорта")
+        parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="Количество рабочих процессов")
+        parser.add_argument('--force', action='store_true', help="Перерисовать все страницы")
+        parser.add_argument('--no-static', action='store_true', help="Не копировать статические файлы")
+
+    def handle(self, *args, **options):
+        output = options['output']
+        os.makedirs(output, exist_ok=True)
+        state_path = os.path.join(output, STATE_FILE)
+        state = {'pages': {}, 'static': {}}
+        if not options['force'] and os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as f:
+                state = json.load(f)
+
+        started = time.perf_counter()
+        catalog = reload_catalog()
+        get_recommender(build=True)  # Связанные товары входят в отпечаток страниц
+        templates = _templates_digest()
+        pages = {}  # Путь файла -> (адрес, отпечаток входных данных)
+        for product in catalog.products.values():
+            pages[f"product/{product['html']}.html"] = (f"/product/{product['html']}.html",
+                                                       _digest(product, related_products(product), templates))
+        for relpath, (url, digest) in _shop_pages(catalog).items():
+            pages[relpath] = (url, _digest(digest, templates))
+
+        changed = [(url, relpath) for relpath, (url, digest) in pages.items()
+                   if state['pages'].get(relpath) != digest or not os.path.exists(os.path.join(output, relpath))]
+        failed = self._render(output, changed, options['jobs'])
+        if failed:
+            raise CommandError("Не удалось отрисовать страницы: " + ', '.join(failed))
+
+        removed = [relpath for relpath in state['pages'] if relpath not in pages]
+        for relpath in removed:  # Товар убран из каталога
+            if os.path.exists(path := os.path.join(output, relpath)):
+                os.remove(path)
+        state['pages'] = {relpath: digest for relpath, (_, digest) in pages.items()}
+
+        copied = 0
+        if not options['no_static']:
+            copied = self._export_static(output, state)
+
+        _write_atomic(state_path, json.dumps(state, ensure_ascii=False, indent=1).encode())
+        self.stdout.write(f"Страниц: {len(pages)}, перерисовано {len(changed)}, удалено {len(removed)}; "
+                          f"статических файлов скопировано {copied}; "
+                          f"{time.perf_counter() - started:.2f} с, каталог {output}")
+
+    @staticmethod
+    def _render(output: str, pages: list[tuple[str, str]], jobs: int) -> list[str]:
+        """Отрисовывает страницы пачками по BATCH_SIZE в пуле процессов (в одном процессе при jobs <= 1)."""
+        batches = [pages[start:start + BATCH_SIZE] for start in range(0, len(pages), BATCH_SIZE)]
+        if jobs <= 1 or len(batches) <= 1:
+            return [url for batch in batches for url in _render_pages(output, batch)]
+        # Дочерние процессы создаются через fork и наследуют загруженный каталог и рекомендации;
+        # соединения с базой данных закрываются, чтобы процессы не делили один сокет
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(jobs, len(batches)),
+                                 mp_context=multiprocessing.get_context('fork')) as pool:
+            results = pool.map(_render_pages, [output] * len(batches), batches)
+            return [url for failed in results for url in failed]
+
+    @staticmethod
+    def _export_static(output: str, state: dict) -> int:
+        """
+        Копирует статические файлы всех приложений в <output>/static (изменившиеся по хешу)
+        и записывает манифест {путь: {'sha256': ..., 'size': ...}}.
+
+        :return: Количество скопированных файлов.
+        """
+        root = os.path.join(output, 'static')
+        manifest = {}
+        copied = 0
+        for finder in finders.get_finders():
+            for relpath, storage in finder.list(['CVS', '.*', '*~']):
+                if relpath in manifest:  # Как и collectstatic, берётся первый найденный файл
+                    continue
+                source = storage.path(relpath)
+                digest = _file_hash(source)
+                manifest[relpath] = {'sha256': digest, 'size': os.path.getsize(source)}
+                target = os.path.join(root, relpath)
+                if state['static'].get(relpath) != digest or not os.path.exists(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.copyfile(source, target)
+                    copied += 1
+        for relpath in set(state['static']) - set(manifest):
+            if os.path.exists(path := os.path.join(root, relpath)):
+                os.remove(path)
+        state['static'] = {relpath: item['sha256'] for relpath, item in manifest.items()}
+        _write_atomic(os.path.join(root, MANIFEST_FILE),
+                      json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True).encode())
+        return copied
@@ -0,0 +1,182 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from logic.services import CART_FILE, CART_SNAPSHOT_FILE, WISHLIST_FILE, WISHLIST_SNAPSHOT_FILE
+from logic.snapshot import source_stamp, write_snapshot
+from logic.synthetic import generate_baskets, generate_products
+from store.catalog import REQUIRED_FIELDS
+from store.models import CartItem, Category, Product
+from wishlist.models import WishlistItem
+
+FORMATS = ('json', 'csv', 'snapshot', 'db')
+BATCH_SIZE = 5000
+
+
+def _batches(items, size: int = BATCH_SIZE):
+    """Разбивает итерируемый объект на списки по size элементов."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def write_json_items(path: str, items) -> int:
+    """
+    Потоково записывает JSON-объект из пар (ключ, значение), не собирая его в памяти.
+    Файл заменяется атомарно.
+
+    :param path: Путь к файлу.
+    :param items: Итерируемый объект пар (ключ, значение).
+    :return: Количество записанных пар.
+    """
+    count = 0
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, mode='w', encoding='utf-8') as f:
+        f.write('{')
+        for key, value in items:
+            f.write(('' if not count else ', ') + json.dumps(str(key)) + ': '
+                    + json.dumps(value, ensure_ascii=False))
+            count += 1
+        f.write('}')
+    os.replace(tmp_path, path)
+    return count
+
+
+def write_csv_products(path: str, products) -> int:
+    """
+    Потоково записывает каталог в CSV (формат, который читает store.catalog.load_catalog_file).
+
+    :param path: Путь к файлу.
+    :param products: Итерируемый объект словарей товаров.
+    :return: Количество записанных товаров.
+    """
+    count = 0
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, mode='w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REQUIRED_FIELDS)
+        writer.writeheader()
+        for product in products:
+            writer.writerow(product)
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+class Command(BaseCommand):
+    help = ("Генерирует синтетический каталог и корзины/избранное пользователей для нагрузочных тестов. "
+            "Данные детерминированы (--seed) и пишутся потоково, поэтому объём памяти не зависит "
+            "от числа пользователей. Форматы: json (catalog.json, cart.json, wishlist.json), csv (catalog.csv), "
+            "snapshot (cart.snap, wishlist.snap, только вместе с json), "
+            "db (таблицы Product, CartItem, WishlistItem и пользователи). "
+            "Чтобы запустить сервер на этих данных, укажите DJANGO_CATALOG_PATH и запустите его из каталога --output.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help="Количество товаров")
+        parser.add_argument('--users', type=int, default=100000, help="Количество пользователей")
+        parser.add_argument('--cart-size', type=int, default=5, help="Среднее число позиций в корзине")
+        parser.add_argument('--wishlist-size', type=int, default=5, help="Среднее число товаров в избранном")
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help="Показатель Ципфа популярности товаров: 0 - равномерно, больше - сильнее перекос")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='synthetic_data', help="Каталог для файлов")
+        parser.add_argument('--format', action='append', choices=FORMATS, dest='formats',
+                            help="Формат (можно указать несколько раз), по умолчанию все файловые: json, csv, snapshot")
+        parser.add_argument('--replace-db', action='store_true',
+                            help="Для формата db: удалить существующие товары, категории, корзины и избранное")
+
+    def handle(self, *args, **options):
+        formats = options['formats'] or ['json', 'csv', 'snapshot']
+        if 'snapshot' in formats and 'json' not in formats:
+            # Снимок без исходного cart.json/wishlist.json сервер считает устаревшим и перезаписывает
+            raise CommandError("Формат snapshot пишется только вместе с json: добавьте --format json")
+        output = options['output']
+        os.makedirs(output, exist_ok=True)
+
+        def products():
+            return generate_products(options['products'], options['seed'])
+
+        def baskets():  # Повторная генерация с тем же seed дешевле, чем хранение всех пользователей в памяти
+            return generate_baskets(options['users'], options['products'], options['seed'], options['skew'],
+                                    options['cart_size'], options['wishlist_size'])
+
+        steps = []
+        if 'json' in formats:
+            steps += [('catalog.json', lambda: write_json_items(
+                          os.path.join(output, 'catalog.json'),
+                          ((product['id'], product) for product in products()))),
+                      (CART_FILE, lambda: write_json_items(
+                          os.path.join(output, CART_FILE), ((name, cart) for name, cart, _ in baskets()))),
+                      (WISHLIST_FILE, lambda: write_json_items(
+                          os.path.join(output, WISHLIST_FILE), ((name, wishlist) for name, _, wishlist in baskets())))]
+        if 'csv' in formats:
+            steps.append(('catalog.csv', lambda: write_csv_products(os.path.join(output, 'catalog.csv'), products())))
+        if 'snapshot' in formats:
+            # Снимок помечается отметкой JSON-файла, записанного выше: сервер считает его свежим
+            steps += [(CART_SNAPSHOT_FILE, lambda: write_snapshot(
+                          os.path.join(output, CART_SNAPSHOT_FILE), ((name, cart) for name, cart, _ in baskets()),
+                          source_stamp(os.path.join(output, CART_FILE)))),
+                      (WISHLIST_SNAPSHOT_FILE, lambda: write_snapshot(
+                          os.path.join(output, WISHLIST_SNAPSHOT_FILE),
+                          ((name, wishlist) for name, _, wishlist in baskets()),
+                          source_stamp(os.path.join(output, WISHLIST_FILE))))]
+        if 'db' in formats:
+            steps.append(('db', lambda: self._write_db(products(), baskets(), options['replace_db'])))
+
+        for name, step in steps:
+            started = time.perf_counter()
+            count = step()
+            self.stdout.write(f"{name}: {count} записей за {time.perf_counter() - started:.2f} с")
+
+        if 'json' in formats or 'csv' in formats:
+            self.stdout.write(f"Запуск на этих данных: cd {output} && DJANGO_CATALOG_PATH={os.path.abspath(output)}"
+                              f"/catalog.json python {settings.BASE_DIR / 'manage.py'} runserver")
+
+    @staticmethod
+    def _write_db(products, baskets, replace: bool) -> int:
+        """
+        Пишет товары, пользователей, корзины и избранное в базу данных пачками по BATCH_SIZE.
+
+        :return: Количество пользователей.
+        """
+        if replace:
+            with transaction.atomic():
+                for model in (CartItem, WishlistItem, Product, Category):
+                    model.objects.all().delete()
+        elif Product.objects.exists():
+            raise CommandError("В базе уже есть товары: добавьте --replace-db, чтобы заменить их синтетическими")
+
+        categories = {}
+        for batch in _batches(products):
+            with transaction.atomic():
+                for product in batch:
+                    if product['category'] not in categories:
+                        categories[product['category']] = Category.objects.get_or_create(name=product['category'])[0]
+                Product.objects.bulk_create(
+                    [Product(id=product['id'], category=categories[product['category']],
+                             **{field: product[field] for field in REQUIRED_FIELDS if field not in ('id', 'category')})
+                     for product in batch])
+
+        users = 0
+        for batch in _batches(baskets):
+            with transaction.atomic():
+                User.objects.bulk_create([User(username=name, password='!') for name, _, _ in batch],
+                                         ignore_conflicts=True)
+                ids = dict(User.objects.filter(username__in=[name for name, _, _ in batch])
+                           .values_list('username', 'id'))
+                CartItem.objects.bulk_create(
+                    [CartItem(user_id=ids[name], product_id=int(id_product), quantity=quantity)
+                     for name, cart, _ in batch for id_product, quantity in cart['products'].items()],
+                    ignore_conflicts=True)
+                WishlistItem.objects.bulk_create(
+                    [WishlistItem(user_id=ids[name], product_id=int(id_product))
+                     for name, _, wishlist in batch for id_product in wishlist['products']],
+                    ignore_conflicts=True)
+            users += len(batch)
+        return users
@@ -0,0 +1,92 @@
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Код холодного запуска: импорт точки входа и URLconf (со всеми представлениями), как перед первым запросом
+STARTUP_CODE = ("import time; started = time.perf_counter(); import project.{entry}; "
+                "from django.urls import get_resolver; get_resolver().url_patterns; "
+                "print(time.perf_counter() - started)")
+
+
+def cold_start(entry: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    """
+    Холодный запуск точки входа в новом процессе интерпретатора. Последняя строка stdout - время запуска, с.
+
+    :param entry: Точка входа: 'wsgi' или 'asgi'.
+    :param importtime: Запустить с `-X importtime` (профиль импорта в stderr).
+    :return: Результат subprocess.run.
+    """
+    env = dict(os.environ, DJANGO_WARMUP='0', PYTHONDONTWRITEBYTECODE='1')
+    env.pop('DJANGO_SETTINGS_MODULE', None)  # Точка входа сама выбирает настройки
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', STARTUP_CODE.format(entry=entry)]
+    result = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+    if result.returncode:
+        raise CommandError(f"Запуск project.{entry} завершился ошибкой:\n{result.stderr[-2000:]}")
+    return result
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """
+    Разбирает вывод `python -X importtime`.
+
+    :param stderr: Вывод интерпретатора в stderr.
+    :return: Список (модуль, собственное время мкс, накопленное время мкс, глубина вложенности).
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+class Command(BaseCommand):
+    help = ("Профиль импорта при холодном запуске project.wsgi (или project.asgi) вместе с URLconf: "
+            "самые медленные модули по накопленному и собственному времени (данные `python -X importtime`). "
+            "Команда завершается с ошибкой, если медиана времени запуска превышает бюджет "
+            "(settings.STARTUP_BUDGET_MS или --budget), "
+            "поэтому её можно запускать в CI как регрессионную проверку.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entry', choices=('wsgi', 'asgi'), default='wsgi', help="Точка входа")
+        parser.add_argument('--top', type=int, default=15, help="Сколько модулей показать")
+        parser.add_argument('--repeat', type=int, default=5, help="Сколько холодных запусков для замера времени")
+        parser.add_argument('--budget', type=float,
+                            help="Бюджет времени запуска в миллисекундах, 0 - не проверять "
+                                 "(по умолчанию settings.STARTUP_BUDGET_MS)")
+        parser.add_argument('--prefix', action='append', default=[],
+                            help="Показывать только модули с этим префиксом (можно указать несколько раз)")
+
+    def handle(self, *args, **options):
+        entry = options['entry']
+        imports = parse_importtime(cold_start(entry, importtime=True).stderr)
+        if options['prefix']:
+            imports = [item for item in imports if item[0].startswith(tuple(options['prefix']))]
+
+        row = "{:>10} {:>10}  {}"
+        for title, key in (("По накопленному времени", 2), ("По собственному времени", 1)):
+            self.stdout.write(f"{title} (мс):")
+            self.stdout.write(row.format('накоплен.', 'собств.', 'модуль'))
+            for name, self_us, cumulative_us, depth in sorted(imports, key=lambda item: item[key],
+                                                              reverse=True)[:options['top']]:
+                self.stdout.write(row.format(f"{cumulative_us / 1000:.1f}", f"{self_us / 1000:.1f}",
+                                             '  ' * depth + name))
+            self.stdout.write('')
+
+        # Время запуска меряется отдельно: -X importtime само замедляет импорт
+        timings = [float(cold_start(entry).stdout.split()[-1]) * 1000 for _ in range(max(options['repeat'], 1))]
+        median = statistics.median(timings)
+        self.stdout.write(f"Холодный запуск project.{entry} + URLconf: медиана {median:.1f} мс, "
+                          f"минимум {min(timings):.1f} мс, запусков {len(timings)}")
+
+        budget = options['budget'] if options['budget'] is not None else settings.STARTUP_BUDGET_MS
+        if budget:
+            if median > budget:
+                raise CommandError(f"Время запуска {median:.1f} мс превышает бюджет {budget:.0f} мс")
+            self.stdout.write(f"Бюджет {budget:.0f} мс соблюдён")
@@ -0,0 +1,43 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logic.loadtest import run_load
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный прогон по одному или нескольким запущенным серверам и сравнение RPS и перцентилей "
+            "времени ответа. Например, WSGI с несколькими процессами против одного процесса ASGI:\n"
+            "  gunicorn project.wsgi -w 4 -b 127.0.0.1:8001\n"
+            "  uvicorn project.asgi:application --port 8002\n"
+            "  python manage.py loadtest --target wsgi=http://127.0.0.1:8001/wishlist/api/ "
+            "--target asgi=http://127.0.0.1:8002/wishlist/api/ --cookie sessionid=... -c 50 -n 5000")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                            help="Название и адрес сервера (можно указать несколько раз)")
+        parser.add_argument('-c', '--concurrency', type=int, default=10, help="Одновременных соединений")
+        parser.add_argument('-n', '--requests', type=int, default=1000, help="Количество запросов на цель")
+        parser.add_argument('-d', '--duration', type=float, help="Длительность прогона в секундах вместо -n")
+        parser.add_argument('--cookie', help="Значение заголовка Cookie, например sessionid=...")
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, sep, url = target.partition('=')
+            if not sep or not url.startswith(('http://', 'https://')):
+                raise CommandError(f"Неверная цель {target!r}, ожидается NAME=http://host:port/path")
+            targets.append((name, url))
+
+        headers = {'Cookie': options['cookie']} if options['cookie'] else {}
+        requests = None if options['duration'] else options['requests']
+
+        row = "{:<12} {:>8} {:>10} {:>9} {:>9} {:>9} {:>9} {:>7}  {}"
+        self.stdout.write(row.format('target', 'requests', 'rps', 'p50, мс', 'p90, мс', 'p99, мс', 'max, мс',
+                                     'errors', 'statuses'))
+        for name, url in targets:  # Цели прогоняются по очереди, чтобы не мешать друг другу
+            result = asyncio.run(run_load(url, options['concurrency'], requests, options['duration'], headers))
+            summary = result.summary()
+            self.stdout.write(row.format(name, summary['requests'], summary['rps'], summary['p50'],
+                                         summary['p90'], summary['p99'], summary['max'], summary['errors'],
+                                         summary['statuses']))
@@ -0,0 +1,34 @@
+import os
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store.catalog import load_catalog_file
+
+
+class Command(BaseCommand):
+    help = ("Проверяет файл каталога и запускает его перезагрузку в работающих процессах: "
+            "обновляет время изменения файла (подхватывается фоновым потоком) и/или посылает сигнал процессам.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pid', type=int, action='append', default=[],
+                            help="PID процесса, которому послать сигнал перезагрузки (можно указать несколько раз)")
+
+    def handle(self, *args, **options):
+        path = settings.CATALOG_PATH
+        try:
+            products = load_catalog_file(path)  # Не даём перезагрузить каталог с ошибкой
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Каталог {path} не прошёл проверку: {exc}")
+
+        os.utime(path)
+        self.stdout.write(f"Каталог {path} проверен: {len(products)} товаров")
+
+        if options['pid']:
+            signal_name = settings.CATALOG_RELOAD_SIGNAL
+            if not signal_name or not hasattr(signal, signal_name):
+                raise CommandError("Сигнал перезагрузки каталога не настроен (settings.CATALOG_RELOAD_SIGNAL)")
+            for pid in options['pid']:
+                os.kill(pid, getattr(signal, signal_name))
+                self.stdout.write(f"Сигнал {signal_name} отправлен процессу {pid}")
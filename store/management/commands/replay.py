@@ -0,0 +1,66 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from logic.loadtest import percentile, read_log, replay
+
+
+class Command(BaseCommand):
+    help = ("Воспроизведение журнала запросов (DJANGO_REQUEST_LOG=1, settings.REQUEST_LOG_PATH) на запущенном "
+            "сервере в исходном темпе или ускоренно, с отчётом о перцентилях времени ответа по маршрутам. "
+            "Рядом выводится время обработки из журнала (исходное, на сервере) и опоздание отправки "
+            "относительно расписания: если оно растёт, сервер не справляется с исходной нагрузкой. "
+            "Воспроизводятся запросы GET и HEAD. Например:\n"
+            "  python manage.py replay http://127.0.0.1:8000 --speed 2 -c 50 --cookie sessionid=...\n"
+            "  python manage.py replay http://127.0.0.1:8000 --user 1=sessionid=... --user 2=sessionid=...")
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="Адрес сервера, например http://127.0.0.1:8000")
+        parser.add_argument('--log', default=settings.REQUEST_LOG_PATH, help="Файл журнала запросов")
+        parser.add_argument('-c', '--concurrency', type=int, default=10, help="Одновременных соединений")
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help="Ускорение относительно журнала: 1 - исходный темп, 0 - без пауз")
+        parser.add_argument('-n', '--limit', type=int, help="Воспроизвести только первые N запросов")
+        parser.add_argument('--cookie', help="Заголовок Cookie всех запросов, например sessionid=...")
+        parser.add_argument('--user', action='append', default=[], metavar='ID=COOKIE',
+                            help="Заголовок Cookie запросов пользователя журнала (можно указать несколько раз)")
+
+    def handle(self, *args, **options):
+        if not options['url'].startswith(('http://', 'https://')):
+            raise CommandError(f"Неверный адрес {options['url']!r}, ожидается http://host:port")
+        if options['speed'] < 0 or options['concurrency'] < 1:
+            raise CommandError("--speed должен быть не меньше 0, --concurrency - не меньше 1")
+        user_headers = {}
+        for user in options['user']:
+            user_id, sep, cookie = user.partition('=')
+            if not sep or not cookie:
+                raise CommandError(f"Неверное значение --user {user!r}, ожидается ID=COOKIE")
+            user_headers[user_id] = {'Cookie': cookie}
+        try:
+            entries, skipped = read_log(options['log'], limit=options['limit'])
+        except FileNotFoundError:
+            raise CommandError(f"Нет журнала запросов {options['log']}")
+        if not entries:
+            raise CommandError(f"В журнале {options['log']} нет запросов для воспроизведения")
+
+        headers = {'Cookie': options['cookie']} if options['cookie'] else {}
+        result = asyncio.run(replay(options['url'], entries, options['concurrency'], options['speed'],
+                                    headers, user_headers))
+
+        self.stdout.write(f"Запросов: {len(entries)} (пропущено строк: {skipped}), журнал: {result.span:.1f} с, "
+                          f"воспроизведение: {result.elapsed:.1f} с, опоздание отправки p50/p99/max: "
+                          f"{percentile(result.lags, 50) * 1000:.1f}/{percentile(result.lags, 99) * 1000:.1f}/"
+                          f"{percentile(result.lags, 100) * 1000:.1f} мс")
+        row = "{:<40} {:>8} {:>9} {:>9} {:>9} {:>9} {:>11} {:>11} {:>7}  {}"
+        self.stdout.write(row.format('route', 'requests', 'p50, мс', 'p90, мс', 'p99, мс', 'max, мс',
+                                     'журнал p50', 'журнал p99', 'errors', 'statuses'))
+        rows = [(name, load, result.recorded[name])
+                for name, load in sorted(result.routes.items(), key=lambda item: -len(result.recorded[item[0]]))]
+        rows.append(('всего', result.total(), [value for values in result.recorded.values() for value in values]))
+        for name, load, recorded in rows:
+            summary = load.summary()
+            self.stdout.write(row.format(name[:40], summary['requests'], summary['p50'], summary['p90'],
+                                         summary['p99'], summary['max'], round(percentile(recorded, 50) * 1000, 2),
+                                         round(percentile(recorded, 99) * 1000, 2), summary['errors'],
+                                         summary['statuses']))
@@ -0,0 +1,83 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from logic.warmup import memory_usage, warmup
+
+# Запросы, которые выполняет каждый рабочий процесс, как первые запросы после запуска
+FIRST_REQUESTS = ('/', '/product/', '/product/1', '/search/?q=пер', '/product/facets/')
+
+
+def _startup_time(warm: bool) -> float:
+    """
+    Время холодного импорта project.wsgi в отдельном процессе.
+
+    :param warm: С прогревом (DJANGO_WARMUP=1) или без.
+    :return: Время в секундах.
+    """
+    env = dict(os.environ, DJANGO_WARMUP='1' if warm else '0')
+    code = "import time; t = time.perf_counter(); import project.wsgi; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, '-c', code], env=env, cwd=settings.BASE_DIR,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.split()[-1])
+
+
+def _run_worker() -> dict:
+    """Первые запросы рабочего процесса: длительность и память после них."""
+    client = Client(HTTP_HOST='localhost')
+    started = time.perf_counter()
+    for url in FIRST_REQUESTS:
+        client.get(url)
+    return {'first_requests': time.perf_counter() - started, **memory_usage()}
+
+
+class Command(BaseCommand):
+    help = ("Прогревает процесс (каталог, индексы, рекомендации, шаблоны, gc.freeze) и измеряет эффект: "
+            "время холодного запуска project.wsgi, время первых запросов и память рабочих процессов, "
+            "созданных через fork после прогрева. В рабочем режиме прогрев включается переменной "
+            "DJANGO_WARMUP=1 вместе с gunicorn --preload.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Сколько рабочих процессов создать через fork")
+        parser.add_argument('--no-warmup', action='store_true', help="Не прогревать процесс перед fork (для сравнения)")
+        parser.add_argument('--no-freeze', action='store_true', help="Прогреть без gc.freeze (для сравнения)")
+        parser.add_argument('--skip-startup', action='store_true', help="Не измерять время холодного запуска")
+
+    def handle(self, *args, **options):
+        if not options['skip_startup']:
+            cold, warm = _startup_time(False), _startup_time(True)
+            self.stdout.write(f"Холодный запуск project.wsgi: {cold:.3f} с без прогрева, {warm:.3f} с с прогревом")
+
+        if not options['no_warmup']:
+            result = warmup(freeze=not options['no_freeze'])
+            stages = ', '.join(f"{name} {seconds * 1000:.1f} мс" for name, seconds in result['timings'].items())
+            self.stdout.write(f"Прогрев: {stages}; товаров {result['products']}, представлений {result['views']}, "
+                              f"шаблонов {result['templates']}, объектов в gc.freeze {result['frozen']}")
+        self.stdout.write(f"Главный процесс: {memory_usage()} КБ")
+
+        if not hasattr(os, 'fork') or options['workers'] <= 0:
+            return
+        row = "{:<8} {:>14} {:>10} {:>10} {:>10} {:>10}"
+        self.stdout.write(row.format('worker', 'первые, мс', 'rss, КБ', 'pss, КБ', 'shared, КБ', 'private, КБ'))
+        for number in range(options['workers']):
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+            if pid == 0:  # Рабочий процесс
+                os.close(read_fd)
+                try:
+                    os.write(write_fd, json.dumps(_run_worker()).encode())
+                finally:
+                    os._exit(0)
+            os.close(write_fd)
+            with os.fdopen(read_fd) as f:
+                stats = json.loads(f.read() or '{}')
+            os.waitpid(pid, 0)
+            self.stdout.write(row.format(number + 1, round(stats.get('first_requests', 0) * 1000, 1),
+                                         stats.get('rss', '-'), stats.get('pss', '-'),
+                                         stats.get('shared', '-'), stats.get('private', '-')))
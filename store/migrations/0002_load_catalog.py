@@ -0,0 +1,79 @@
+import json
+import os
+
+from django.conf import settings
+from django.db import migrations
+
+# Файл каталога на момент создания миграции. Миграция не зависит от кода приложения и настройки CATALOG_PATH:
+# их изменения не должны ломать migrate на чистой базе. Дальше товары переносит store.catalog.sync_products_db
+CATALOG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'catalog.json')
+
+
+def read_catalog(path: str) -> dict[str, dict]:
+    """Товары файла каталога: словарь {id: товар} или список товаров."""
+    with open(path, encoding='utf-8') as f:
+        products = json.load(f)
+    if isinstance(products, dict):
+        products = list(products.values())
+    return {str(product['id']): product for product in products}
+
+
+def load_catalog(apps, schema_editor):
+    """Перенос товаров из файла каталога и корзин из cart.json в базу данных."""
+    catalog = read_catalog(CATALOG_FILE) if os.path.exists(CATALOG_FILE) else {}
+
+    Category = apps.get_model('store', 'Category')
+    Product = apps.get_model('store', 'Product')
+    CartItem = apps.get_model('store', 'CartItem')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    categories = {name: Category.objects.get_or_create(name=name)[0]
+                  for name in {product['category'] for product in catalog.values()}}
+    Product.objects.bulk_create(
+        [Product(id=product['id'],
+                 name=product['name'],
+                 html=product['html'],
+                 category=categories[product['category']],
+                 discount=product['discount'],
+                 price_before=product['price_before'],
+                 price_after=product['price_after'],
+                 description=product['description'],
+                 rating=product['rating'],
+                 review=product['review'],
+                 sold_value=product['sold_value'],
+                 weight_in_stock=product['weight_in_stock'],
+                 url=product['url'])
+         for product in catalog.values()],
+        ignore_conflicts=True,
+    )
+
+    cart_path = os.path.join(settings.BASE_DIR, 'cart.json')
+    if not os.path.exists(cart_path):
+        return
+    with open(cart_path, encoding='utf-8') as f:
+        cart_users = json.load(f)
+    users = User.objects.in_bulk(cart_users.keys(), field_name='username')
+    product_ids = set(Product.objects.values_list('id', flat=True))
+    CartItem.objects.bulk_create(
+        [CartItem(user=users[username], product_id=int(id_product), quantity=quantity)
+         for username, cart in cart_users.items() if username in users
+         for id_product, quantity in cart['products'].items() if int(id_product) in product_ids],
+        ignore_conflicts=True,
+    )
+
+
+def unload_catalog(apps, schema_editor):
+    apps.get_model('store', 'CartItem').objects.all().delete()
+    apps.get_model('store', 'Product').objects.all().delete()
+    apps.get_model('store', 'Category').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(load_catalog, unload_catalog),
+    ]
@@ -0,0 +1,244 @@
+"""
+Таблицы купонов и стоимости доставки.
+
+Таблицы загружаются из файлов (settings.COUPONS_PATH, settings.DELIVERY_PATH) и при загрузке
+компилируются в словари, поэтому проверка купона и расчёт доставки - поиск по ключу за O(1).
+При изменении файла таблица перечитывается без перезапуска процесса (проверка времени изменения
+не чаще раза в settings.PRICING_RULES_CHECK_INTERVAL секунд) и атомарно подменяется.
+
+Формат купонов - список объектов:
+    {"code": "coupon", "value": 10, "is_active": true, "valid_from": "2024-01-01T00:00:00+00:00",
+     "valid_until": null, "max_uses": 100}
+max_uses - лимит применений купона (null - без лимита). Применения считаются в базе данных
+(модель CouponRedemption), купон списывается при оформлении заказа (redeem_coupon).
+
+Формат доставки - страны с ценой по умолчанию, регионами, городами и почтовыми индексами (по префиксу):
+    {"Россия": {"price": 120,
+                "cities": {"Москва": 90},
+                "regions": {"Ленинградская область": {"price": 110, "cities": {"Гатчина": 100}}},
+                "postal_codes": {"195": 65}}}
+"""
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable
+
+from django.conf import settings
+from django.db.models import F
+
+from store.models import CouponRedemption
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Coupon:
+    code: str
+    value: int  # Скидка в процентах
+    is_active: bool = True
+    valid_from: datetime | None = None
+    valid_until: datetime | None = None
+    max_uses: int | None = None  # Лимит применений, None - без лимита
+
+    def is_valid(self, now: datetime | None = None, uses: int | None = None) -> bool:
+        """
+        Действует ли купон: включён, попадает в окно действия и лимит применений не исчерпан.
+
+        :param now: [Опционально] Момент проверки, по умолчанию текущее время.
+        :param uses: [Опционально] Число применений купона, по умолчанию читается из базы данных
+                     (только для купонов с лимитом).
+        :return: True, если купон можно применить.
+        """
+        now = now or datetime.now(timezone.utc)
+        if not (self.is_active
+                and (self.valid_from is None or self.valid_from <= now)
+                and (self.valid_until is None or now < self.valid_until)):
+            return False
+        if self.max_uses is None:
+            return True
+        return (coupon_uses(self.code) if uses is None else uses) < self.max_uses
+
+
+def _parse_datetime(value: str | None) -> datetime | None:
+    """ISO-дата из файла купонов; дата без часового пояса считается UTC."""
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def compile_coupons(data: list[dict]) -> dict[str, Coupon]:
+    """
+    Компилирует список купонов в словарь по коду.
+
+    :param data: Содержимое файла купонов.
+    :return: Словарь {код купона: Coupon}.
+    """
+    return {item['code']: Coupon(code=item['code'],
+                                 value=item['value'],
+                                 is_active=item.get('is_active', True),
+                                 valid_from=_parse_datetime(item.get('valid_from')),
+                                 valid_until=_parse_datetime(item.get('valid_until')),
+                                 max_uses=item.get('max_uses'))
+            for item in data}
+
+
+def _key(value: str | None) -> str:
+    """Нормализация названий страны, региона и города для поиска без учёта регистра и пробелов."""
+    return (value or '').strip().casefold().replace('ё', 'е')
+
+
+@dataclass(frozen=True)
+class DeliveryTable:
+    """Скомпилированная таблица доставки: плоские словари для каждого уровня уточнения адреса."""
+    countries: dict  # страна -> цена по умолчанию
+    regions: dict  # (страна, регион) -> цена
+    cities: dict  # (страна, регион, город) -> цена; регион '' для городов без региона
+    cities_any_region: dict  # (страна, город) -> цена, если регион не передан
+    postal_codes: dict  # (страна, префикс индекса) -> цена
+    max_prefix: int  # Длина самого длинного префикса индекса
+
+    def price(self, country: str | None, city: str | None = None,
+              region: str | None = None, code: str | None = None) -> int | float | None:
+        """
+        Стоимость доставки с уточнением от почтового индекса к стране:
+        индекс (самый длинный подходящий префикс) -> город в регионе -> город -> регион -> страна.
+
+        :param country: Страна.
+        :param city: [Опционально] Город.
+        :param region: [Опционально] Регион.
+        :param code: [Опционально] Почтовый индекс.
+        :return: Стоимость доставки или None, если в страну не доставляем.
+        """
+        country = _key(country)
+        if country not in self.countries:
+            return None
+        code = (code or '').strip()
+        for length in range(min(len(code), self.max_prefix), 0, -1):
+            if (price := self.postal_codes.get((country, code[:length]))) is not None:
+                return price
+        city, region = _key(city), _key(region)
+        if city:
+            if (price := self.cities.get((country, region, city))) is not None:
+                return price
+            if not region and (price := self.cities_any_region.get((country, city))) is not None:
+                return price
+        if region and (price := self.regions.get((country, region))) is not None:
+            return price
+        return self.countries[country]
+
+
+def compile_delivery(data: dict) -> DeliveryTable:
+    """
+    Компилирует вложенную таблицу доставки в плоские словари.
+
+    :param data: Содержимое файла доставки.
+    :return: DeliveryTable.
+    """
+    countries, regions, cities, cities_any_region, postal_codes = {}, {}, {}, {}, {}
+    for country, rules in data.items():
+        country = _key(country)
+        countries[country] = rules.get('price')
+        for city, price in rules.get('cities', {}).items():
+            cities[(country, '', _key(city))] = price
+            cities_any_region[(country, _key(city))] = price
+        for region, region_rules in rules.get('regions', {}).items():
+            region = _key(region)
+            regions[(country, region)] = region_rules.get('price', countries[country])
+            for city, price in region_rules.get('cities', {}).items():
+                cities[(country, region, _key(city))] = price
+                cities_any_region.setdefault((country, _key(city)), price)
+        for prefix, price in rules.get('postal_codes', {}).items():
+            postal_codes[(country, prefix)] = price
+    max_prefix = max((len(prefix) for _, prefix in postal_codes), default=0)
+    return DeliveryTable(countries, regions, cities, cities_any_region, postal_codes, max_prefix)
+
+
+class RuleTable:
+    """Таблица правил, скомпилированная из файла и перечитываемая при его изменении."""
+
+    def __init__(self, setting: str, compile_rules: Callable):
+        self.setting = setting  # Имя настройки с путём к файлу
+        self.compile_rules = compile_rules
+        self._table = None
+        self._mtime_ns = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Текущая скомпилированная таблица. Время изменения файла проверяется не чаще раза
+        в settings.PRICING_RULES_CHECK_INTERVAL секунд; при ошибке в новом файле остаётся прежняя таблица.
+
+        :return: Скомпилированная таблица.
+        """
+        now = time.monotonic()
+        if self._table is not None and now - self._checked_at < settings.PRICING_RULES_CHECK_INTERVAL:
+            return self._table
+        with self._lock:
+            self._checked_at = now
+            path = getattr(settings, self.setting)
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+                if mtime_ns != self._mtime_ns:
+                    with open(path, encoding='utf-8') as f:
+                        table = self.compile_rules(json.load(f))
+                    self._table, self._mtime_ns = table, mtime_ns
+            except (OSError, ValueError, KeyError, TypeError) as exc:
+                if self._table is None:
+                    raise
+                logger.error("Правила %s не загружены, используются прежние: %s", path, exc)
+        return self._table
+
+
+coupons = RuleTable('COUPONS_PATH', compile_coupons)
+delivery = RuleTable('DELIVERY_PATH', compile_delivery)
+
+
+def get_coupon(code: str) -> Coupon | None:
+    """
+    Купон по коду.
+
+    :param code: Код купона.
+    :return: Coupon или None, если такого купона нет.
+    """
+    return coupons.get().get(code)
+
+
+def delivery_price(country: str | None, city: str | None = None,
+                   region: str | None = None, code: str | None = None) -> int | float | None:
+    """
+    Стоимость доставки по адресу, см. DeliveryTable.price.
+
+    :return: Стоимость доставки или None, если в страну не доставляем.
+    """
+    return delivery.get().price(country, city, region, code)
+
+
+def coupon_uses(code: str) -> int:
+    """
+    Число применений купона.
+
+    :param code: Код купона.
+    :return: Сколько раз купон был списан при оформлении заказа.
+    """
+    return CouponRedemption.objects.filter(code=code).values_list('used', flat=True).first() or 0
+
+
+def redeem_coupon(coupon: Coupon) -> bool:
+    """
+    Списывает одно применение купона. Проверка лимита и увеличение счётчика выполняются одним
+    условным UPDATE, поэтому параллельные заказы не превышают max_uses.
+
+    :param coupon: Купон.
+    :return: True, если применение списано; False, если лимит уже исчерпан.
+    """
+    CouponRedemption.objects.get_or_create(code=coupon.code)
+    redemptions = CouponRedemption.objects.filter(code=coupon.code)
+    if coupon.max_uses is not None:
+        redemptions = redemptions.filter(used__lt=coupon.max_uses)
+    return redemptions.update(used=F('used') + 1) == 1
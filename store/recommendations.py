@@ -0,0 +1,286 @@
+"""
+Рекомендации «похожие товары» для страницы товара.
+
+Для каждого товара заранее вычисляется список из RECOMMENDATIONS_TOP_K связанных товаров с учётом:
+    - совместной встречаемости в корзинах и избранном пользователей;
+    - совпадения категории;
+    - популярности товара (rating, sold_value) для упорядочивания равных кандидатов.
+
+Таблица хранится в памяти и отдаётся за O(K). Строит её фоновый поток (или прогрев процесса, logic.warmup),
+а не запрос: пока таблица не построена, выводятся товары той же категории. Добавление товара в корзину
+или избранное и его удаление (logic.services.on_basket_change) только ставятся в очередь; фоновый поток раз в
+settings.RECOMMENDATIONS_REFRESH_INTERVAL секунд применяет их к статистике пар (за время, пропорциональное
+размеру корзины пользователя) и пересчитывает рекомендации затронутых товаров. Изменения других процессов
+учитываются полной сверкой со всеми корзинами и избранным раз в settings.RECOMMENDATIONS_RESYNC_INTERVAL секунд.
+При смене версии каталога таблица пересобирается целиком.
+"""
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from itertools import islice
+
+from django.conf import settings
+
+from logic.services import iter_user_products, on_basket_change
+from .catalog import Catalog, get_catalog
+
+logger = logging.getLogger(__name__)
+
+CO_OCCURRENCE_WEIGHT = 1.0  # Вес одной совместной встречи товаров у пользователя
+CATEGORY_WEIGHT = 2.0  # Вес совпадения категории
+POPULARITY_WEIGHT = 0.5  # Вес популярности кандидата, различает кандидатов с одинаковыми сигналами
+MAX_BASKET = 200  # Сколько последних товаров пользователя учитывается при подсчёте пар
+
+
+class Recommender:
+    """Таблица рекомендаций и статистика совместной встречаемости товаров."""
+
+    def __init__(self, top_k: int):
+        self.top_k = top_k
+        self.catalog_version = None  # None - таблица ещё не построена
+        self.table: dict[str, tuple[str, ...]] = {}
+        self.co_occurrence: dict[str, Counter] = {}
+        # Имя пользователя -> {id товара: в скольких списках (корзина, избранное) он есть}, в порядке добавления
+        self.baskets: dict[str, dict[str, int]] = {}
+        self._changes = deque()  # Изменения списков пользователей, ждут применения (note_change)
+        self._popular = {}  # Категория -> самые популярные товары категории
+        self._popularity = {}
+        self._lock = threading.Lock()
+
+    def _prepare_catalog(self, catalog: Catalog) -> None:
+        """Популярность товаров и лидеры каждой категории для нового снимка каталога."""
+        max_sold = max((product['sold_value'] or 0 for product in catalog.products.values()), default=0)
+        log_max_sold = math.log1p(max_sold) or 1.0
+        self._popularity = {id_product: 0.5 * (product['rating'] or 0) / 5
+                            + 0.5 * math.log1p(product['sold_value'] or 0) / log_max_sold
+                            for id_product, product in catalog.products.items()}
+        self._popular = {category: heapq.nlargest(self.top_k + 1, (str(product['id']) for product in products),
+                                                  key=self._popularity.__getitem__)
+                         for category, products in catalog.by_category.items()}
+
+    @staticmethod
+    def _window(basket: dict[str, int]) -> frozenset:
+        """Товары пользователя, учитываемые в статистике: последние MAX_BASKET добавленных."""
+        return frozenset(islice(reversed(basket), MAX_BASKET))
+
+    def _add_pair(self, first: str, second: str, delta: int) -> None:
+        counter = self.co_occurrence.setdefault(first, Counter())
+        counter[second] += delta
+        if counter[second] <= 0:
+            del counter[second]
+            if not counter:  # Пустые счётчики не копятся для товаров, ушедших из всех списков
+                del self.co_occurrence[first]
+
+    def _shift_pairs(self, old: frozenset, new: frozenset) -> None:
+        """
+        Заменяет в статистике пары товаров пользователя old на пары new. Затрагиваются только пары с изменившимися
+        товарами, поэтому одно добавление или удаление стоит O(размер корзины), а не O(размер корзины ** 2).
+        """
+        for products, changed, delta in ((old, old - new, -1), (new, new - old, 1)):
+            for first in changed:
+                for second in products:
+                    if first != second:
+                        self._add_pair(first, second, delta)
+                        if second not in changed:  # Пары между двумя изменившимися товарами учтены выше
+                            self._add_pair(second, first, delta)
+
+    def _apply_change(self, username: str, id_product: str, delta: int) -> set[str]:
+        """
+        Применяет изменение списка пользователя к его товарам и статистике пар.
+
+        :return: Товары, рекомендации которых нужно пересчитать.
+        """
+        basket = self.baskets.setdefault(username, {})
+        old = self._window(basket)
+        if (count := basket.get(id_product, 0) + delta) > 0:
+            basket[id_product] = count
+        else:
+            basket.pop(id_product, None)
+        if not basket:
+            del self.baskets[username]
+        new = self._window(basket)
+        if old == new:
+            return set()
+        self._shift_pairs(old, new)
+        return old | new
+
+    def note_change(self, username: str, id_product: str, delta: int) -> None:
+        """
+        Ставит в очередь изменение списка пользователя (вызывается из запросов, поэтому только запоминает его).
+
+        :param username: Имя пользователя.
+        :param id_product: id товара.
+        :param delta: 1 - товар добавлен в корзину или избранное, -1 - убран из них.
+        """
+        self._changes.append((username, id_product, delta))
+
+    def _compute(self, catalog: Catalog, id_product: str) -> tuple[str, ...]:
+        """
+        Вычисляет связанные товары для одного товара. Кандидаты - товары, встречавшиеся вместе с ним,
+        и лидеры его категории, поэтому время не зависит от размера категории.
+
+        :param catalog: Снимок каталога.
+        :param id_product: id товара.
+        :return: Кортеж id связанных товаров по убыванию оценки.
+        """
+        product = catalog.products[id_product]
+        category = product['category']
+        scores = {}
+        for other, count in self.co_occurrence.get(id_product, {}).items():
+            if (other_product := catalog.products.get(other)) is not None:
+                same_category = other_product['category'] == category
+                scores[other] = CO_OCCURRENCE_WEIGHT * count + (CATEGORY_WEIGHT if same_category else 0)
+        for other in self._popular.get(category, ()):
+            if other not in scores:
+                scores[other] = CATEGORY_WEIGHT
+        scores.pop(id_product, None)
+        for other in scores:
+            scores[other] += POPULARITY_WEIGHT * self._popularity[other]
+        return tuple(heapq.nlargest(self.top_k, scores, key=scores.__getitem__))
+
+    def resync(self) -> int:
+        """
+        Перечитывает корзины и избранное всех пользователей (O(всех пользователей)) и обновляет таблицу:
+        строит её впервые и сверяет с изменениями, сделанными другими процессами.
+
+        :return: Количество товаров, для которых пересчитаны рекомендации.
+        """
+        with self._lock:
+            self._changes.clear()  # Изменения до чтения уже есть в файлах или базе
+            baskets = dict(iter_user_products())
+            touched = set()
+            for username in self.baskets.keys() | baskets.keys():
+                old = self._window(self.baskets.get(username, {}))
+                new = self._window(baskets.get(username, {}))
+                if old != new:
+                    self._shift_pairs(old, new)
+                    touched |= old | new
+            self.baskets = baskets
+            return self._update_table(touched)
+
+    def refresh(self) -> int:
+        """
+        Применяет накопленные изменения списков пользователей (note_change) и обновляет таблицу.
+
+        :return: Количество товаров, для которых пересчитаны рекомендации.
+        """
+        with self._lock:
+            touched = set()
+            while self._changes:
+                touched |= self._apply_change(*self._changes.popleft())
+            return self._update_table(touched)
+
+    def _update_table(self, touched: set[str]) -> int:
+        """Пересчитывает рекомендации затронутых товаров или всю таблицу, если сменился каталог."""
+        catalog = get_catalog()
+        if catalog.version != self.catalog_version:  # Новый каталог - пересборка всей таблицы
+            self._prepare_catalog(catalog)
+            self.table = {id_product: self._compute(catalog, id_product) for id_product in catalog.products}
+            self.catalog_version = catalog.version
+            return len(self.table)
+
+        for id_product in touched & catalog.products.keys():
+            self.table[id_product] = self._compute(catalog, id_product)  # Замена значения атомарна для читателей
+        return len(touched)
+
+    def related(self, id_product: str | int) -> tuple[str, ...]:
+        """
+        Связанные товары из готовой таблицы.
+
+        :param id_product: id товара.
+        :return: Кортеж id связанных товаров.
+        """
+        return self.table.get(str(id_product), ())
+
+
+_recommender = None
+_refresher = None
+_init_lock = threading.Lock()
+
+
+def _refresh_loop(recommender: Recommender, interval: float, resync_interval: float) -> None:
+    """Фоновый поток: строит таблицу, если её ещё нет, затем применяет изменения и периодически сверяет её."""
+    resynced = time.monotonic()
+    while True:
+        try:
+            if recommender.catalog_version is None or (
+                    resync_interval and time.monotonic() - resynced >= resync_interval):
+                recommender.resync()
+                resynced = time.monotonic()
+            else:
+                recommender.refresh()
+        except Exception:
+            logger.exception("Ошибка обновления рекомендаций")
+        if not interval:
+            return
+        time.sleep(interval)
+
+
+def get_recommender(build: bool = False, start: bool = True) -> Recommender:
+    """
+    Возвращает таблицу рекомендаций процесса. Первое обращение запускает фоновый поток, который строит таблицу
+    и затем обновляет её (settings.RECOMMENDATIONS_REFRESH_INTERVAL секунд, 0 - не обновлять), поэтому запрос
+    построения не ждёт (см. related_products).
+
+    :param build: Построить таблицу в текущем потоке, если она ещё не построена (прогрев, экспорт страниц).
+    :param start: Запустить фоновый поток. Прогрев перед fork передаёт False: потоки не переживают fork,
+                  а поток в главном процессе менял бы объекты, замороженные gc.freeze.
+    :return: Объект Recommender.
+    """
+    global _recommender, _refresher
+    interval = settings.RECOMMENDATIONS_REFRESH_INTERVAL
+    recommender, refresher = _recommender, _refresher
+    # Поток обновления проверяется при каждом обращении: после fork в дочернем процессе его нет
+    if (recommender is not None and not (build and recommender.catalog_version is None)
+            and (not start or refresher is not None and refresher.is_alive()
+                 or not interval and recommender.catalog_version)):
+        return recommender
+    with _init_lock:
+        if _recommender is None:
+            _recommender = Recommender(settings.RECOMMENDATIONS_TOP_K)
+        if build and _recommender.catalog_version is None:
+            _recommender.resync()
+        if start and (_refresher is None or not _refresher.is_alive()) and (
+                interval or _recommender.catalog_version is None):
+            _refresher = threading.Thread(target=_refresh_loop,
+                                          args=(_recommender, interval, settings.RECOMMENDATIONS_RESYNC_INTERVAL),
+                                          name='recommendations-refresh', daemon=True)
+            _refresher.start()
+    return _recommender
+
+
+def _note_change(username: str, id_product: str, delta: int) -> None:
+    """Передаёт изменение списка пользователя таблице рекомендаций (до её создания изменения не нужны)."""
+    if _recommender is not None:
+        _recommender.note_change(username, id_product, delta)
+
+
+def related_products(product: dict) -> list[dict]:
+    """
+    Связанные товары для страницы товара. Пока таблица рекомендаций строится, возвращаются товары той же категории.
+
+    :param product: Словарь текущего товара.
+    :return: Список словарей связанных товаров (не больше settings.RECOMMENDATIONS_TOP_K).
+    """
+    recommender, catalog = get_recommender(), get_catalog()
+    if recommender.catalog_version is None:
+        same_category = (other for other in catalog.by_category.get(product['category'], ())
+                         if other['id'] != product['id'])
+        return list(islice(same_category, recommender.top_k))
+    return catalog.get_many(recommender.related(product['id']))
+
+
+def _after_fork() -> None:
+    # Блокировки в момент fork мог держать поток обновления родителя
+    global _init_lock
+    _init_lock = threading.Lock()
+    if _recommender is not None:
+        _recommender._lock = threading.Lock()
+
+
+on_basket_change(_note_change)
+os.register_at_fork(after_in_child=_after_fork)
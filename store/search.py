@@ -0,0 +1,180 @@
+"""
+Полнотекстовый поиск по каталогу с автодополнением.
+
+Индекс строится при загрузке каждого снимка каталога (см. store.catalog.register_index) и хранится в памяти:
+    - словарь термов: основа слова -> {id товара: вес};
+    - отсортированный список термов для поиска по префиксу через bisect;
+    - популярность товаров (rating, sold_value) для ранжирования.
+"""
+import heapq
+import math
+import re
+from bisect import bisect_left
+
+from .catalog import Catalog, get_catalog, register_index
+
+# Вес совпадения в зависимости от поля товара
+FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+POPULARITY_WEIGHT = 0.5  # Насколько популярность товара усиливает текстовую релевантность
+MAX_PREFIX_TERMS = 64  # Сколько термов максимум раскрывает префикс последнего слова запроса
+MIN_STEM_LENGTH = 3
+
+TOKEN_RE = re.compile(r'\w+')
+# Окончания для упрощённого стемминга русских слов, от длинных к коротким
+SUFFIXES = sorted(('иями', 'ями', 'ами', 'ией', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя', 'ое', 'ее',
+                   'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ую', 'юю', 'ов', 'ев',
+                   'ия', 'ья', 'ье', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'),
+                  key=len, reverse=True)
+
+
+def normalize(text: str) -> list[str]:
+    """
+    Разбивает текст на слова, приводит к нижнему регистру (casefold) и заменяет ё на е.
+
+    :param text: Исходный текст.
+    :return: Список нормализованных слов.
+    """
+    return TOKEN_RE.findall(text.casefold().replace('ё', 'е'))
+
+
+def stem(word: str) -> str:
+    """
+    Упрощённый стемминг: отрезает самое длинное подходящее окончание, если остаётся основа
+    не короче MIN_STEM_LENGTH. Основа всегда является префиксом слова.
+
+    :param word: Нормализованное слово.
+    :return: Основа слова.
+    """
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            return word[:-len(suffix)]
+    return word
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс снимка каталога.
+
+    Для каждого терма хранится словарь {id товара: вес} для проверки вхождения и список товаров,
+    заранее отсортированный по оценке (вес с учётом популярности). Запрос обходит самый короткий список
+    в порядке убывания оценки и останавливается, набрав EARLY_STOP_FACTOR * limit совпадений, поэтому
+    время ответа не зависит от размера каталога. Для запросов из одного слова результат точный.
+    """
+    EARLY_STOP_FACTOR = 4
+
+    def __init__(self, catalog: Catalog):
+        postings = {}
+        for id_product, product in catalog.products.items():
+            for field, weight in FIELD_WEIGHTS.items():
+                for word in normalize(str(product.get(field) or '')):
+                    docs = postings.setdefault(stem(word), {})
+                    docs[id_product] = docs.get(id_product, 0.0) + weight
+
+        max_sold = max((product['sold_value'] or 0 for product in catalog.products.values()), default=0)
+        log_max_sold = math.log1p(max_sold) or 1.0
+        # Популярность в диапазоне [0, 1]: половина - рейтинг, половина - продажи (в логарифмической шкале)
+        self.boost = {id_product: 1 + POPULARITY_WEIGHT * (0.5 * (product['rating'] or 0) / 5
+                                                          + 0.5 * math.log1p(product['sold_value'] or 0) / log_max_sold)
+                      for id_product, product in catalog.products.items()}
+
+        count = len(catalog.products) or 1
+        self.postings = {}  # терм -> {id товара: вес с учётом редкости терма (idf)}
+        self.ranked = {}  # терм -> [(-оценка, id товара), ...] по убыванию оценки
+        for term, docs in postings.items():
+            idf = math.log(1 + count / len(docs))
+            weights = self.postings[term] = {id_product: weight * idf for id_product, weight in docs.items()}
+            self.ranked[term] = sorted((-weight * self.boost[id_product], id_product)
+                                       for id_product, weight in weights.items())
+        self.terms = sorted(self.postings)
+
+    def _expand(self, prefix: str) -> list[str]:
+        """
+        Термы, начинающиеся с префикса (не больше MAX_PREFIX_TERMS).
+
+        :param prefix: Префикс терма.
+        :return: Список термов.
+        """
+        start = bisect_left(self.terms, prefix)
+        terms = []
+        for term in self.terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, query: str, limit: int = 10, prefix: bool = True) -> list[tuple[str, float]]:
+        """
+        Ищет товары, содержащие все слова запроса.
+
+        :param query: Строка запроса.
+        :param limit: Максимальное количество результатов.
+        :param prefix: Искать последнее слово запроса по префиксу (автодополнение).
+        :return: Список пар (id товара, оценка): сначала точные совпадения, затем совпадения по префиксу,
+                 внутри каждой части - по убыванию оценки.
+        """
+        words = [stem(word) for word in normalize(query)]
+        if not words:
+            return []
+
+        # Каждое слово запроса - группа термов; сначала все слова ищутся точно
+        groups = [[word] for word in words]
+        found = self._match(groups, limit)
+        if prefix and len(found) < limit:
+            # Совпадения только по префиксу последнего слова идут после точных, даже если их оценка выше.
+            # Точных совпадений меньше limit, значит найдены все, и их можно просто исключить
+            groups[-1] = [term for term in self._expand(words[-1]) if term != words[-1]]
+            found += self._match(groups, limit - len(found), exclude={id_product for id_product, _ in found})
+        return found
+
+    def _match(self, groups: list[list[str]], limit: int, exclude: set = frozenset()) -> list[tuple[str, float]]:
+        """
+        Товары, у которых для каждой группы есть хотя бы один терм группы.
+
+        :param groups: Группы термов, по одной на слово запроса.
+        :param limit: Максимальное количество результатов.
+        :param exclude: Id товаров, которые не попадают в результат.
+        :return: Список пар (id товара, оценка), отсортированный по убыванию оценки.
+        """
+        groups = [[term for term in group if term in self.postings] for group in groups]
+        if not all(groups):
+            return []
+
+        # Ведущая группа - с наименьшим числом товаров, её списки обходятся в порядке убывания оценки
+        groups.sort(key=lambda group: sum(len(self.postings[term]) for term in group))
+        lead, others = groups[0], groups[1:]
+        stream = heapq.merge(*(self.ranked[term] for term in lead)) if len(lead) > 1 else self.ranked[lead[0]]
+
+        scores = {}
+        enough = limit * self.EARLY_STOP_FACTOR if others else limit
+        for neg_score, id_product in stream:
+            # Товар исключён или уже встретился по другому терму префикса с большей оценкой
+            if id_product in scores or id_product in exclude:
+                continue
+            total = 0.0
+            for group in others:
+                weight = max(self.postings[term].get(id_product, 0.0) for term in group)
+                if not weight:
+                    break
+                total += weight
+            else:
+                scores[id_product] = total * self.boost[id_product] - neg_score
+                if len(scores) >= enough:
+                    break
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+register_index('search', SearchIndex)
+
+
+def search_products(query: str, limit: int = 10, prefix: bool = True) -> list[dict]:
+    """
+    Поиск товаров в текущем снимке каталога.
+
+    :param query: Строка запроса.
+    :param limit: Максимальное количество результатов.
+    :param prefix: Искать последнее слово запроса по префиксу (автодополнение).
+    :return: Список словарей найденных товаров в порядке убывания релевантности.
+    """
+    catalog = get_catalog()
+    found = catalog.index('search').search(query, limit, prefix)
+    return catalog.get_many(id_product for id_product, _ in found)
@@ -0,0 +1,33 @@
+from django import template
+
+from logic import cache
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        key = (self.name.resolve(context), *(value.resolve(context) for value in self.vary_on))
+        return cache.get_or_set('fragments', key, lambda: self.nodelist.render(context))
+
+
+@register.tag
+def fragment_cache(parser, token):
+    """
+    Кеширует отрисованный фрагмент шаблона в пространстве имён 'fragments' кеша приложения (logic.cache).
+    Фрагмент не должен зависеть от пользователя: ключ составляют только имя и перечисленные значения.
+
+    Использование: {% fragment_cache 'имя' значение1 значение2 ... %} ... {% endfragment_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"Тегу '{bits[0]}' нужно имя фрагмента")
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    return FragmentCacheNode(nodelist, parser.compile_filter(bits[1]),
+                             [parser.compile_filter(bit) for bit in bits[2:]])
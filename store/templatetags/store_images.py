@@ -0,0 +1,25 @@
+from django import template
+
+from store import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(path: str, width: int) -> str:
+    """
+    Адрес уменьшенной копии изображения (store/thumbnails.py) или исходного изображения, если копии недоступны.
+
+    Использование: <img src="{% thumbnail_url product.url 540 %}">
+    """
+    return thumbnails.thumbnail_url(path, int(width))
+
+
+@register.simple_tag
+def srcset(path: str) -> str:
+    """
+    Значение атрибута srcset со всеми ширинами settings.THUMBNAIL_WIDTHS (пустое, если копии недоступны).
+
+    Использование: <img src="..." srcset="{% srcset product.url %}" sizes="...">
+    """
+    return thumbnails.srcset(path)
@@ -1,3 +1,356 @@
-from django.test import TestCase
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from unittest import mock
+from datetime import datetime, timedelta, timezone
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from logic.services import format_minor
+from store.management.commands.importtime import cold_start
+from store import catalog as catalog_module, pricing_rules, recommendations
+from store.catalog import Catalog, get_catalog, register_index, reload_catalog
+from store.facets import PRICE_BANDS, RATING_BANDS, FacetIndex, facet_counts
+from store.pricing_rules import Coupon, RuleTable, compile_coupons, compile_delivery
+from store.recommendations import Recommender
+from store.search import normalize, search_products
+
+
+class StorageTestCase(TestCase):
+    """
+    Тесты с хранилищем корзин и избранного: файлы баз создаются во временном каталоге, а не в каталоге проекта.
+    Пользователь 'user' вошёл в систему.
+    """
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmp.name)
+        self.user = User.objects.create_user('user')
+        self.client.force_login(self.user)
+
+    def page_names(self, url: str, **params) -> list[str]:
+        """Названия товаров на странице корзины или избранного в порядке вывода."""
+        content = self.client.get(url, params).content.decode()
+        return re.findall(r'<td class="product-name">\s*<h3>([^<]*)</h3>', content)
+
+
+class CartTests(StorageTestCase):
+
+    def cart(self) -> dict:
+        return self.client.get('/cart/', {'format': 'JSON'}).json()['products']
+
+    def test_add_and_remove(self):
+        self.assertEqual(self.client.get('/cart/add/1').status_code, 200)
+        self.client.get('/cart/add/1')
+        self.client.get('/cart/add/2')
+        self.assertEqual(self.cart(), {'1': 2, '2': 1})
+        self.assertEqual(self.client.get('/cart/del/2').status_code, 200)
+        self.assertEqual(self.cart(), {'1': 2})
+        self.assertEqual(self.client.get('/cart/del/2').status_code, 404)
+
+    def test_unknown_product(self):
+        self.assertEqual(self.client.get('/cart/add/100500').status_code, 404)
+        self.assertEqual(self.cart(), {})
+
+    def test_total(self):
+        self.client.get('/cart/add/1')
+        self.client.get('/cart/add/1')
+        totals = self.client.get('/cart/total/', {'coupon': 'coupon', 'country': 'Россия'}).json()
+        self.assertEqual(totals['subtotal'], totals['lines'][0]['price'] * 2)
+        self.assertEqual(totals['discount'], (totals['subtotal'] * 10 + 50) // 100)
+        self.assertIsNotNone(totals['delivery'])
+        self.assertEqual(totals['total'], totals['subtotal'] - totals['discount'] + totals['delivery'])
+
+    def line_totals(self, **params) -> list[int]:
+        """Общие цены позиций страницы корзины в копейках."""
+        content = self.client.get('/cart/', params).content.decode()
+        return [round(float(value) * 100) for value in re.findall(r'<td class="total">([^<]*)</td>', content)]
+
+    def test_page_totals_match_server_totals(self):
+        self.client.get('/cart/add/1')
+        self.client.get('/cart/add/1')
+        self.client.get('/cart/add/3')
+        totals = self.client.get('/cart/total/').json()
+        for sort in ('added', 'price', 'name'):
+            self.assertEqual(sum(self.line_totals(sort=sort)), totals['subtotal'])
+        self.assertEqual(self.client.get('/cart/').context['subtotal'], format_minor(totals['subtotal']))
+
+    @override_settings(USER_LIST_PAGE_SIZE=2)
+    def test_pages_and_sorting(self):
+        for id_product in ('2', '1', '3', '2'):
+            self.client.get(f'/cart/add/{id_product}')
+        self.assertEqual(self.page_names('/cart/'), ['Клубника', 'Болгарский перец'])
+        self.assertEqual(self.page_names('/cart/', page=2), ['Стручковая фасоль'])
+        self.assertEqual(self.page_names('/cart/', page=100), ['Стручковая фасоль'])
+        self.assertEqual(self.page_names('/cart/', sort='price'), ['Болгарский перец', 'Стручковая фасоль'])
+        self.assertEqual(self.page_names('/cart/', sort='price', reverse='true'), ['Клубника', 'Стручковая фасоль'])
+        self.assertEqual(self.page_names('/cart/', sort='unknown'), ['Клубника', 'Болгарский перец'])
+        # Итоги считаются по всей корзине, а не по странице
+        totals = self.client.get('/cart/total/').json()
+        self.assertEqual(self.client.get('/cart/').context['subtotal'], format_minor(totals['subtotal']))
+
+    def test_anonymous_remove(self):
+        self.client.logout()
+        self.assertNotEqual(self.client.get('/cart/remove/1').status_code, 500)
+
+
+@override_settings(STORE_STORAGE='db')
+class CartDatabaseTests(CartTests):
+    """Те же сценарии с корзиной в базе данных."""
+
+
+@override_settings(COUPONS_PATH='coupons.json')
+class CouponLimitTests(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with open('coupons.json', mode='w', encoding='utf-8') as f:
+            json.dump([{'code': 'limited', 'value': 10, 'max_uses': 1}], f)
+        patcher = mock.patch.object(pricing_rules, 'coupons', RuleTable('COUPONS_PATH', compile_coupons))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.get('/cart/add/1')
+
+    def test_exhausted_coupon(self):
+        self.assertEqual(self.client.get('/cart/total/', {'coupon': 'limited'}).json()['discount_percent'], 10)
+        self.assertEqual(self.client.post('/cart/checkout/', {'coupon': 'limited'}).json()['discount_percent'], 10)
+        self.assertEqual(pricing_rules.coupon_uses('limited'), 1)
+        # Лимит исчерпан: купон больше не даёт скидки и не списывается
+        self.assertEqual(self.client.get('/cart/total/', {'coupon': 'limited'}).json()['discount_percent'], 0)
+        totals = self.client.post('/cart/checkout/', {'coupon': 'limited'}).json()
+        self.assertEqual((totals['discount'], totals['total']), (0, totals['subtotal']))
+        self.assertEqual(pricing_rules.coupon_uses('limited'), 1)
+        self.assertFalse(self.client.get('/coupon/check/limited').json()['is_valid'])
+
+    def test_redeem_is_limited(self):
+        coupon = pricing_rules.get_coupon('limited')
+        self.assertEqual([pricing_rules.redeem_coupon(coupon) for _ in range(3)], [True, False, False])
+        self.assertTrue(pricing_rules.redeem_coupon(Coupon('unlimited', 10)))
+
+
+class PricingRulesTests(SimpleTestCase):
+
+    def test_coupon_validity(self):
+        now = datetime(2024, 6, 1, tzinfo=timezone.utc)
+        self.assertTrue(Coupon('code', 10).is_valid(now))
+        self.assertFalse(Coupon('code', 10, is_active=False).is_valid(now))
+        self.assertFalse(Coupon('code', 10, valid_until=now - timedelta(days=1)).is_valid(now))
+        self.assertFalse(Coupon('code', 10, valid_from=now + timedelta(days=1)).is_valid(now))
+        self.assertTrue(Coupon('code', 10, max_uses=2).is_valid(now, uses=1))
+        self.assertFalse(Coupon('code', 10, max_uses=2).is_valid(now, uses=2))
+
+    def test_delivery_refinement(self):
+        table = compile_delivery({'Россия': {'price': 120,
+                                             'cities': {'Москва': 90},
+                                             'regions': {'Ленинградская область': {'price': 110,
+                                                                                   'cities': {'Гатчина': 100}}},
+                                             'postal_codes': {'195': 65}}})
+        self.assertEqual(table.price('россия'), 120)
+        self.assertEqual(table.price('Россия', 'москва'), 90)
+        self.assertEqual(table.price('Россия', region='Ленинградская область'), 110)
+        self.assertEqual(table.price('Россия', 'Гатчина'), 100)
+        self.assertEqual(table.price('Россия', 'Москва', code='195251'), 65)
+        self.assertIsNone(table.price('Атлантида'))
+
+
+class CatalogIndexTests(SimpleTestCase):
+    """Производные индексы строятся при загрузке каталога, а не первым запросом к ним."""
+
+    def test_reload_builds_every_registered_index(self):
+        catalog = reload_catalog(force=True)
+        self.assertLessEqual({'search', 'facets', 'cart_prices'}, catalog._indexes.keys())
+
+    def test_index_registered_after_load(self):
+        self.addCleanup(catalog_module._index_builders.pop, 'test_ids')
+        catalog = get_catalog()
+        register_index('test_ids', lambda snapshot: sorted(snapshot.products))
+        self.assertEqual(catalog._indexes['test_ids'], sorted(catalog.products))
+
+
+class SearchTests(SimpleTestCase):
+    """Поиск по каталогу: нормализация, стемминг и ранжирование совпадений по префиксу."""
+
+    def ids(self, query: str, **kwargs) -> list[int]:
+        return [product['id'] for product in search_products(query, **kwargs)]
+
+    def test_normalize(self):
+        self.assertEqual(normalize('Зелёные ЯБЛОКИ, 2 кг'), ['зеленые', 'яблоки', '2', 'кг'])
+
+    def test_word_forms(self):
+        for query in ('яблоки', 'яблоко', 'Яблок', 'ЯБЛОКАМИ'):
+            with self.subTest(query=query):
+                self.assertEqual(self.ids(query, prefix=False)[:1], [10])
+        self.assertEqual(sorted(self.ids('пёрец')), [1, 12])
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.ids('перец чили'), [12])
+        self.assertEqual(self.ids('перец клубника'), [])
+
+    def test_prefix_ranked_below_exact(self):
+        # "Фруктовый сок" совпадает с "фрукт" по префиксу и названию, но идёт после точных совпадений по категории
+        self.assertEqual(self.ids('фрукт'), [2, 10, 8])
+        self.assertEqual(self.ids('фрукт', limit=2), [2, 10])
+        self.assertEqual(sorted(self.ids('фрукт', prefix=False)), [2, 10])
+        self.assertEqual(self.ids('клуб'), [2])
+        self.assertEqual(self.ids('клуб', prefix=False), [])
+
+    def test_empty_query(self):
+        for query in ('', '   ', '!?'):
+            with self.subTest(query=query):
+                self.assertEqual(search_products(query), [])
+        self.assertEqual(self.client.get('/search/').json(), [])
+
+class FacetTests(SimpleTestCase):
+    """Фасетные счётчики совпадают с прямым отбором товаров каталога."""
+
+    @staticmethod
+    def band(value: float, bands: tuple) -> str | None:
+        return next((name for name, low, high in bands if low <= value and (high is None or value < high)), None)
+
+    def naive_counts(self, catalog: Catalog, filters: dict[str, str]) -> dict:
+        """Счётчики, посчитанные обходом всех товаров каталога."""
+        values = {id_product: {'category': product['category'],
+                               'price': self.band(product['price_after'], PRICE_BANDS),
+                               'rating': self.band(product['rating'], RATING_BANDS)}
+                  for id_product, product in catalog.products.items()}
+
+        def matching(facets):
+            return [value for value in values.values() if all(value[facet] == filters[facet] for facet in facets)]
+
+        names = {'category': catalog.categories,
+                 'price': [name for name, _, _ in PRICE_BANDS],
+                 'rating': [name for name, _, _ in RATING_BANDS]}
+        facets = {}
+        for facet in names:
+            counts = Counter(value[facet] for value in matching([other for other in filters if other != facet]))
+            facets[facet] = {name: counts[name] for name in names[facet]}
+        return {'total': len(matching(filters)), 'version': catalog.version, 'facets': facets}
+
+    def filter_sets(self, catalog: Catalog):
+        """Все сочетания фильтров по категории, цене и рейтингу, включая отсутствие фильтра."""
+        for category in (None, *catalog.categories):
+            for price in (None, *(name for name, _, _ in PRICE_BANDS)):
+                for rating in (None, *(name for name, _, _ in RATING_BANDS)):
+                    filters = {'category': category, 'price': price, 'rating': rating}
+                    yield {facet: value for facet, value in filters.items() if value is not None}
+
+    def test_counts_match_catalog(self):
+        catalog = get_catalog()
+        for filters in self.filter_sets(catalog):
+            with self.subTest(**filters):
+                self.assertEqual(facet_counts(filters), self.naive_counts(catalog, filters))
+
+    def test_counts_match_generated_catalog(self):
+        # Больше 8 товаров на значение фасета и границы диапазонов: биты в нескольких байтах, 100 - уже '100-200'
+        prices = (0, 99.99, 100, 150, 200, 299, 300, 499, 500, 1200)
+        ratings = (0, 2.9, 3.0, 3.9, 4.0, 4.49, 4.5, 5.0)
+        products = {str(i): {'id': i, 'html': f'product-{i}', 'category': ('Овощи', 'Фрукты', 'Соки')[i % 3],
+                             'price_after': prices[i % len(prices)], 'rating': ratings[i * 7 % len(ratings)]}
+                    for i in range(1, 100)}
+        catalog = Catalog(products, 'test')
+        index = FacetIndex(catalog)
+        for filters in self.filter_sets(catalog):
+            with self.subTest(**filters):
+                self.assertEqual(index.counts(filters), self.naive_counts(catalog, filters))
+
+    def test_unknown_filters(self):
+        catalog = get_catalog()
+        self.assertEqual(facet_counts({'color': 'красный', 'price': ''}), self.naive_counts(catalog, {}))
+        self.assertEqual(facet_counts({'category': 'Атлантида'})['total'], 0)
+
+    def test_view(self):
+        params = {'category': 'Овощи', 'price': '200-300'}
+        self.assertEqual(self.client.get('/product/facets/', params).json(),
+                         self.naive_counts(get_catalog(), params))
+
+class RecommenderTests(SimpleTestCase):
+    """Таблица рекомендаций сверяется с подсчётом пар и построением с нуля по тем же спискам пользователей."""
+    BASKETS = {'a': {'1': 1, '2': 1}, 'b': {'1': 2, '2': 1, '10': 1}, 'c': {'1': 1, '2': 1, '3': 1},
+               'd': {'10': 1, '11': 1}}
+
+    def build(self, baskets: dict) -> Recommender:
+        recommender = Recommender(3)
+        with mock.patch.object(recommendations, 'iter_user_products', return_value=iter(baskets.items())):
+            recommender.resync()
+        return recommender
+
+    @staticmethod
+    def pairs(baskets: dict) -> dict[str, Counter]:
+        """Совместная встречаемость, посчитанная перебором всех пар товаров каждого пользователя."""
+        pairs = {}
+        for basket in baskets.values():
+            for first in basket:
+                for second in basket:
+                    if first != second:
+                        pairs.setdefault(first, Counter())[second] += 1
+        return pairs
+
+    def test_co_occurrence_top_k(self):
+        recommender = self.build(self.BASKETS)
+        self.assertEqual(recommender.co_occurrence, self.pairs(self.BASKETS))
+        related = recommender.related(1)
+        self.assertEqual(len(related), 3)
+        self.assertEqual(related[0], '2')  # Встречается с товаром 1 у трёх пользователей
+        self.assertNotIn('1', related)
+        self.assertEqual(set(recommender.table), set(get_catalog().products))
+
+    def test_note_change_and_refresh(self):
+        recommender = self.build(self.BASKETS)
+        baskets = {username: dict(basket) for username, basket in self.BASKETS.items()}
+        for username, id_product, delta in (('a', '3', 1), ('b', '2', -1), ('d', '10', -1), ('e', '5', 1)):
+            recommender.note_change(username, id_product, delta)
+            basket = baskets.setdefault(username, {})
+            basket[id_product] = basket.get(id_product, 0) + delta
+            if not basket[id_product]:
+                del basket[id_product]
+        self.assertEqual(recommender.refresh(), 6)  # Товары изменённых списков до и после изменения
+        self.assertEqual(recommender.co_occurrence, self.pairs(baskets))
+        self.assertEqual(recommender.table, self.build(baskets).table)
+
+    def test_resync(self):
+        recommender = self.build(self.BASKETS)
+        baskets = {'a': {'1': 1, '2': 1, '12': 1}, 'c': {'3': 1}, 'e': {'5': 1, '6': 1}}  # Изменения других процессов
+        with mock.patch.object(recommendations, 'iter_user_products', return_value=iter(baskets.items())):
+            recommender.resync()
+        self.assertEqual(recommender.co_occurrence, self.pairs(baskets))
+        self.assertEqual(recommender.table, self.build(baskets).table)
+
+    def test_same_category_until_built(self):
+        catalog = get_catalog()
+        product = catalog.get(1)
+        with mock.patch.object(recommendations, 'get_recommender', return_value=Recommender(3)):
+            related = recommendations.related_products(product)
+        expected = [other for other in catalog.by_category[product['category']] if other['id'] != product['id']]
+        self.assertEqual(related, expected[:3])
+
+
+class StartupBudgetTests(SimpleTestCase):
+    """Время холодного запуска точек входа вместе с URLconf (см. python manage.py importtime)."""
+
+    def assertStartupWithinBudget(self, entry: str) -> None:
+        timings = [float(cold_start(entry).stdout.split()[-1]) * 1000 for _ in range(3)]
+        self.assertLessEqual(statistics.median(timings), settings.STARTUP_BUDGET_MS,
+                             f"Холодный запуск project.{entry}: {timings} мс")
+
+    def test_wsgi_startup_within_budget(self):
+        self.assertStartupWithinBudget('wsgi')
+
+    def test_asgi_startup_within_budget(self):
+        self.assertStartupWithinBudget('asgi')
+
+    def test_urlconf_does_not_import_views(self):
+        views = ('store.views', 'wishlist.views', 'app_login.views', 'app_weather.views', 'app_datetime.views')
+        code = ("import sys, project.wsgi; from django.urls import get_resolver; get_resolver().url_patterns; "
+                f"print(*(name for name in {views} if name in sys.modules))")
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                                env=dict(os.environ, DJANGO_WARMUP='0'), check=True)
+        self.assertEqual(result.stdout.split(), [])
@@ -0,0 +1,201 @@
+"""
+Уменьшенные копии изображений товаров.
+
+Шаблоны выводят изображения тегами {% thumbnail_url %} и {% srcset %} (store_images): браузер выбирает
+из settings.THUMBNAIL_WIDTHS ширину под размер карточки, а не загружает исходное изображение.
+Копия создаётся при первом запросе (thumbnail_view) и сохраняется на диск в settings.THUMBNAIL_ROOT
+под именем из хеша содержимого исходного файла, ширины и качества: изменённое изображение получает
+новые копии, а старые просто перестают запрашиваться. Хеш входит и в адрес копии (?v=...), поэтому
+ответ кешируется браузером без повторных проверок.
+
+Уменьшение выполняется в пуле из settings.THUMBNAIL_WORKERS процессов (Pillow освобождает GIL не на всех
+операциях, а запрос не должен ждать чужих картинок в своём потоке). Одну копию одновременно готовит
+одно задание, остальные запросы ждут его. Если в очереди больше settings.THUMBNAIL_MAX_PENDING заданий
+или копия не готова за settings.THUMBNAIL_TIMEOUT секунд, запрос перенаправляется на исходное изображение.
+
+Без пакета Pillow копии не создаются: шаблоны выводят исходные изображения.
+"""
+import concurrent.futures
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+from django.urls import reverse
+
+try:
+    import PIL
+except ImportError:  # Необязательная зависимость
+    PIL = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+_digests: dict[str, tuple[float, int, str]] = {}  # Путь исходного файла -> (mtime, размер, хеш содержимого)
+_pending: dict[str, tuple[concurrent.futures.Future, ProcessPoolExecutor]] = {}  # Путь копии -> (задание, пул)
+_pool = None
+_lock = threading.Lock()
+
+
+def available() -> bool:
+    """
+    Проверяет, можно ли создавать копии (установлен Pillow).
+
+    :return: True, если копии доступны.
+    """
+    return PIL is not None
+
+
+def source_path(path: str) -> str | None:
+    """
+    Файл исходного изображения.
+
+    :param path: Путь в статических файлах, например 'store/images/product-1.jpg'.
+    :return: Абсолютный путь или None, если изображения нет или путь не из settings.THUMBNAIL_SOURCES.
+    """
+    if not path.startswith(settings.THUMBNAIL_SOURCES) or not path.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    return finders.find(path)
+
+
+def content_digest(source: str) -> str:
+    """
+    Хеш содержимого файла; запоминается до изменения файла (mtime, размер).
+
+    :param source: Абсолютный путь к файлу.
+    :return: 16 шестнадцатеричных символов sha256.
+    """
+    stat = os.stat(source)
+    cached = _digests.get(source)
+    if cached is not None and cached[:2] == (stat.st_mtime, stat.st_size):
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(source, mode='rb') as f:
+        while chunk := f.read(1 << 16):
+            digest.update(chunk)
+    _digests[source] = (stat.st_mtime, stat.st_size, digest.hexdigest()[:16])
+    return _digests[source][2]
+
+
+def thumbnail_url(path: str, width: int) -> str:
+    """
+    Адрес копии изображения заданной ширины.
+
+    :param path: Путь изображения в статических файлах.
+    :param width: Ширина из settings.THUMBNAIL_WIDTHS.
+    :return: Адрес копии или исходного изображения, если копии недоступны.
+    """
+    if not available() or (source := source_path(path)) is None:
+        return static(path)
+    url = reverse('store:thumbnail_view', kwargs={'width': width, 'path': path})
+    return f'{url}?v={content_digest(source)}'
+
+
+def srcset(path: str) -> str:
+    """
+    Значение атрибута srcset: копии всех ширин settings.THUMBNAIL_WIDTHS.
+
+    :param path: Путь изображения в статических файлах.
+    :return: Строка вида "/thumbnail/270/...?v=... 270w, ..." или пустая строка, если копии недоступны.
+    """
+    if not available() or source_path(path) is None:
+        return ''
+    return ', '.join(f'{thumbnail_url(path, width)} {width}w' for width in settings.THUMBNAIL_WIDTHS)
+
+
+def _resize(source: str, target: str, width: int, quality: int) -> str:
+    """Рабочий процесс: уменьшает изображение до ширины width и атомарно записывает его в target."""
+    from PIL import Image
+
+    with Image.open(source) as image:
+        image.draft('RGB', (width, width * 4))  # JPEG декодируется сразу в уменьшенном масштабе
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f'{target}.tmp{os.getpid()}'
+        image.save(tmp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+    os.replace(tmp_path, target)
+    return target
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: рабочий процесс не наследует потоки и блокировки процесса веб-сервера
+        _pool = ProcessPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS,
+                                    mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _reset_pool(pool: ProcessPoolExecutor) -> None:
+    """Забывает сломанный пул (если его ещё не заменил другой поток)."""
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_thumbnail(path: str, width: int) -> tuple[str, str] | None:
+    """
+    Копия изображения: готовая с диска или созданная в пуле процессов.
+
+    :param path: Путь изображения в статических файлах.
+    :param width: Ширина из settings.THUMBNAIL_WIDTHS.
+    :return: (путь к файлу копии, хеш исходного файла) или None, если копию получить нельзя
+             (нет Pillow или исходного файла, очередь переполнена, истекло время ожидания, изображение
+             не читается, рабочий процесс аварийно завершился).
+    """
+    global _pool
+    if not available() or width not in settings.THUMBNAIL_WIDTHS or (source := source_path(path)) is None:
+        return None
+    digest = content_digest(source)
+    name = f'{digest}-{width}-q{settings.THUMBNAIL_QUALITY}.jpg'
+    target = os.path.join(settings.THUMBNAIL_ROOT, name[:2], name)
+    if os.path.exists(target):
+        return target, digest
+
+    with _lock:
+        if (job := _pending.get(target)) is None:
+            if len(_pending) >= settings.THUMBNAIL_MAX_PENDING:
+                return None
+            pool = _get_pool()
+            try:
+                future = pool.submit(_resize, source, target, width, settings.THUMBNAIL_QUALITY)
+            except BrokenProcessPool:  # Пул сломался на предыдущем задании
+                _pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+                return None
+            job = _pending[target] = (future, pool)
+            future.add_done_callback(lambda _: _pending.pop(target, None))
+    future, pool = job
+    try:
+        return future.result(timeout=settings.THUMBNAIL_TIMEOUT), digest
+    except concurrent.futures.TimeoutError:
+        return None
+    except BrokenProcessPool:  # Рабочий процесс аварийно завершился: следующее задание создаст новый пул
+        logger.exception("Пул уменьшения изображений сломан, будет создан заново")
+        _reset_pool(pool)
+        return None
+    except Exception:  # Повреждённое или неподдерживаемое изображение: отдаётся исходное
+        logger.exception("Не удалось создать копию %s шириной %d", path, width)
+        return None
+
+
+def _after_fork() -> None:
+    # Пул и задания родителя в дочернем процессе недоступны
+    global _pool, _lock
+    _pool, _lock = None, threading.Lock()
+    _pending.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -1,25 +1,44 @@
+from django.conf import settings
 from django.urls import path
-from .views import (products_view,
-                    shop_view,
-                    products_page_view,
-                    cart_view,
-                    cart_add_view,
-                    cart_del_view,
-                    coupon_check_view,
-                    delivery_estimate_view,
-                    cart_buy_now_view,
-                    cart_remove_view
-                    )
+
+from logic.lazy import lazy_view
+
+# Модуль store.views импортируется при первом запросе, см. logic.lazy
+products_view = lazy_view('store.views.products_view')
+shop_view = lazy_view('store.views.shop_view')
+products_page_view = lazy_view('store.views.products_page_view')
+cart_view = lazy_view('store.views.cart_view')
+cart_add_view = lazy_view('store.views.cart_add_view')
+cart_del_view = lazy_view('store.views.cart_del_view')
+coupon_check_view = lazy_view('store.views.coupon_check_view')
+delivery_estimate_view = lazy_view('store.views.delivery_estimate_view')
+cart_buy_now_view = lazy_view('store.views.cart_buy_now_view')
+cart_remove_view = lazy_view('store.views.cart_remove_view')
+search_view = lazy_view('store.views.search_view')
+facets_view = lazy_view('store.views.facets_view')
+cart_total_view = lazy_view('store.views.cart_total_view')
+cart_checkout_view = lazy_view('store.views.cart_checkout_view')
+thumbnail_view = lazy_view('store.views.thumbnail_view')
 
 
 app_name = 'store'
 
+if settings.ASYNC_VIEWS:  # Запуск под ASGI: API без блокировки цикла событий
+    products_view = lazy_view('store.views.products_async_view', is_async=True)
+    cart_add_view = lazy_view('store.views.cart_add_async_view', is_async=True)
+    cart_del_view = lazy_view('store.views.cart_del_async_view', is_async=True)
+
 urlpatterns = [
     path('product/', products_view),
+    path('product/facets/', facets_view, name="facets_view"),
+    path('search/', search_view, name="search_view"),
     path('', shop_view, name="shop_view"),
     path('product/<slug:page>.html', products_page_view, name="products_page_view"),
     path('product/<int:page>', products_page_view),
+    path('thumbnail/<int:width>/<path:path>', thumbnail_view, name="thumbnail_view"),
     path('cart/', cart_view, name="cart_view"),
+    path('cart/total/', cart_total_view, name="cart_total_view"),
+    path('cart/checkout/', cart_checkout_view, name="cart_checkout_view"),
     path('cart/add/<str:id_product>', cart_add_view),
     path('cart/del/<str:id_product>', cart_del_view),
     path('coupon/check/<slug:coupon>', coupon_check_view),
@@ -1,39 +1,106 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import redirect, render
-from django.contrib.auth import get_user
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, HttpResponseNotFound, JsonResponse, HttpResponseRedirect
-
-from .models import DATABASE
+from django.contrib.auth.views import redirect_to_login
+from django.http import (FileResponse, HttpResponse, HttpResponseNotFound, HttpResponseNotModified,
+                         HttpResponseRedirect)
+from django.templatetags.static import static
+
+from . import thumbnails
+from .catalog import get_catalog
+from .facets import facet_counts
+from .pricing_rules import delivery_price, get_coupon, redeem_coupon
+from .recommendations import related_products
+from .search import search_products
+from logic import cache
+from logic.http import JsonResponse, dumps
 from logic.services import (filtering_category,
-                            view_in_cart,
+                            view_user_cart,
                             add_to_cart,
                             remove_from_cart,
-                            filter_same_category)
+                            use_db,
+                            cart_products_db,
+                            list_params,
+                            page_of_ids,
+                            iter_cart_products,
+                            calculate_cart_total,
+                            format_minor,
+                            aget_user,
+                            run_storage)
 
 
 @login_required(login_url='login:login_view')
 def cart_view(request) -> JsonResponse | HttpResponse:
     """
     Загрузка шаблона страницы корзины с товарами зарегистрированного пользователя.
+    Товары выводятся постранично (settings.USER_LIST_PAGE_SIZE), итоги считаются по всей корзине.
 
-    :param request: Объект запроса.
+    :param request: Объект запроса. Параметры: page - номер страницы; sort - added, price или name;
+                    reverse=true - по убыванию.
     :return: -Список товаров корзины в формате JSON при запросе параметра "format=JSON"
              -HttpResponse, как результат функции render с шаблоном корзины с товарами пользователя в контексте.
     """
     if request.method == "GET":
-        current_user = get_user(request).username
-        data = view_in_cart(request)[current_user]
+        current_user = request.user.username
+        data = view_user_cart(current_user) or {'products': {}}
         if request.GET.get("format") == 'JSON':
-            return JsonResponse(data, json_dumps_params={'ensure_ascii': False, 'indent': 4})
+            return JsonResponse(data)
+
+        totals = calculate_cart_total(data)  # Стоимость считается на сервере в копейках и мемоизируется
+        # Товары материализуются только для видимой страницы
+        page_number, sort, reverse = list_params(request.GET)
+        catalog = get_catalog()
+        lines = {str(line['id']): line for line in totals['lines']}
+        if use_db():
+            page, products = cart_products_db(current_user, lines, page_number, sort, reverse, catalog)
+        else:
+            page = page_of_ids(lines, page_number, sort, reverse, catalog)
+            products = iter_cart_products(page, lines, catalog)
+
+        return render(request, "store/cart.html", context={"products": products,
+                                                           "page": page,
+                                                           "sort": sort,
+                                                           "reverse": reverse,
+                                                           "subtotal": format_minor(totals['subtotal']),
+                                                           "total": format_minor(totals['total'])})
+
+
+@login_required(login_url='login:login_view')
+def cart_total_view(request) -> JsonResponse:
+    """
+    Расчёт стоимости корзины зарегистрированного пользователя на сервере.
+    Все суммы в ответе - целые числа в копейках.
+
+    :param request: Объект запроса. Параметры: coupon - код купона; country, region, city, code - адрес доставки.
+    :return: JSON с позициями (lines), промежуточным итогом (subtotal), скидкой (discount),
+             доставкой (delivery, null - не рассчитана или недоступна) и итогом (total).
+    """
+    if request.method == "GET":
+        params = request.GET
+        data = view_user_cart(request.user.username) or {'products': {}}
+        totals = calculate_cart_total(data, params.get('coupon'), params.get('country'), params.get('city'),
+                                      params.get('region'), params.get('code'))
+        return JsonResponse(totals)
 
-        products = []  # Список продуктов
-        for product_id, quantity in data['products'].items():
-            product = DATABASE[product_id]  # Получение информацию о продукте из DATABASE по его product_id
-            product["quantity"] = quantity  # Запись в словарь product текущее значение товара в корзине
-            product["price_total"] = f"{quantity * product['price_after']:.2f}"  # добавление общей цены позиции с ограничением в 2 знака
-            products.append(product)
 
-        return render(request, "store/cart.html", context={"products": products})
+@login_required(login_url='login:login_view')
+def cart_checkout_view(request) -> JsonResponse:
+    """
+    Оформление заказа: окончательный расчёт стоимости корзины со списанием применения купона.
+    Если лимит применений купона исчерпан (в том числе параллельным заказом), заказ считается без скидки.
+
+    :param request: Объект запроса (POST). Параметры: coupon - код купона; country, region, city, code - адрес доставки.
+    :return: JSON с расчётом стоимости, как у cart_total_view.
+    """
+    if request.method == "POST":
+        params = request.POST
+        data = view_user_cart(request.user.username) or {'products': {}}
+        address = (params.get('country'), params.get('city'), params.get('region'), params.get('code'))
+        totals = calculate_cart_total(data, params.get('coupon'), *address)
+        if totals['discount_percent'] and not redeem_coupon(get_coupon(params['coupon'])):
+            totals = calculate_cart_total(data, None, *address)
+        return JsonResponse(totals)
 
 
 @login_required(login_url='login:login_view')
@@ -46,14 +113,11 @@ def cart_add_view(request, id_product: str) -> JsonResponse:
     :return: Сообщение об успехе или неудаче в JSON.
     """
     if request.method == "GET":
-        result = add_to_cart(request, id_product)
+        result = add_to_cart(request.user, id_product)
         if result:
-            return JsonResponse({"answer": "Продукт успешно добавлен в корзину"},
-                                json_dumps_params={'ensure_ascii': False})
+            return JsonResponse({"answer": "Продукт успешно добавлен в корзину"})
 
-        return JsonResponse({"answer": "Неудачное добавление в корзину"},
-                            status=404,
-                            json_dumps_params={'ensure_ascii': False})
+        return JsonResponse({"answer": "Неудачное добавление в корзину"}, status=404)
 
 
 def cart_del_view(request, id_product: str) -> JsonResponse:
@@ -65,45 +129,42 @@ def cart_del_view(request, id_product: str) -> JsonResponse:
     :return: Сообщение об успехе или неудаче в JSON.
     """
     if request.method == "GET":
-        result = remove_from_cart(request, id_product)
+        result = remove_from_cart(request.user, id_product)
         if result:
-            return JsonResponse({"answer": "Продукт успешно удалён из корзины"},
-                                json_dumps_params={'ensure_ascii': False})
+            return JsonResponse({"answer": "Продукт успешно удалён из корзины"})
 
-        return JsonResponse({"answer": "Неудачное удаление из корзины"},
-                            status=404,
-                            json_dumps_params={'ensure_ascii': False})
+        return JsonResponse({"answer": "Неудачное удаление из корзины"}, status=404)
 
 
 def products_page_view(request, page: str | int) -> HttpResponse:
     """
     Загрузка шаблона страницы продукта по слагу и по ID продукта.
-    Производится вывод товаров тойже категории.
+    Производится вывод связанных товаров (той же категории и покупаемых вместе).
 
     :param request: Объект запроса.
     :param page: id-продукта или имя продукта
-    :return: -HttpResponse, как результат функции render с шаблоном страницы продукта и списком продуктов
-                той же категории в контексте.
+    :return: -HttpResponse, как результат функции render с шаблоном страницы продукта и списком связанных
+                продуктов в контексте.
              -Ошибку 404.
     """
     if request.method == 'GET':
+        catalog = get_catalog()
         if isinstance(page, str):
-            for data in DATABASE.values():
-                if data.get('html') == page:
-                    # with open(f'store/products/{page}.html', encoding='utf-8') as f:
-                    #     html_page = f.read()
-                    #     return HttpResponse(html_page)
-                    list_products = filter_same_category(data, DATABASE)
-                    return render(request, "store/product.html",
-                                  context={'product': data,
-                                           'products_same_category': list_products})
+            if data := catalog.by_slug.get(page):
+                # with open(f'store/products/{page}.html', encoding='utf-8') as f:
+                #     html_page = f.read()
+                #     return HttpResponse(html_page)
+                list_products = related_products(data)
+                return render(request, "store/product.html",
+                              context={'product': data,
+                                       'products_same_category': list_products})
         elif isinstance(page, int):
-            data = DATABASE.get(str(page))
+            data = catalog.get(page)
             if data:
                 # with open(f'store/products/{data.get("html")}.html', encoding='utf-8') as f:
                 #     html_page = f.read()
                 #     return HttpResponse(html_page)
-                list_products = filter_same_category(data, DATABASE)
+                list_products = related_products(data)
                 return render(request, "store/product.html",
                               context={'product': data,
                                        'products_same_category': list_products})
@@ -112,27 +173,63 @@ def products_page_view(request, page: str | int) -> HttpResponse:
 
 def products_view(request) -> JsonResponse | HttpResponseNotFound:
     if request.method == "GET":
+        catalog = get_catalog()
         # Обработка id из параметров запроса (уже было реализовано ранее)
         if id_product := request.GET.get("id"):
-            if data := DATABASE.get(id_product):
-                return JsonResponse(data, json_dumps_params={'ensure_ascii': False,
-                                                             'indent': 4})
+            if data := catalog.products.get(id_product):
+                return JsonResponse(data)
             return HttpResponseNotFound("Данного продукта нет в базе данных")
 
         # Обработка фильтрации из параметров запроса
         category_key = request.GET.get("category")  # Считали 'category'
-        if ordering_key := request.GET.get("ordering"):  # Если в параметрах есть 'ordering'
-            reverse = request.GET.get("reverse")
-            if reverse and reverse.lower() == 'true':  # Если в параметрах есть 'ordering' и 'reverse'=True
-                # Использовать filtering_category и провести фильтрацию с параметрами category, ordering, reverse=True
-                data = filtering_category(DATABASE, category_key, ordering_key, True)
-            else:  # Если не обнаружили в адресной строке ...&reverse=true , значит reverse=False
-                data = filtering_category(DATABASE, category_key, ordering_key)  # Использовать filtering_category и провести фильтрацию с параметрами category, ordering, reverse=False
-        else:
-            data = filtering_category(DATABASE, category_key)  # Использовать filtering_category и провести фильтрацию с параметрами category
-        # В этот раз добавляем параметр safe=False, для корректного отображения списка в JSON
-        return JsonResponse(data, safe=False, json_dumps_params={'ensure_ascii': False,
-                                                                 'indent': 4})
+        ordering_key = request.GET.get("ordering")
+        reverse = request.GET.get("reverse")
+        reverse = bool(ordering_key) and bool(reverse) and reverse.lower() == 'true'
+
+        def render_list() -> bytes:
+            if ordering_key:  # Если в параметрах есть 'ordering' (и, возможно, 'reverse'=True)
+                data = filtering_category(catalog.products, category_key, ordering_key, reverse)
+            else:
+                data = filtering_category(catalog.products, category_key)  # Фильтрация только по category
+            return dumps(data)
+
+        # Готовый JSON списка хранится в кеше приложения, версия каталога входит в ключ
+        content = cache.get_or_set('catalog', ('products', catalog.version, category_key, ordering_key, reverse),
+                                   render_list)
+        return HttpResponse(content, content_type='application/json')
+
+
+def search_view(request) -> JsonResponse:
+    """
+    Поиск товаров по названию, описанию и категории. Последнее слово запроса ищется по префиксу,
+    что позволяет использовать поиск для автодополнения.
+
+    :param request: Объект запроса. Параметры: q - строка поиска; limit - количество результатов (до 50);
+                    prefix=false - отключить поиск по префиксу.
+    :return: Список найденных товаров в JSON в порядке убывания релевантности.
+    """
+    if request.method == "GET":
+        query = request.GET.get("q", "")
+        try:
+            limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+        except ValueError:
+            limit = 10
+        prefix = request.GET.get("prefix", "true").lower() != 'false'
+        data = search_products(query, limit, prefix)
+        return JsonResponse(data, safe=False)
+
+
+def facets_view(request) -> JsonResponse:
+    """
+    Количество товаров по категориям, диапазонам цены и рейтинга для фильтров магазина.
+
+    :param request: Объект запроса. Параметры category, price, rating задают активные фильтры,
+                    например ?category=Овощи&price=200-300.
+    :return: JSON вида {"total": ..., "version": ..., "facets": {"category": {...}, "price": {...}, "rating": {...}}}
+    """
+    if request.method == "GET":
+        data = facet_counts(request.GET.dict())
+        return JsonResponse(data)
 
 
 # def products_view(request) -> JsonResponse|HttpResponseNotFound:
@@ -143,7 +240,7 @@ def products_view(request) -> JsonResponse | HttpResponseNotFound:
 #             data = [product for product in DATABASE.values() if product.get('id') == int(product_id)]
 #             if not data:
 #                 return HttpResponseNotFound("Данного продукта нет в базе данных")
-#         return JsonResponse(data, safe=False, json_dumps_params={'ensure_ascii': False, 'indent': 4})
+#         return JsonResponse(data, safe=False)
 
 
 def shop_view(request) -> HttpResponse:
@@ -160,89 +257,91 @@ def shop_view(request) -> HttpResponse:
         # return HttpResponse(data)  # Отправляем HTML файл как ответ
 
         # Обработка фильтрации из параметров запроса
+        catalog = get_catalog()
         category_key = request.GET.get("category")
+        ordering_key = request.GET.get("ordering")
+        reverse = bool(ordering_key) and request.GET.get("reverse") in ('true', 'True')
 
-        if ordering_key := request.GET.get("ordering"):
-            if request.GET.get("reverse") in ('true', 'True'):
-                data = filtering_category(DATABASE, category_key, ordering_key, True)
-            else:
-                data = filtering_category(DATABASE, category_key, ordering_key)
-        else:
-            data = filtering_category(DATABASE, category_key)
+        def products():  # Шаблон вызывает функцию, только если сетки товаров нет в кеше фрагментов
+            if ordering_key:
+                return filtering_category(catalog.products, category_key, ordering_key, reverse)
+            return filtering_category(catalog.products, category_key)
 
         return render(request, 'store/shop.html',
-                      context={"products": data,
+                      context={"products": products,
+                               "catalog_version": catalog.version,
+                               "ordering": ordering_key,
+                               "reverse": reverse,
                                "category": category_key})
 
 
+def thumbnail_view(request, width: int, path: str) -> FileResponse | HttpResponseRedirect | HttpResponseNotFound:
+    """
+    Уменьшенная копия изображения товара (store/thumbnails.py). Копия создаётся при первом запросе.
+    Адрес с параметром v - хешем содержимого исходного изображения (его выводит тег thumbnail_url) -
+    кешируется браузером на год: при изменении изображения меняется и адрес.
+
+    :param request: Объект запроса.
+    :param width: Ширина копии из settings.THUMBNAIL_WIDTHS.
+    :param path: Путь изображения в статических файлах.
+    :return: -FileResponse с JPEG-копией
+             -Перенаправление на исходное изображение, если копию сейчас получить нельзя
+             -Ошибку 404 при неизвестной ширине или изображении.
+    """
+    if request.method == "GET":
+        if width not in settings.THUMBNAIL_WIDTHS or thumbnails.source_path(path) is None:
+            return HttpResponseNotFound("Нет такого изображения")
+        if (thumbnail := thumbnails.get_thumbnail(path, width)) is None:
+            return redirect(static(path))
+        file_path, digest = thumbnail
+        if request.headers.get('If-None-Match') == f'"{digest}"':
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(file_path, mode='rb'), content_type='image/jpeg')
+        response.headers['ETag'] = f'"{digest}"'
+        if request.GET.get('v') == digest:
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response.headers['Cache-Control'] = 'public, max-age=3600'
+        return response
+    return HttpResponseNotFound()
+
+
 def coupon_check_view(request, coupon: str) -> HttpResponseNotFound | JsonResponse:
     """
     Проверка наличия в БД и валидности купонов на скидку.
+    Купоны берутся из таблицы settings.COUPONS_PATH (см. store.pricing_rules).
 
     :param request: Объект запроса.
     :param coupon: Данные купона на скидку.
     :return: -Словарь JSON с данными купона для JS
              -Сообщение об отсутствии купона в БД.
     """
-    # DATA_COUPON - база данных купонов: ключ - код купона (name_coupon); значение - словарь со значением скидки в процентах и
-    # значением действителен ли купон или нет
-    DATA_COUPON = {
-        "coupon": {
-            "value": 10,
-            "is_valid": True},
-        "coupon_old": {
-            "value": 20,
-            "is_valid": False},
-    }
     if request.method == "GET":
-        # Проверьте, что купон есть в DATA_COUPON, если он есть, то верните JsonResponse в котором по ключу "discount"
-        # получают значение скидки в процентах, а по ключу "is_valid" понимают действителен ли купон или нет (True, False)
-        # Если купона нет в базе, то верните HttpResponseNotFound("Неверный купон")
-
-        if coupon in DATA_COUPON:
-            data_coupon = {'discount': DATA_COUPON.get(coupon).get('value'),
-                           'is_valid': DATA_COUPON.get(coupon).get('is_valid')}
-            return JsonResponse(data_coupon, json_dumps_params={'ensure_ascii': False, 'indent': 4})
+        # По ключу "discount" получают значение скидки в процентах, а по ключу "is_valid" понимают
+        # действителен ли купон (включён и не истёк срок действия)
+        if (data_coupon := get_coupon(coupon)) is not None:
+            return JsonResponse({'discount': data_coupon.value, 'is_valid': data_coupon.is_valid()})
 
         return HttpResponseNotFound("Неверный купон")
 
 
 def delivery_estimate_view(request) -> HttpResponseNotFound | JsonResponse:
     """
-    Расчет стоимости доставки.
+    Расчет стоимости доставки по таблице settings.DELIVERY_PATH (см. store.pricing_rules).
+    Цена уточняется от страны к региону, городу и почтовому индексу.
 
-    :param request: Объект запроса.
+    :param request: Объект запроса. Параметры: country, region (необязательный), city, code - почтовый индекс.
     :return: -Словарь JSON с данными по стоимости доставки для JS.
              -Сообщение об ошибке.
     """
-    # База данных по стоимости доставки. Ключ - Страна; Значение словарь с городами и ценами;
-    # Значение с ключом fix_price применяется, если нет города в данной стране
-
-    DATA_PRICE = {
-        "Россия": {
-            "Москва": {"price": 90},
-            "Санкт-Петербург": {"price": 70},
-            "fix_price": 120,
-        },
-    }
     if request.method == "GET":
         data = request.GET
-        country = data.get('country')
-        city = data.get('city')
-        # Реализуйте логику расчёта стоимости доставки, которая выполняет следующее:
-        # Если в базе DATA_PRICE есть и страна (country) и существует город(city), то вернуть
-        # JsonResponse со словарём, {"price": значение стоимости доставки}
-        # Если в базе DATA_PRICE есть страна, но нет города, то вернуть
-        # JsonResponse со словарём, {"price": значение фиксированной стоимости доставки}
-        # Если нет страны, то вернуть HttpResponseNotFound("Неверные данные")
-
-        if country not in DATA_PRICE:
+        price = delivery_price(data.get('country'), data.get('city'), data.get('region'), data.get('code'))
+        if price is None:  # В страну не доставляем
             return HttpResponseNotFound("Неверные данные")
 
-        if city in DATA_PRICE[country]:
-            return JsonResponse({"price": DATA_PRICE[country][city].get("price")})
-
-        return JsonResponse({"price": DATA_PRICE[country].get("fix_price")})
+        return JsonResponse({"price": price})
 
 
 @login_required(login_url='login:login_view')
@@ -256,7 +355,7 @@ def cart_buy_now_view(request, id_product) -> HttpResponseNotFound | HttpRespons
              -Сообщение об ошибке.
     """
     if request.method == "GET":
-        result = add_to_cart(request, id_product)
+        result = add_to_cart(request.user, id_product)
         if result:
             return redirect("store:cart_view")
             # return cart_view(request)
@@ -274,8 +373,60 @@ def cart_remove_view(request, id_product) -> HttpResponseNotFound | HttpResponse
              -Сообщение об ошибке.
     """
     if request.method == "GET":
-        result = remove_from_cart(request, id_product)
+        result = remove_from_cart(request.user, id_product)
         if result:
             return redirect("store:cart_view")
 
         return HttpResponseNotFound("Неудачное удаление из корзины")
+
+
+# Асинхронные версии JSON API для запуска под ASGI (settings.ASYNC_VIEWS). Работа с хранилищем
+# выполняется в потоке через run_storage, цикл событий при этом обслуживает другие запросы.
+
+async def cart_add_async_view(request, id_product: str) -> JsonResponse | HttpResponseRedirect:
+    """
+    Асинхронная версия cart_add_view.
+
+    :param request: Объект запроса.
+    :param id_product: Идентификационный номер продукта в виде строки.
+    :return: Сообщение об успехе или неудаче в JSON или перенаправление на страницу входа.
+    """
+    if request.method == "GET":
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), 'login:login_view')
+
+        result = await run_storage(add_to_cart, user, id_product)
+        if result:
+            return JsonResponse({"answer": "Продукт успешно добавлен в корзину"})
+
+        return JsonResponse({"answer": "Неудачное добавление в корзину"}, status=404)
+
+
+async def cart_del_async_view(request, id_product: str) -> JsonResponse:
+    """
+    Асинхронная версия cart_del_view.
+
+    :param request: Объект запроса.
+    :param id_product: Идентификационный номер продукта в виде строки.
+    :return: Сообщение об успехе или неудаче в JSON.
+    """
+    if request.method == "GET":
+        user = await aget_user(request)
+        result = await run_storage(remove_from_cart, user, id_product)
+        if result:
+            return JsonResponse({"answer": "Продукт успешно удалён из корзины"})
+
+        return JsonResponse({"answer": "Неудачное удаление из корзины"}, status=404)
+
+
+async def products_async_view(request) -> JsonResponse | HttpResponseNotFound:
+    """
+    Асинхронная версия products_view. Ответ берётся из кеша (logic.cache.get_or_set), обращение к которому
+    блокирует поток (SQLite, Redis, ожидание блокировки пересчёта), поэтому products_view выполняется в пуле
+    потоков (sync_to_async с thread_sensitive=False), а цикл событий продолжает обслуживать другие запросы.
+
+    :param request: Объект запроса.
+    :return: См. products_view.
+    """
+    return await sync_to_async(products_view, thread_sensitive=False)(request)
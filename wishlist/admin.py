@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import WishlistItem
+
+
+@admin.register(WishlistItem)
+class WishlistItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'product', 'added_at')
+    list_select_related = ('user', 'product')
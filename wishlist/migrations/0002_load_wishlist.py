@@ -0,0 +1,43 @@
+import json
+import os
+
+from django.conf import settings
+from django.db import migrations
+
+
+def load_wishlist(apps, schema_editor):
+    """Перенос избранного пользователей из wishlist.json в базу данных."""
+    wishlist_path = os.path.join(settings.BASE_DIR, 'wishlist.json')
+    if not os.path.exists(wishlist_path):
+        return
+
+    Product = apps.get_model('store', 'Product')
+    WishlistItem = apps.get_model('wishlist', 'WishlistItem')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    with open(wishlist_path, encoding='utf-8') as f:
+        wishlist_users = json.load(f)
+    users = User.objects.in_bulk(wishlist_users.keys(), field_name='username')
+    product_ids = set(Product.objects.values_list('id', flat=True))
+    WishlistItem.objects.bulk_create(
+        [WishlistItem(user=users[username], product_id=int(id_product))
+         for username, wishlist in wishlist_users.items() if username in users
+         for id_product in wishlist['products'] if int(id_product) in product_ids],
+        ignore_conflicts=True,
+    )
+
+
+def unload_wishlist(apps, schema_editor):
+    apps.get_model('wishlist', 'WishlistItem').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wishlist', '0001_initial'),
+        ('store', '0002_load_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(load_wishlist, unload_wishlist),
+    ]
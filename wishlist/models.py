@@ -1,3 +1,20 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+from store.models import Product
+
+
+class WishlistItem(models.Model):
+    """Товар в избранном пользователя."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='wishlist_items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['added_at', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_wishlist_item'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.product}'
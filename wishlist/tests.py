@@ -1,3 +1,56 @@
-from django.test import TestCase
+from django.test import override_settings
 
-# Create your tests here.
+from store.tests import StorageTestCase
+
+
+class WishlistTests(StorageTestCase):
+
+    def wishlist(self) -> list:
+        return self.client.get('/wishlist/api/').json()['products']
+
+    def test_add_and_remove(self):
+        self.assertEqual(self.client.get('/wishlist/api/add/1').status_code, 200)
+        self.client.get('/wishlist/api/add/3')
+        self.client.get('/wishlist/api/add/1')  # Повторное добавление не дублирует товар
+        self.assertEqual(self.wishlist(), ['1', '3'])
+        self.assertEqual(self.client.get('/wishlist/api/del/1').status_code, 200)
+        self.assertEqual(self.wishlist(), ['3'])
+        self.assertEqual(self.client.get('/wishlist/api/del/1').status_code, 404)
+
+    def test_insertion_order(self):
+        for id_product in ('5', '2', '9', '2', '5'):
+            self.client.get(f'/wishlist/api/add/{id_product}')
+        self.client.get('/wishlist/api/del/2')
+        self.client.get('/wishlist/api/add/2')
+        self.assertEqual(self.wishlist(), ['5', '9', '2'])
+
+    def test_unknown_product(self):
+        self.assertEqual(self.client.get('/wishlist/api/add/100500').status_code, 404)
+        self.assertEqual(self.wishlist(), [])
+
+    def test_page(self):
+        self.client.get('/wishlist/api/add/2')
+        response = self.client.get('/wishlist/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page'].paginator.count, 1)
+
+    @override_settings(USER_LIST_PAGE_SIZE=2)
+    def test_pages_and_sorting(self):
+        for id_product in ('2', '1', '3'):
+            self.client.get(f'/wishlist/api/add/{id_product}')
+        self.assertEqual(self.page_names('/wishlist/'), ['Клубника', 'Болгарский перец'])
+        self.assertEqual(self.page_names('/wishlist/', page=2), ['Стручковая фасоль'])
+        self.assertEqual(self.page_names('/wishlist/', reverse='true'), ['Стручковая фасоль', 'Болгарский перец'])
+        self.assertEqual(self.page_names('/wishlist/', sort='name'), ['Болгарский перец', 'Клубника'])
+        self.assertEqual(self.page_names('/wishlist/', sort='price', reverse='true'),
+                         ['Клубника', 'Стручковая фасоль'])
+
+    def test_anonymous_remove(self):
+        self.client.logout()
+        self.assertNotEqual(self.client.get('/wishlist/api/del/1').status_code, 500)
+        self.assertNotEqual(self.client.get('/wishlist/api/remove/1').status_code, 500)
+
+
+@override_settings(STORE_STORAGE='db')
+class WishlistDatabaseTests(WishlistTests):
+    """Те же сценарии с избранным в базе данных."""
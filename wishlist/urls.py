@@ -3,16 +3,27 @@ URL configuration for app wishlist.
 
 """
 
+from django.conf import settings
 from django.urls import path
-from wishlist.views import (wishlist_view,
-                            wishlist_add_json,
-                            wishlist_del_json,
-                            wishlist_json,
-                            wishlist_remove_view)
+
+from logic.lazy import lazy_view
+
+# Модуль wishlist.views импортируется при первом запросе, см. logic.lazy
+wishlist_view = lazy_view('wishlist.views.wishlist_view')
+wishlist_add_json = lazy_view('wishlist.views.wishlist_add_json')
+wishlist_del_json = lazy_view('wishlist.views.wishlist_del_json')
+wishlist_json = lazy_view('wishlist.views.wishlist_json')
+wishlist_remove_view = lazy_view('wishlist.views.wishlist_remove_view')
 
 
 app_name = 'wishlist'
 
+if settings.ASYNC_VIEWS:  # Запуск под ASGI: API без блокировки цикла событий
+    wishlist_add_json = lazy_view('wishlist.views.wishlist_add_json_async', is_async=True)
+    wishlist_del_json = lazy_view('wishlist.views.wishlist_del_json_async', is_async=True)
+    wishlist_json = lazy_view('wishlist.views.wishlist_json_async', is_async=True)
+    wishlist_remove_view = lazy_view('wishlist.views.wishlist_remove_async_view', is_async=True)
+
 urlpatterns = [
     path('', wishlist_view, name='wishlist_view'),
     path('api/add/<str:id_product>', wishlist_add_json, name='wishlist_add_json'),
@@ -1,31 +1,43 @@
 from django.shortcuts import render, redirect
-from django.contrib.auth import get_user
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseNotFound, JsonResponse, HttpResponse, HttpResponseRedirect
-from store.models import DATABASE
-from logic.services import (view_in_wishlist,
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseNotFound, HttpResponse, HttpResponseRedirect
+from store.catalog import get_catalog
+from logic.http import JsonResponse
+from logic.services import (view_user_wishlist,
                             add_to_wishlist,
-                            remove_from_wishlist)
+                            remove_from_wishlist,
+                            use_db,
+                            wishlist_products_db,
+                            list_params,
+                            page_of_ids,
+                            aget_user,
+                            run_storage)
 
 
 @login_required(login_url='login:login_view')
 def wishlist_view(request) -> HttpResponse:
     """
     Загрузка шаблона страницы избранного с товарами зарегистрированного пользователя.
+    Товары выводятся постранично (settings.USER_LIST_PAGE_SIZE).
 
-    :param request: Объект запроса.
+    :param request: Объект запроса. Параметры: page - номер страницы; sort - added, price или name;
+                    reverse=true - по убыванию.
     :return: HttpResponse, как результат функции render с шаблоном избранного с товарами пользователя в контексте.
     """
     if request.method == 'GET':
-        current_user = get_user(request).username
-        user_wishlist = view_in_wishlist(request).get(current_user)
-
-        products = []
-        for product_id in user_wishlist['products']:
-            product = DATABASE[product_id]
-            products.append(product)
+        current_user = request.user.username
+        # Товары материализуются только для видимой страницы
+        page_number, sort, reverse = list_params(request.GET)
+        if use_db():
+            page, products = wishlist_products_db(current_user, page_number, sort, reverse)
+        else:
+            user_wishlist = view_user_wishlist(current_user) or {'products': []}
+            catalog = get_catalog()
+            page = page_of_ids(user_wishlist['products'], page_number, sort, reverse, catalog)
+            products = catalog.get_many(page)
         return render(request, 'wishlist/wishlist.html',
-                      context={'products': products})
+                      context={'products': products, 'page': page, 'sort': sort, 'reverse': reverse})
 
 
 def wishlist_remove_view(request, id_product: str) -> HttpResponseNotFound | HttpResponseRedirect:
@@ -38,7 +50,7 @@ def wishlist_remove_view(request, id_product: str) -> HttpResponseNotFound | Htt
              -Сообщение об ошибке.
     """
     if request.method == "GET":
-        result = remove_from_wishlist(request, id_product)
+        result = remove_from_wishlist(request.user, id_product)
         if result:
             return redirect("wishlist:wishlist_view")
 
@@ -55,14 +67,11 @@ def wishlist_add_json(request, id_product: str) -> JsonResponse:
     :return: Сообщение об успехе или неудаче в JSON.
     """
     if request.method == "GET":
-        result = add_to_wishlist(request, id_product)  # добавляет продукт в избранное
+        result = add_to_wishlist(request.user, id_product)  # добавляет продукт в избранное
         if result:
-            return JsonResponse({'answer': "Продукт успешно добавлен в избранное"},
-                                json_dumps_params={'ensure_ascii': False})
+            return JsonResponse({'answer': "Продукт успешно добавлен в избранное"})
 
-        return JsonResponse({'answer': "Неудачное добавление в избранное"},
-                            status=404,
-                            json_dumps_params={'ensure_ascii': False})
+        return JsonResponse({'answer': "Неудачное добавление в избранное"}, status=404)
 
 
 def wishlist_del_json(request, id_product: str) -> JsonResponse:
@@ -74,14 +83,11 @@ def wishlist_del_json(request, id_product: str) -> JsonResponse:
     return: Сообщение об успехе или неудаче в JSON.
     """
     if request.method == "GET":
-        result = remove_from_wishlist(request, id_product)  # удаляет продукт из избранного
+        result = remove_from_wishlist(request.user, id_product)  # удаляет продукт из избранного
         if result:
-            return JsonResponse({'answer': "Продукт успешно удалён из избранного"},
-                                json_dumps_params={'ensure_ascii': False})
+            return JsonResponse({'answer': "Продукт успешно удалён из избранного"})
 
-        return JsonResponse({'answer': "Неудачное удаление из избранного"},
-                            status=404,
-                            json_dumps_params={'ensure_ascii': False})
+        return JsonResponse({'answer': "Неудачное удаление из избранного"}, status=404)
 
 
 def wishlist_json(request) -> JsonResponse:
@@ -93,11 +99,84 @@ def wishlist_json(request) -> JsonResponse:
             -Сообщение об ошибке в JSON.
     """
     if request.method == "GET":
-        if current_user := get_user(request).username:
-            data = view_in_wishlist(request)[current_user]  # данные о списке товаров в избранном у пользователя
+        if current_user := request.user.username:
+            data = view_user_wishlist(current_user)  # данные о списке товаров в избранном у пользователя
+            if data:
+                return JsonResponse(data)
+
+        return JsonResponse({'answer': "Пользователь не авторизирован"}, status=404)
+
+
+# Асинхронные версии API избранного для запуска под ASGI (settings.ASYNC_VIEWS).
+
+async def wishlist_remove_async_view(request, id_product: str) -> HttpResponseNotFound | HttpResponseRedirect:
+    """
+    Асинхронная версия wishlist_remove_view.
+
+    :param request: Объект запроса.
+    :param id_product: Идентификационный номер продукта в виде строки.
+    :return: -Редирект на страницу Избранное.
+             -Сообщение об ошибке.
+    """
+    if request.method == "GET":
+        user = await aget_user(request)
+        result = await run_storage(remove_from_wishlist, user, id_product)
+        if result:
+            return redirect("wishlist:wishlist_view")
+
+        return HttpResponseNotFound("Неудачное удаление из избранного")
+
+
+async def wishlist_add_json_async(request, id_product: str) -> JsonResponse | HttpResponseRedirect:
+    """
+    Асинхронная версия wishlist_add_json.
+
+    :param request: Объект запроса.
+    :param id_product: Идентификационный номер продукта в виде строки.
+    :return: Сообщение об успехе или неудаче в JSON или перенаправление на страницу входа.
+    """
+    if request.method == "GET":
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), 'login:login_view')
+
+        result = await run_storage(add_to_wishlist, user, id_product)
+        if result:
+            return JsonResponse({'answer': "Продукт успешно добавлен в избранное"})
+
+        return JsonResponse({'answer': "Неудачное добавление в избранное"}, status=404)
+
+
+async def wishlist_del_json_async(request, id_product: str) -> JsonResponse:
+    """
+    Асинхронная версия wishlist_del_json.
+
+    :param request: Объект запроса.
+    :param id_product: Идентификационный номер продукта в виде строки.
+    return: Сообщение об успехе или неудаче в JSON.
+    """
+    if request.method == "GET":
+        user = await aget_user(request)
+        result = await run_storage(remove_from_wishlist, user, id_product)
+        if result:
+            return JsonResponse({'answer': "Продукт успешно удалён из избранного"})
+
+        return JsonResponse({'answer': "Неудачное удаление из избранного"}, status=404)
+
+
+async def wishlist_json_async(request) -> JsonResponse:
+    """
+    Асинхронная версия wishlist_json.
+
+    :param request: Объект запроса.
+    return: -Список продуктов в избранном пользователя в JSON.
+            -Сообщение об ошибке в JSON.
+    """
+    if request.method == "GET":
+        user = await aget_user(request)
+        if current_user := user.username:
+            data = await run_storage(view_user_wishlist, current_user)
             if data:
-                return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+                return JsonResponse(data)
 
-        return JsonResponse({'answer': "Пользователь не авторизирован"},
-                            status=404,
-                            json_dumps_params={'ensure_ascii': False})
+        return JsonResponse({'answer': "Пользователь не авторизирован"}, status=404)